@@ -0,0 +1,207 @@
+"""
+Benchmarks of ZipFly streaming paths.
+
+Measures throughput (MB/s of file data) and peak RSS for stream() vs async_stream(), NO_COMPRESSION vs DEFLATE,
+different file counts, file sizes and source chunk sizes, with synthetic GenFile data and LocalFiles in a temp dir.
+Every case runs in a separate process, so peak RSS of one case doesn't leak into the next one.
+
+Usage:
+    python benchmarks/bench.py                                  # quick profile, prints results
+    python benchmarks/bench.py --profile full -o results.json   # everything, up to 1M files and GB sized files
+    python benchmarks/bench.py -o new.json --baseline old.json  # compare with previous results, exits with 1 on regressions
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+KiB = 1024
+MiB = 1024 * KiB
+GiB = 1024 * MiB
+
+PROFILES = {
+    "quick": {
+        "modes": ["sync", "async"],
+        "methods": [0, 8],
+        "sources": ["gen", "local"],
+        # (file count, file size)
+        "layouts": [(1, 64 * MiB), (100, 256 * KiB), (10_000, 100)],
+        "chunk_sizes": [64 * KiB],
+    },
+    "full": {
+        "modes": ["sync", "async"],
+        "methods": [0, 8],
+        "sources": ["gen", "local"],
+        "layouts": [(1, 1 * GiB), (1, 4 * GiB), (100, 10 * MiB), (10_000, 10 * KiB), (100_000, 1 * KiB), (1_000_000, 100)],
+        "chunk_sizes": [16 * KiB, 64 * KiB, 1 * MiB],
+    },
+}
+
+# LocalFile cases write all files to disk first, so the biggest ones are skipped
+MAX_LOCAL_FILES = 100_000
+MAX_LOCAL_BYTES = 8 * GiB
+
+
+def make_block(size: int) -> bytes:
+    """
+    Half random, half repeating data, so deflate has something to do, but not too easy.
+    """
+    half = size // 2
+    return os.urandom(half) + (b"ZipFly benchmark " * (size // 17 + 1))[:size - half]
+
+
+def gen_data(block: bytes, size: int):
+    while size > 0:
+        yield block[:size] if size < len(block) else block
+        size -= len(block)
+
+
+async def async_gen_data(block: bytes, size: int):
+    for chunk in gen_data(block, size):
+        yield chunk
+
+
+def build_files(case: dict, directory: str):
+    from zipFly import GenFile, LocalFile
+
+    block = make_block(case["chunk_size"])
+    if case["source"] == "local":
+        return [LocalFile(os.path.join(directory, f"{i}.bin"), name=f"{i}.bin", compression_method=case["method"],
+                          chunk_size=case["chunk_size"]) for i in range(case["file_count"])]
+
+    make_data = async_gen_data if case["mode"] == "async" else gen_data
+    return [GenFile(name=f"{i}.bin", generator=make_data(block, case["file_size"]), compression_method=case["method"],
+                    size=case["file_size"], modification_time=0) for i in range(case["file_count"])]
+
+
+def write_local_files(case: dict, directory: str) -> None:
+    block = make_block(case["chunk_size"])
+    for i in range(case["file_count"]):
+        with open(os.path.join(directory, f"{i}.bin"), "wb") as f:
+            for chunk in gen_data(block, case["file_size"]):
+                f.write(chunk)
+
+
+def run_case(case: dict) -> dict:
+    """
+    Runs one case in this process.
+    """
+    from zipFly import ZipFly
+
+    directory = tempfile.mkdtemp(prefix="zipfly-bench-")
+    try:
+        if case["source"] == "local":
+            write_local_files(case, directory)
+
+        files = build_files(case, directory)
+        zip_fly = ZipFly(files)
+        archive_size = 0
+        chunks = 0
+
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if case["mode"] == "sync":
+            for chunk in zip_fly.stream():
+                archive_size += len(chunk)
+                chunks += 1
+        else:
+            async def consume():
+                nonlocal archive_size, chunks
+                async for chunk in zip_fly.async_stream():
+                    archive_size += len(chunk)
+                    chunks += 1
+            asyncio.run(consume())
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    data_size = case["file_count"] * case["file_size"]
+    # ru_maxrss is in KiB on linux, in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else KiB)
+    return dict(case, seconds=seconds, cpu_seconds=cpu_seconds, mb_per_s=data_size / MiB / seconds if seconds else 0,
+                archive_size=archive_size, chunks=chunks, peak_rss=peak_rss)
+
+
+def case_name(case: dict) -> str:
+    return f"{case['mode']}-m{case['method']}-{case['source']}-{case['file_count']}x{case['file_size']}-c{case['chunk_size']}"
+
+
+def make_cases(profile: dict):
+    for mode, method, source, (file_count, file_size), chunk_size in itertools.product(
+            profile["modes"], profile["methods"], profile["sources"], profile["layouts"], profile["chunk_sizes"]):
+        if source == "local" and (file_count > MAX_LOCAL_FILES or file_count * file_size > MAX_LOCAL_BYTES):
+            continue
+        yield {"mode": mode, "method": method, "source": source, "file_count": file_count, "file_size": file_size, "chunk_size": chunk_size}
+
+
+def compare(results: list, baseline: dict, threshold: float) -> bool:
+    """
+    Prints throughput and memory changes against baseline, returns False if anything got worse than threshold.
+    """
+    old_results = {case_name(result): result for result in baseline["results"]}
+    ok = True
+    for result in results:
+        old = old_results.get(case_name(result))
+        if old is None:
+            continue
+        speed = result["mb_per_s"] / old["mb_per_s"] - 1 if old["mb_per_s"] else 0
+        memory = result["peak_rss"] / old["peak_rss"] - 1 if old["peak_rss"] else 0
+        regressed = speed < -threshold or memory > threshold
+        ok = ok and not regressed
+        print(f"{'REGRESSION ' if regressed else ''}{case_name(result)}: speed {speed:+.1%}, peak rss {memory:+.1%}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=PROFILES, default="quick")
+    parser.add_argument("--filter", default="", help="run only cases whose name contains this")
+    parser.add_argument("-o", "--output", help="save results as json")
+    parser.add_argument("--baseline", help="json results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown/memory growth (default 0.1)")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    results = []
+    for case in make_cases(PROFILES[args.profile]):
+        if args.filter not in case_name(case):
+            continue
+        output = subprocess.run([sys.executable, __file__, "--run-case", json.dumps(case)], check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{case_name(case)}: {result['mb_per_s']:.1f} MB/s, {result['seconds']:.2f} s, peak rss {result['peak_rss'] / MiB:.1f} MiB")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.time(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            return 0 if compare(results, json.load(f), args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import asyncio
+from collections import deque
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Callable, Tuple
+
+from zipFly.BaseFile import BaseFile
+from zipFly.CompressionPolicy import CompressionPolicy
+from zipFly.ParallelCompressor import _FileBuffer
+
+
+class AsyncPrefetcher:
+    """
+    Async version of ParallelCompressor. Starts pulling data of the next `lookahead` files while the current one is streamed,
+    so with slow sources (remote storage etc.) their first byte latencies overlap instead of adding up.
+
+    At most `lookahead` + 1 sources are open at once, and data waiting to be streamed is capped at `max_buffer_size` bytes.
+    A file with an empty buffer can always put one chunk, so the file that is currently streamed never waits for the ones after it.
+    """
+
+    def __init__(self, files: AsyncIterable[BaseFile], lookahead: int, max_buffer_size: int, compression_policy: CompressionPolicy,
+                 process: Callable[[BaseFile], AsyncIterator[bytes]] = None):
+        if lookahead < 1:
+            raise ValueError("lookahead must be at least 1.")
+        self.files = files
+        self.lookahead = lookahead
+        self.max_buffer_size = max_buffer_size
+        self.compression_policy = compression_policy
+        self.process = process or BaseFile.async_generate_processed_file_data  # gives processed data of a file
+
+        self._condition = asyncio.Condition()
+        self._buffered = 0
+        self._closed = False
+
+    async def _fetch(self, file: BaseFile, buffer: _FileBuffer) -> None:
+        generator = self.process(file)
+        try:
+            await file.async_choose_compression_method(self.compression_policy)
+            async with self._condition:
+                buffer.resolved = True
+                self._condition.notify_all()
+
+            async for chunk in generator:
+                async with self._condition:
+                    await self._condition.wait_for(
+                        lambda: self._closed or not buffer.size or self._buffered + len(chunk) <= self.max_buffer_size
+                    )
+                    if self._closed:
+                        return
+                    buffer.chunks.append(chunk)
+                    buffer.size += len(chunk)
+                    self._buffered += len(chunk)
+                    self._condition.notify_all()
+        except BaseException as e:
+            # the file being streamed raises it too, cancellation of the task itself still cancels it
+            buffer.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            await generator.aclose()
+            async with self._condition:
+                buffer.done = True
+                self._condition.notify_all()
+
+    async def _drain(self, buffer: _FileBuffer) -> AsyncGenerator[bytes, None]:
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: buffer.chunks or buffer.done)
+                if buffer.chunks:
+                    chunk = buffer.chunks.popleft()
+                    buffer.size -= len(chunk)
+                    self._buffered -= len(chunk)
+                    self._condition.notify_all()
+                elif buffer.error is not None:
+                    raise buffer.error
+                else:
+                    return
+            yield chunk
+
+    async def stream(self) -> AsyncGenerator[Tuple[BaseFile, AsyncIterator[bytes]], None]:
+        """
+        Yields (file, processed data) pairs in the order of `files`. Processed data has to be
+        consumed fully before moving to the next file, after that file's crc and sizes are final.
+        """
+        files = self.files.__aiter__()
+        files_left = True
+        buffers = deque()
+        tasks = []
+        try:
+            while buffers or files_left:
+                # keep `lookahead` + 1 files in flight
+                while files_left and len(buffers) <= self.lookahead:
+                    try:
+                        file = await files.__anext__()
+                    except StopAsyncIteration:
+                        files_left = False
+                        break
+                    buffer = _FileBuffer()
+                    tasks.append(asyncio.ensure_future(self._fetch(file, buffer)))
+                    buffers.append((file, buffer))
+                if not buffers:
+                    break
+
+                file, buffer = buffers.popleft()
+                # local file header needs the compression method
+                async with self._condition:
+                    await self._condition.wait_for(lambda: buffer.resolved or buffer.done)
+                yield file, self._drain(buffer)
+                tasks = [task for task in tasks if not task.done()]
+        finally:
+            async with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,63 +1,231 @@
+import itertools
+import time
 from abc import ABC, abstractmethod
 from typing import Generator, AsyncGenerator
 
 from zipFly import consts
+from zipFly.Codecs import get_codec
 from zipFly.Compressor import Compressor
 
 
 class BaseFile(ABC):
-    def __init__(self, compression_method: int):
+    def __init__(self, compression_method: int, compression_workers: int = None, compression_level: int = None):
         self.original_size = 0
         self.compressed_size = 0
         self.offset = 0  # Offset to local file header
         self.crc = 0
-        self.flags = 0b00001000  # flag about using data descriptor is always on
+        self.flags = consts.DATA_DESCRIPTOR_FLAG  # flag about using data descriptor is on, unless crc and sizes are known up front
         self.compression_method = compression_method or consts.NO_COMPRESSION
+        self.compression_auto = self.compression_method == consts.COMPRESSION_AUTO
+        if not self.compression_auto:
+            get_codec(self.compression_method)  # fail now for unknown methods, not in the middle of a stream
+        self.compression_level = compression_level  # None means the default level of the method
+        self._held_data = None  # data read to pick the compression method, (held chunks, rest of data)
+        self._encoded_name = None  # (name, encoded name), so the name isn't encoded on every access
+
+        # crc and compressed size known before streaming (from MetadataCache), crc doesn't have to be computed then
+        self.known_crc = None
+        self.known_compressed_size = None
+        self.compression_workers = compression_workers  # deflate this file on several threads
+        self.stats = None  # EntryStats of the current stream, only set when ZipFly has an observer
+        self.zip64 = False  # local file header has zip64 extra field (and data descriptor is zip64), decided before the data is read
+        self.deterministic = False  # set by ZipFly in deterministic mode, timestamps are in UTC then
 
     def __str__(self):
         return f"FILE[{self.name}]"
 
-    def generate_processed_file_data(self) -> Generator[bytes, None, None]:
+    def generate_processed_file_data(self, lane=None) -> Generator[bytes, None, None]:
+        """
+        Generates compressed file data. With a `lane` of CompressionScheduler it's compressed on the scheduler's workers.
+        """
         compressor = Compressor(self)
+        data = self._take_file_data()
+        if self.stats is not None:
+            data = self.stats.time_source(data)
+            self.stats.time_compressor(compressor)
+
+        try:
+            if lane is not None:
+                yield from lane.process(compressor, data)
+            else:
+                for chunk in data:
+                    chunk = compressor.process(chunk)
+                    if len(chunk) > 0:
+                        yield chunk
+
+                # finish the compressed stream only once, after all the data
+                chunk = compressor.tail()
+                if len(chunk) > 0:
+                    yield chunk
+        finally:
+            compressor.close()
 
+        if self.known_crc is not None:
+            self.crc = self.known_crc
+
+    async def async_generate_processed_file_data(self, lane=None) -> AsyncGenerator[bytes, None]:
         """
-        Generates compressed file data
+        Generates compressed file data. With a `lane` of CompressionScheduler it's compressed on the scheduler's workers.
         """
-        for chunk in self._generate_file_data():
-            chunk = compressor.process(chunk)
-            if len(chunk) > 0:
-                yield chunk
-            chunk = compressor.tail()
-            if len(chunk) > 0:
-                yield chunk
-
-    async def async_generate_processed_file_data(self) -> AsyncGenerator[bytes, None]:
         compressor = Compressor(self)
+        data = self._async_take_file_data()
+        if self.stats is not None:
+            data = self.stats.async_time_source(data)
+            self.stats.time_compressor(compressor)
+
+        try:
+            if lane is not None:
+                async for chunk in lane.async_process(compressor, data):
+                    yield chunk
+            else:
+                async for chunk in data:
+                    chunk = compressor.process(chunk)
+                    if len(chunk) > 0:
+                        yield chunk
+
+                # finish the compressed stream only once, after all the data
+                chunk = compressor.tail()
+                if len(chunk) > 0:
+                    yield chunk
+        finally:
+            compressor.close()
+
+        if self.known_crc is not None:
+            self.crc = self.known_crc
 
+    def choose_compression_method(self, policy) -> None:
         """
-        Generates compressed file data
+        Resolves COMPRESSION_AUTO into a real method, has to be done before making local file header.
+        If the name doesn't decide it, the first block of data is read and held back for trial compression.
         """
-        async for chunk in self._async_generate_file_data():
-            chunk = compressor.process(chunk)
-            if len(chunk) > 0:
-                yield chunk
-            chunk = compressor.tail()
-            if len(chunk) > 0:
+        if self.compression_method != consts.COMPRESSION_AUTO:
+            return
+
+        method = policy.choose_by_name(self.name)
+        if method is None:
+            data = self._generate_file_data()
+            held = []
+            held_size = 0
+            for chunk in data:
+                held.append(chunk)
+                held_size += len(chunk)
+                if held_size >= policy.sample_size:
+                    break
+            method = policy.choose_by_sample(b"".join(held)[:policy.sample_size])
+            self._held_data = (held, data)
+        self.compression_method = method
+
+    async def async_choose_compression_method(self, policy) -> None:
+        """
+        Async version of choose_compression_method
+        """
+        if self.compression_method != consts.COMPRESSION_AUTO:
+            return
+
+        method = policy.choose_by_name(self.name)
+        if method is None:
+            data = self._async_generate_file_data()
+            held = []
+            held_size = 0
+            async for chunk in data:
+                held.append(chunk)
+                held_size += len(chunk)
+                if held_size >= policy.sample_size:
+                    break
+            method = policy.choose_by_sample(b"".join(held)[:policy.sample_size])
+            self._held_data = (held, data)
+        self.compression_method = method
+
+    def _take_file_data(self) -> Generator[bytes, None, None]:
+        if self._held_data is None:
+            return self._generate_file_data()
+        held, data = self._held_data
+        self._held_data = None
+        return itertools.chain(held, data)
+
+    def _drop_held_data(self) -> None:
+        """
+        For paths that read the file on their own (os.sendfile), closes the source that was opened to pick the method.
+        """
+        if self._held_data is not None:
+            _, data = self._held_data
+            self._held_data = None
+            data.close()
+
+    async def _async_take_file_data(self) -> AsyncGenerator[bytes, None]:
+        if self._held_data is None:
+            async for chunk in self._async_generate_file_data():
                 yield chunk
+            return
+
+        held, data = self._held_data
+        self._held_data = None
+        for chunk in held:
+            yield chunk
+        async for chunk in data:
+            yield chunk
+
+    @property
+    def uses_data_descriptor(self) -> bool:
+        return bool(self.flags & consts.DATA_DESCRIPTOR_FLAG)
+
+    def metadata_key(self):
+        """
+        Key identifying this exact file content in MetadataCache, or None if it can't be identified.
+        """
+        return None
+
+    def set_known_metadata(self, crc: int, compressed_size: int) -> None:
+        """
+        Sets crc and compressed size known before streaming. If they fit in local file header, data descriptor is dropped.
+        """
+        self.known_crc = crc
+        self.known_compressed_size = compressed_size
+        if self.size < 0xFFFFFFFF and compressed_size < 0xFFFFFFFF:
+            self.flags &= ~consts.DATA_DESCRIPTOR_FLAG
+
+    def get_compression_level(self) -> int:
+        if self.compression_level is not None:
+            return self.compression_level
+        return get_codec(self.compression_method).default_level
+
+    def get_version_needed(self, zip64: bool = True) -> int:
+        # zip64 structures need at least 4.5
+        version = get_codec(self.compression_method).version_needed
+        return max(consts.ZIP64_VERSION, version) if zip64 else version
+
+    def _get_dos_time(self) -> time.struct_time:
+        # zip keeps local time, which differs between servers, deterministic archives use UTC
+        t = time.gmtime(self.modification_time) if self.deterministic else time.localtime(self.modification_time)
+        if t.tm_year < 1980:  # DOS dates start there
+            t = time.gmtime(consts.DETERMINISTIC_MODIFICATION_TIME)
+        return t
 
     def get_mod_time(self) -> int:
-        return int(self.modification_time) & 0xFFFF
+        # Extract hours, minutes, and seconds from the modification time
+        t = self._get_dos_time()
+        return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)) & 0xFFFF
 
     def get_mod_date(self) -> int:
-        return int(self.modification_time / 86400 + 365 * 20) & 0xFFFF
+        # Extract year, month, and day from the modification time
+        t = self._get_dos_time()
+        year = t.tm_year - 1980  # ZIP format years start from 1980
+        return ((year << 9) | (t.tm_mon << 5) | t.tm_mday) & 0xFFFF
 
     @property
     def file_path_bytes(self) -> bytes:
+        name = self.name
+        if self._encoded_name is not None and self._encoded_name[0] == name:
+            return self._encoded_name[1]
+
         try:
-            return self.name.encode("ascii")
+            encoded = name.encode("ascii")
+            self.flags &= ~consts.UTF8_FLAG
         except UnicodeError:
             self.flags |= consts.UTF8_FLAG
-            return self.name.encode("utf-8")
+            encoded = name.encode("utf-8")
+        self._encoded_name = (name, encoded)
+        return encoded
 
     @abstractmethod
     def _generate_file_data(self) -> Generator[bytes, None, None]:
@@ -67,6 +235,37 @@ class BaseFile(ABC):
     async def _async_generate_file_data(self) -> AsyncGenerator[bytes, None]:
         raise NotImplementedError
 
+    def _generate_file_data_from(self, start: int) -> Generator[bytes, None, None]:
+        """
+        Generates raw file data starting from byte `start`.
+        By default it just skips over the data before `start`, sources that can seek should override it.
+        """
+        position = 0
+        for chunk in self._generate_file_data():
+            if position + len(chunk) <= start:
+                position += len(chunk)
+                continue
+            if position < start:
+                chunk = chunk[start - position:]
+                position = start
+            position += len(chunk)
+            yield chunk
+
+    async def _async_generate_file_data_from(self, start: int) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of _generate_file_data_from
+        """
+        position = 0
+        async for chunk in self._async_generate_file_data():
+            if position + len(chunk) <= start:
+                position += len(chunk)
+                continue
+            if position < start:
+                chunk = chunk[start - position:]
+                position = start
+            position += len(chunk)
+            yield chunk
+
     @abstractmethod
     def set_file_name(self, new_name: str) -> None:
         raise NotImplementedError
@@ -0,0 +1,132 @@
+import os
+from typing import BinaryIO
+
+from zipFly import consts
+from zipFly.EntryTable import EntryTable
+
+# end of cdir record with the longest comment, and zip64 locator in front of it
+MAX_TAIL_SIZE = consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.size + 0xFFFF + consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT.size
+
+
+class CentralDirectory:
+    """
+    Central directory of an existing archive: its raw bytes, where it is, and its entries parsed into an EntryTable.
+    Zip64 end records and zip64 extra fields are understood, split archives and archives with data in front
+    of the first entry (self extracting ones) aren't.
+
+    `end` is where the central directory ends and end records start, `size` is the size of the whole file.
+    """
+
+    def __init__(self, data: bytes, offset: int, entries: EntryTable, end: int, size: int):
+        self.data = data
+        self.offset = offset
+        self.entries = entries
+        self.end = end
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"CentralDirectory(entries={len(self.entries)}, offset={self.offset}, size={len(self.data)})"
+
+    @classmethod
+    def read(cls, fileobj: BinaryIO) -> "CentralDirectory":
+        file_size = fileobj.seek(0, os.SEEK_END)
+        tail_start = max(0, file_size - MAX_TAIL_SIZE)
+        fileobj.seek(tail_start)
+        tail = fileobj.read()
+
+        # the last signature followed by exactly its comment, a comment can contain the signature too
+        eocd_struct = consts.END_OF_CENTRAL_DIR_RECORD_STRUCT
+        position = len(tail)
+        while True:
+            position = tail.rfind(consts.END_OF_CENTRAL_DIR_RECORD_SIGNATURE, 0, position)
+            if position < 0:
+                raise ValueError("Not a zip archive, end of central directory record is missing.")
+            if position + eocd_struct.size <= len(tail):
+                eocd = consts.END_OF_CENTRAL_DIR_RECORD_TUPLE(*eocd_struct.unpack_from(tail, position))
+                if position + eocd_struct.size + eocd.comment_length == len(tail):
+                    break
+
+        disk, cdir_disk = eocd.number_of_this_disk, eocd.number_of_disk_with_start_central_dir
+        count, cdir_size, cdir_offset = eocd.total_entries_total, eocd.central_directory_size, eocd.offset_of_central_directory
+        end = tail_start + position
+
+        locator_struct = consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT
+        locator_position = position - locator_struct.size
+        if locator_position >= 0 and tail.startswith(consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_SIGNATURE, locator_position):
+            locator = consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_TUPLE(*locator_struct.unpack_from(tail, locator_position))
+            if locator.total_disks != 1:
+                raise ValueError("Split archives aren't supported.")
+            record_struct = consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_STRUCT
+            fileobj.seek(locator.zip64_end_offset)
+            data = fileobj.read(record_struct.size)
+            if len(data) != record_struct.size or not data.startswith(consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_SIGNATURE):
+                raise ValueError("Zip64 end of central directory record is missing.")
+            record = consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_TUPLE(*record_struct.unpack(data))
+            disk, cdir_disk = record.number_of_this_disk, record.cd_start
+            count, cdir_size, cdir_offset = record.cd_entries_total, record.cd_size, record.cd_offset
+            end = locator.zip64_end_offset
+
+        if disk != 0 or cdir_disk != 0:
+            raise ValueError("Split archives aren't supported.")
+        if cdir_offset + cdir_size != end:
+            raise ValueError("Central directory isn't right before end records, "
+                             "archives with data in front of them (or corrupted ones) aren't supported.")
+
+        fileobj.seek(cdir_offset)
+        data = fileobj.read(cdir_size)
+        if len(data) != cdir_size:
+            raise ValueError("Central directory is truncated.")
+        entries = cls.parse(data)
+        if len(entries) != count:
+            raise ValueError(f"End records say there are {count} entries, but central directory has {len(entries)}.")
+        return cls(data, cdir_offset, entries, end, file_size)
+
+    @staticmethod
+    def parse(data: bytes) -> EntryTable:
+        """
+        Central directory file headers to an EntryTable. Sizes and offsets that don't fit in 4 bytes
+        are taken from zip64 extra fields, comments and other extra fields are skipped.
+        """
+        header_struct = consts.CENTRAL_DIR_FILE_HEADER_STRUCT
+        entries = EntryTable()
+        view = memoryview(data)
+        position = 0
+        while position < len(view):
+            if position + header_struct.size > len(view):
+                raise ValueError("Central directory is truncated.")
+            (signature, _, version_needed, flags, method, mod_time, mod_date, crc, compressed_size, uncompressed_size,
+             name_len, extra_len, comment_len, disk, _, _, offset) = header_struct.unpack_from(view, position)
+            if signature != consts.CENTRAL_DIR_FILE_HEADER_SIGNATURE:
+                raise ValueError(f"Central directory is corrupted at {position}.")
+            name_start = position + header_struct.size
+            extra_start = name_start + name_len
+            position = extra_start + extra_len + comment_len
+            if position > len(view):
+                raise ValueError("Central directory is truncated.")
+
+            # zip64 extra field has only the values that are 0xFFFFFFFF (0xFFFF for disk) in the header, in this order
+            extra = view[extra_start:extra_start + extra_len]
+            zip64 = False
+            while len(extra) >= 4:
+                tag, size = int.from_bytes(extra[0:2], "little"), int.from_bytes(extra[2:4], "little")
+                if tag == 0x0001:
+                    zip64 = True
+                    values = extra[4:4 + size]
+                    if uncompressed_size == 0xFFFFFFFF:
+                        uncompressed_size, values = int.from_bytes(values[:8], "little"), values[8:]
+                    if compressed_size == 0xFFFFFFFF:
+                        compressed_size, values = int.from_bytes(values[:8], "little"), values[8:]
+                    if offset == 0xFFFFFFFF:
+                        offset, values = int.from_bytes(values[:8], "little"), values[8:]
+                    if disk == 0xFFFF:
+                        disk = int.from_bytes(values[:4], "little")
+                    break
+                extra = extra[4 + size:]
+
+            entries.append(view[name_start:extra_start], version_needed, flags, zip64, method, mod_time, mod_date, crc,
+                           compressed_size, uncompressed_size, offset, disk)
+        view.release()
+        return entries
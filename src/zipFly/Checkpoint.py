@@ -0,0 +1,62 @@
+import base64
+import struct
+import zlib
+
+from zipFly.EntryTable import EntryTable
+
+# magic, version, offset of the next entry, number of entries
+CHECKPOINT_HEADER_STRUCT = struct.Struct(b"<4sBQQ")
+CHECKPOINT_MAGIC = b"ZFCP"
+CHECKPOINT_VERSION = 2
+
+
+class Checkpoint:
+    """
+    State of an archive at an entry boundary: central directory info about the first `len(entries)` entries,
+    and the offset where the next entry starts. That's all that's needed to stream the rest of the archive
+    without touching the files that were already sent, see ZipFly.resume.
+
+    It's serialized into zlib compressed bytes (to_bytes) or an url safe string (to_token).
+    """
+
+    def __init__(self, entries: EntryTable, offset: int):
+        self.entries = entries
+        self.offset = offset
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"Checkpoint(entries={len(self.entries)}, offset={self.offset})"
+
+    def to_bytes(self) -> bytes:
+        header = CHECKPOINT_HEADER_STRUCT.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.offset, len(self.entries))
+        return header + zlib.compress(self.entries.to_bytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Checkpoint":
+        if len(data) < CHECKPOINT_HEADER_STRUCT.size:
+            raise ValueError("Not a ZipFly checkpoint.")
+        magic, version, offset, count = CHECKPOINT_HEADER_STRUCT.unpack_from(data)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError("Not a ZipFly checkpoint.")
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version}.")
+        try:
+            entries = EntryTable.from_bytes(zlib.decompress(data[CHECKPOINT_HEADER_STRUCT.size:]))
+        except zlib.error:
+            raise ValueError("Checkpoint is corrupted.")
+        if len(entries) != count:
+            raise ValueError("Checkpoint is corrupted.")
+        return cls(entries, offset)
+
+    def to_token(self) -> str:
+        return base64.urlsafe_b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_token(cls, token: str) -> "Checkpoint":
+        try:
+            data = base64.urlsafe_b64decode(token.encode("ascii"))
+        except (ValueError, UnicodeError):
+            raise ValueError("Not a ZipFly checkpoint.")
+        return cls.from_bytes(data)
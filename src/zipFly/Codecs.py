@@ -0,0 +1,130 @@
+import bz2
+import lzma
+import struct
+import zlib
+from typing import Callable, Dict, Optional
+
+from zipFly import consts
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec:
+    """
+    Zip compression method. `make_compressor(level)` returns a fresh object with compress(data) -> bytes and flush() -> bytes,
+    like zlib.compressobj(). `flags` are general purpose bit flags the method needs in headers.
+    `make_decompressor()` returns an object with decompress(data) -> bytes (like zlib.decompressobj()), it's used by ZipFlyReader.
+    """
+
+    def __init__(self, method: int, name: str, make_compressor: Optional[Callable[[int], object]], default_level: int = None,
+                 version_needed: int = 20, flags: int = 0, available: bool = True, make_decompressor: Optional[Callable[[], object]] = None):
+        self.method = method
+        self.name = name
+        self.make_compressor = make_compressor
+        self.make_decompressor = make_decompressor
+        self.default_level = default_level
+        self.version_needed = version_needed
+        self.flags = flags
+        self.available = available  # False when its optional dependency isn't installed
+
+    def __repr__(self):
+        return f"Codec({self.method}, {self.name!r})"
+
+    def compressobj(self, level: int = None):
+        return self.make_compressor(self.default_level if level is None else level)
+
+    def decompressobj(self):
+        if self.make_decompressor is None:
+            raise ValueError(f"Compression method {self.method} ({self.name}) can't be decompressed.")
+        return self.make_decompressor()
+
+
+class _LzmaCompressor:
+    """
+    Zip wants LZMA1 raw stream with a small header: LZMA SDK version, size of properties and the properties. (5.8.8)
+    """
+
+    def __init__(self, level: int):
+        properties = lzma._encode_filter_properties({"id": lzma.FILTER_LZMA1, "preset": level})
+        self._compr = lzma.LZMACompressor(lzma.FORMAT_RAW, filters=[lzma._decode_filter_properties(lzma.FILTER_LZMA1, properties)])
+        self._header = struct.pack("<BBH", 9, 4, len(properties)) + properties
+
+    def _take_header(self) -> bytes:
+        header, self._header = self._header, b""
+        return header
+
+    def compress(self, data: bytes) -> bytes:
+        return self._take_header() + self._compr.compress(data)
+
+    def flush(self) -> bytes:
+        return self._take_header() + self._compr.flush()
+
+
+class _LzmaDecompressor:
+    """
+    Reads the header _LzmaCompressor writes, then decompresses the raw LZMA1 stream after it.
+    """
+
+    def __init__(self):
+        self._header = b""
+        self._decompr = None
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._decompr is None:
+            self._header += data
+            if len(self._header) < 4:
+                return b""
+            properties_size = struct.unpack_from("<H", self._header, 2)[0]
+            if len(self._header) < 4 + properties_size:
+                return b""
+            properties = self._header[4:4 + properties_size]
+            self._decompr = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[lzma._decode_filter_properties(lzma.FILTER_LZMA1, properties)])
+            data, self._header = self._header[4 + properties_size:], b""
+        return self._decompr.decompress(data)
+
+
+class _StoredDecompressor:
+    @staticmethod
+    def decompress(data: bytes) -> bytes:
+        return data
+
+
+def _make_zstd_compressor(level: int):
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+_codecs: Dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec, replace: bool = False) -> None:
+    """
+    Makes `codec` usable as compression_method of files. Built in methods can only be replaced with replace=True.
+    """
+    if codec.method in _codecs and not replace:
+        raise ValueError(f"Compression method {codec.method} is already registered as {_codecs[codec.method]}.")
+    if codec.method == consts.COMPRESSION_AUTO:
+        raise ValueError(f"Compression method {consts.COMPRESSION_AUTO} is reserved for COMPRESSION_AUTO.")
+    _codecs[codec.method] = codec
+
+
+def get_codec(method: int) -> Codec:
+    codec = _codecs.get(method)
+    if codec is None:
+        raise ValueError(f"Unknown compression method {method}, register it with register_codec().")
+    if not codec.available:
+        raise ValueError(f"Compression method {method} ({codec.name}) needs an optional dependency, install zipFly64[{codec.name}].")
+    return codec
+
+
+register_codec(Codec(consts.NO_COMPRESSION, "stored", None, version_needed=10, make_decompressor=_StoredDecompressor))
+register_codec(Codec(consts.COMPRESSION_DEFLATE, "deflate", lambda level: zlib.compressobj(level, zlib.DEFLATED, -15), default_level=5,
+                     make_decompressor=lambda: zlib.decompressobj(-15)))
+register_codec(Codec(consts.COMPRESSION_BZIP2, "bzip2", bz2.BZ2Compressor, default_level=9, version_needed=46, make_decompressor=bz2.BZ2Decompressor))
+# bit 1 says the stream ends with an end of stream marker, which python's lzma always writes
+register_codec(Codec(consts.COMPRESSION_LZMA, "lzma", _LzmaCompressor, default_level=6, version_needed=63, flags=0x02,
+                     make_decompressor=_LzmaDecompressor))
+register_codec(Codec(consts.COMPRESSION_ZSTD, "zstd", _make_zstd_compressor, default_level=3, version_needed=63, available=zstandard is not None,
+                     make_decompressor=lambda: zstandard.ZstdDecompressor().decompressobj()))
@@ -0,0 +1,72 @@
+import os
+import time
+import zlib
+from typing import Optional, Iterable
+
+from zipFly import consts
+
+
+class CompressionPolicy:
+    """
+    Picks NO_COMPRESSION or `method` (COMPRESSION_DEFLATE by default) for files with COMPRESSION_AUTO.
+
+    Files with extensions of already compressed formats are stored right away. For the rest, the first `sample_size` bytes
+    are trial deflated, and the file is compressed only if the sample shrinks below `min_ratio` of its size.
+    """
+
+    DEFAULT_STORED_EXTENSIONS = frozenset({
+        # images
+        "jpg", "jpeg", "png", "gif", "webp", "heic", "avif",
+        # audio & video
+        "mp3", "aac", "ogg", "opus", "flac", "m4a", "mp4", "m4v", "mkv", "mov", "avi", "webm",
+        # archives & compressed data
+        "zip", "gz", "tgz", "bz2", "xz", "zst", "7z", "rar", "lz4", "br", "parquet", "orc", "avro",
+        # documents which are zips inside
+        "docx", "xlsx", "pptx", "odt", "ods", "epub", "jar", "apk", "whl",
+    })
+
+    def __init__(self, stored_extensions: Iterable[str] = None, sample_size: int = 64 * 1024, min_ratio: float = 0.9, level: int = 5,
+                 method: int = consts.COMPRESSION_DEFLATE):
+        self.stored_extensions = frozenset(ext.lower() for ext in stored_extensions) if stored_extensions is not None else self.DEFAULT_STORED_EXTENSIONS
+        self.sample_size = sample_size
+        self.min_ratio = min_ratio
+        self.level = level
+        self.method = method
+        self.seconds_per_byte = None  # measured deflate speed, used to estimate the cpu time saved by storing
+
+    def choose_by_name(self, name: str) -> Optional[int]:
+        """
+        Returns NO_COMPRESSION for known compressed formats, None if the data has to decide.
+        """
+        ext = os.path.splitext(name)[1].lower().lstrip(".")
+        return consts.NO_COMPRESSION if ext in self.stored_extensions else None
+
+    def choose_by_sample(self, sample: bytes) -> int:
+        if not sample:
+            return consts.NO_COMPRESSION
+
+        start = time.perf_counter()
+        compr = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        compressed_size = len(compr.compress(sample)) + len(compr.flush())
+        self._measure(time.perf_counter() - start, len(sample))
+
+        if compressed_size < len(sample) * self.min_ratio:
+            return self.method
+        return consts.NO_COMPRESSION
+
+    def estimate_cpu_time(self, size: int) -> float:
+        """
+        Estimated time deflate would take for `size` bytes.
+        """
+        if self.seconds_per_byte is None:
+            # nothing was trial compressed yet, so measure on some half random data
+            sample = os.urandom(self.sample_size // 2) + bytes(self.sample_size // 2)
+            self.choose_by_sample(sample)
+        return size * self.seconds_per_byte
+
+    def _measure(self, seconds: float, size: int) -> None:
+        speed = seconds / size
+        if self.seconds_per_byte is None:
+            self.seconds_per_byte = speed
+        else:
+            self.seconds_per_byte = 0.9 * self.seconds_per_byte + 0.1 * speed
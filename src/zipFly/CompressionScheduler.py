@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncGenerator, AsyncIterator, Callable, Deque, Generator, Iterator, List, Optional
+
+from zipFly import consts
+
+
+class _Job:
+    def __init__(self, function: Callable, args: tuple, size: int):
+        self.function = function
+        self.args = args
+        self.size = size  # bytes counted in the budget of the scheduler until the result is taken
+        self.future = Future()
+
+
+class Lane:
+    """
+    Queue of one archive in a CompressionScheduler. Its jobs run one at a time and in order (compressors have state),
+    on whichever worker is free, so one archive never takes more than one worker.
+    """
+
+    def __init__(self, scheduler: "CompressionScheduler", priority: int):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.jobs: Deque[_Job] = deque()
+        self.running = False
+        self.ready = False  # waiting in a ready queue of the scheduler
+
+    def _submit(self, function: Callable, *args, size: int = 0) -> _Job:
+        job = _Job(function, args, size)
+        self.scheduler._enqueue(self, job)
+        return job
+
+    def _full(self, pending: Deque[_Job]) -> bool:
+        # one job can always be in flight, so an archive never waits for other archives to take their data
+        if not pending:
+            return False
+        scheduler = self.scheduler
+        return len(pending) >= scheduler.depth or scheduler.buffered > scheduler.max_buffer_size
+
+    def _take(self, pending: Deque[_Job]) -> bytes:
+        job = pending.popleft()
+        try:
+            return job.future.result()
+        finally:
+            self.scheduler._release(job.size)
+
+    async def _async_take(self, pending: Deque[_Job]) -> bytes:
+        job = pending[0]
+        await asyncio.wrap_future(job.future)
+        return self._take(pending)
+
+    def _abandon(self, pending: Deque[_Job]) -> None:
+        for job in pending:
+            if job.future.cancel():
+                self.scheduler._release(job.size)
+            else:  # running already, its bytes are released once it's done
+                job.future.add_done_callback(lambda _, size=job.size: self.scheduler._release(size))
+
+    def process(self, compressor, data: Iterator[bytes]) -> Generator[bytes, None, None]:
+        """
+        compressor.process of every chunk of `data` and compressor.tail on workers of the scheduler,
+        the next chunks are read while the previous ones are compressed.
+        """
+        pending: Deque[_Job] = deque()
+        try:
+            for chunk in data:
+                while self._full(pending):
+                    done = self._take(pending)
+                    if done:
+                        yield done
+                pending.append(self._submit(compressor.process, chunk, size=len(chunk)))
+            pending.append(self._submit(compressor.tail))
+            while pending:
+                done = self._take(pending)
+                if done:
+                    yield done
+        finally:
+            self._abandon(pending)
+
+    async def async_process(self, compressor, data: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of process, the event loop only waits for results, it never compresses.
+        """
+        pending: Deque[_Job] = deque()
+        try:
+            async for chunk in data:
+                while self._full(pending):
+                    done = await self._async_take(pending)
+                    if done:
+                        yield done
+                pending.append(self._submit(compressor.process, chunk, size=len(chunk)))
+            pending.append(self._submit(compressor.tail))
+            while pending:
+                done = await self._async_take(pending)
+                if done:
+                    yield done
+        finally:
+            self._abandon(pending)
+
+
+class CompressionScheduler:
+    """
+    Pool of `workers` threads doing compression and crc for any number of ZipFly instances (ZipFly(..., scheduler=scheduler)),
+    so the CPU used by compression is the same with 1 and with 500 downloads. Create one per process and share it.
+
+    Every archive gets a Lane. Workers take one chunk at a time from lanes of the highest priority class that has work
+    (consts.PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW), round robin between lanes of that class,
+    so a huge archive gets the same share as a small one next to it.
+    Chunks waiting for a worker or for their archive to take them are capped at `max_buffer_size` bytes in total,
+    with at most `depth` per archive. An archive with nothing in flight can always put one chunk, so none of them waits for the others.
+    """
+
+    def __init__(self, workers: int = None, max_buffer_size: int = 256 * 1024 * 1024, depth: int = 4):
+        if depth < 1:
+            raise ValueError("depth must be at least 1.")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_buffer_size = max_buffer_size
+        self.depth = depth
+        self.buffered = 0
+
+        self._condition = threading.Condition()
+        self._ready: List[Deque[Lane]] = [deque() for _ in consts.PRIORITIES]  # lanes with jobs, per priority class
+        self._threads = []
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f"CompressionScheduler(workers={self.workers}, buffered={self.buffered})"
+
+    def lane(self, priority: int = consts.PRIORITY_NORMAL) -> Lane:
+        if priority not in consts.PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, use consts.PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.")
+        return Lane(self, priority)
+
+    def close(self) -> None:
+        """
+        Stops workers once queued jobs are done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _enqueue(self, lane: Lane, job: _Job) -> None:
+        with self._condition:
+            if self._closed:
+                raise ValueError("CompressionScheduler is closed.")
+            self.buffered += job.size
+            lane.jobs.append(job)
+            if not lane.running and not lane.ready:
+                lane.ready = True
+                self._ready[lane.priority].append(lane)
+            # workers are started on the first job, so creating a scheduler is free
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"zipFly-compression-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify()
+
+    def _release(self, size: int) -> None:
+        with self._condition:
+            self.buffered -= size
+
+    def _next_lane(self) -> Optional[Lane]:
+        for ready in self._ready:
+            if ready:
+                return ready.popleft()
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                lane = self._next_lane()
+                while lane is None:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+                    lane = self._next_lane()
+                lane.ready = False
+                lane.running = True
+                job = lane.jobs.popleft()
+
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.function(*job.args))
+                except BaseException as e:
+                    job.future.set_exception(e)
+
+            with self._condition:
+                lane.running = False
+                if lane.jobs:
+                    # back of its class, so other archives go first
+                    lane.ready = True
+                    self._ready[lane.priority].append(lane)
+                    self._condition.notify()
@@ -1,37 +1,165 @@
 import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from zipFly import consts
+from zipFly.Codecs import get_codec
+
+
+def _gf2_matrix_times(matrix, vector):
+    total = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return total
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, matrix[n]) for n in range(32)]
+
+
+def _gf2_matrix_multiply(first, second):
+    # applies `second`, then `first`
+    return [_gf2_matrix_times(first, column) for column in second]
+
+
+@lru_cache(maxsize=64)
+def _crc32_zeros_operator(length: int):
+    """
+    Matrix that applies `length` zero bytes to a crc. Cached, blocks of parallel deflate all have the same length,
+    so building it (the slow part of combining) happens once, not per block.
+    """
+    operator = [0xEDB88320] + [1 << n for n in range(31)]  # one zero bit
+    for _ in range(3):
+        operator = _gf2_matrix_square(operator)  # one zero byte
+
+    result = [1 << n for n in range(32)]  # identity
+    while length:
+        if length & 1:
+            result = _gf2_matrix_multiply(operator, result)
+        length >>= 1
+        if length:
+            operator = _gf2_matrix_square(operator)
+    return result
+
+
+def crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+    """
+    Combines crc1 of data A and crc2 of data B (of length len2) into crc of A + B.
+    Port of zlib's crc32_combine, python's zlib doesn't expose it.
+    """
+    if len2 <= 0:
+        return crc1
+    return _gf2_matrix_times(_crc32_zeros_operator(len2), crc1) ^ crc2
 
 
 class Compressor:
+    # size of blocks compressed by separate threads in parallel deflate
+    parallel_block_size = 1024 * 1024
+    # deflate window, the tail of previous block is used as a dictionary for the next one
+    window_size = 32 * 1024
+
     def __init__(self, file):
         self.file = file
+        self.compute_crc = file.known_crc is None
+        self.level = file.get_compression_level()
+        self.executor = None
 
-        if file.compression_method == 0:
+        if file.compression_method == consts.NO_COMPRESSION:
             self.process = self._process_through
             self.tail = self._no_tail
-        elif file.compression_method == 8:  # deflate compression
-            self.compr = zlib.compressobj(5, zlib.DEFLATED, -15)
-            self.process = self._process_deflate
-            self.tail = self._tail_deflate
+        elif file.compression_method == consts.COMPRESSION_DEFLATE and file.compression_workers:  # deflate compression on several threads
+            self.executor = ThreadPoolExecutor(max_workers=file.compression_workers)
+            self.max_pending = file.compression_workers * 2
+            self.pending = deque()
+            self.block = bytearray()
+            self.dictionary = b''
+            self.process = self._process_parallel_deflate
+            self.tail = self._tail_parallel_deflate
+        else:  # deflate, bzip2, lzma, zstd or a registered codec
+            self.compr = get_codec(file.compression_method).compressobj(self.level)
+            self.process = self._process_compress
+            self.tail = self._tail_compress
 
     # no compression
     def _process_through(self, chunk):
         self.file.original_size += len(chunk)
         self.file.compressed_size += len(chunk)
-        self.file.crc = zlib.crc32(chunk, self.file.crc)
+        if self.compute_crc:
+            self.file.crc = zlib.crc32(chunk, self.file.crc)
         return chunk
 
     def _no_tail(self):
         return b''
 
-    # deflate compression
-    def _process_deflate(self, chunk):
+    # compression with a codec
+    def _process_compress(self, chunk):
         self.file.original_size += len(chunk)
-        self.file.crc = zlib.crc32(chunk, self.file.crc)
+        if self.compute_crc:
+            self.file.crc = zlib.crc32(chunk, self.file.crc)
         chunk = self.compr.compress(chunk)
         self.file.compressed_size += len(chunk)
         return chunk
 
-    def _tail_deflate(self):
-        chunk = self.compr.flush(zlib.Z_FINISH)
+    def _tail_compress(self):
+        chunk = self.compr.flush()
         self.file.compressed_size += len(chunk)
-        return chunk
\ No newline at end of file
+        return chunk
+
+    # parallel deflate compression (like pigz)
+    # Input is split into blocks, each compressed by a separate thread into a raw deflate stream ending with a sync flush
+    # (so it ends on a byte boundary), and only the last one is finished. Glued together they make one valid deflate stream.
+    def _compress_block(self, block, dictionary, last, compute_crc):
+        if dictionary:
+            compr = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=dictionary)
+        else:
+            compr = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        data = compr.compress(block) + compr.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        return data, zlib.crc32(block) if compute_crc else 0, len(block)
+
+    def _submit_block(self, block, last):
+        self.pending.append(self.executor.submit(self._compress_block, block, self.dictionary, last, self.compute_crc))
+        self.dictionary = block[-self.window_size:]
+
+    def _collect_blocks(self, wait):
+        """
+        Returns compressed data of finished blocks, in order.
+        """
+        chunks = []
+        while self.pending and (wait or self.pending[0].done() or len(self.pending) > self.max_pending):
+            data, crc, length = self.pending.popleft().result()
+            if self.compute_crc:
+                self.file.crc = crc32_combine(self.file.crc, crc, length)
+            self.file.original_size += length
+            self.file.compressed_size += len(data)
+            chunks.append(data)
+        return b''.join(chunks)
+
+    def _process_parallel_deflate(self, chunk):
+        self.block += chunk
+        while len(self.block) >= self.parallel_block_size:
+            self._submit_block(bytes(self.block[:self.parallel_block_size]), last=False)
+            del self.block[:self.parallel_block_size]
+        return self._collect_blocks(wait=False)
+
+    def _tail_parallel_deflate(self):
+        self._submit_block(bytes(self.block), last=True)
+        self.block = bytearray()
+        chunk = self._collect_blocks(wait=True)
+        self.close()
+        return chunk
+
+    def close(self):
+        """
+        Stops threads of parallel deflate. Called when streaming of the file ends, also when it's abandoned before the tail.
+        """
+        if self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.pending.clear()
+            self.executor.shutdown()
+            self.executor = None
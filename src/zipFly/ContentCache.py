@@ -0,0 +1,217 @@
+import hashlib
+import os
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Generator, AsyncGenerator, Optional
+
+import aiofiles
+
+from zipFly import consts
+from zipFly.BaseFile import BaseFile
+
+# crc, original size, compressed size
+CACHE_HEADER_STRUCT = struct.Struct(b"<LQQ")
+
+
+class ContentCache:
+    """
+    Keeps finished compressed streams of hot files on disk, so they're not compressed again on every download.
+
+    Files are identified by BaseFile.metadata_key(). A file is cached once it has been
+    streamed `admit_after` times, and least recently used files are evicted to stay under `max_size` bytes.
+    Each cache file holds crc and sizes followed by the raw compressed stream.
+    """
+
+    def __init__(self, directory: str, max_size: int = 1024 * 1024 * 1024, admit_after: int = 2, chunk_size: int = 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.admit_after = admit_after
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # name -> size on disk, least recently used first
+        self._size = 0
+        self._seen = OrderedDict()  # name -> times streamed, for admission
+        self._max_seen = 100_000
+
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+
+    def _name(self, file: BaseFile) -> Optional[str]:
+        if file.compression_method == consts.NO_COMPRESSION:
+            return None
+        key = file.metadata_key()
+        if key is None:
+            return None
+        # metadata key has the method and level already
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _hit(self, name: str) -> bool:
+        with self._lock:
+            if name not in self._entries:
+                return False
+            self._entries.move_to_end(name)
+        try:
+            os.utime(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            # removed by another process
+            self._forget(name)
+            return False
+        return True
+
+    def _should_admit(self, name: str) -> bool:
+        with self._lock:
+            seen = self._seen.pop(name, 0) + 1
+            self._seen[name] = seen
+            while len(self._seen) > self._max_seen:
+                self._seen.popitem(last=False)
+            return seen >= self.admit_after
+
+    def _forget(self, name: str) -> None:
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._size -= size
+
+    def _commit(self, name: str, temp_path: str) -> None:
+        size = os.path.getsize(temp_path)
+        if size > self.max_size:
+            os.remove(temp_path)
+            return
+
+        with self._lock:
+            evicted = []
+            while self._entries and self._size + size > self.max_size:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_name)
+            old_size = self._entries.pop(name, None)
+            if old_size is not None:
+                self._size -= old_size
+            self._entries[name] = size
+            self._size += size
+
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except FileNotFoundError:
+                pass
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+    @staticmethod
+    def _read_header(header: bytes, file: BaseFile) -> None:
+        file.crc, file.original_size, file.compressed_size = CACHE_HEADER_STRUCT.unpack(header)
+
+    def _temp_path(self) -> str:
+        return os.path.join(self.directory, f"{uuid.uuid4().hex}.tmp")
+
+    def _discard(self, name: str) -> None:
+        """
+        Drops a cache file that is broken (cut short by a crash, or changed by something else).
+        """
+        self._forget(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _check(self, name: str, header: bytes, size: int, file: BaseFile) -> bool:
+        """
+        Sets crc and sizes of `file` from the header of its cache file, if the header is whole and matches the file size.
+        """
+        if len(header) < CACHE_HEADER_STRUCT.size or CACHE_HEADER_STRUCT.unpack(header)[2] != size - CACHE_HEADER_STRUCT.size:
+            self._discard(name)
+            return False
+        self._read_header(header, file)
+        return True
+
+    def stream(self, file: BaseFile, lane=None) -> Generator[bytes, None, None]:
+        """
+        Processed data of `file`, from the cache if it's there. Sets crc and sizes of the file just like compressing does.
+        Misses are compressed on `lane` of a CompressionScheduler, if it's given.
+        """
+        name = self._name(file)
+        if name is not None and self._hit(name):
+            try:
+                fh = open(os.path.join(self.directory, name), "rb")
+            except FileNotFoundError:
+                self._forget(name)
+            else:
+                with fh:
+                    if self._check(name, fh.read(CACHE_HEADER_STRUCT.size), os.fstat(fh.fileno()).st_size, file):
+                        yield from iter(lambda: fh.read(self.chunk_size), b"")
+                        return
+
+        if name is None or not self._should_admit(name):
+            yield from file.generate_processed_file_data(lane)
+            return
+
+        temp_path = self._temp_path()
+        completed = False
+        try:
+            with open(temp_path, "wb") as out:
+                out.write(bytes(CACHE_HEADER_STRUCT.size))
+                for chunk in file.generate_processed_file_data(lane):
+                    out.write(chunk)
+                    yield chunk
+                out.seek(0)
+                out.write(CACHE_HEADER_STRUCT.pack(file.crc & 0xFFFFFFFF, file.original_size, file.compressed_size))
+            completed = True
+            self._commit(name, temp_path)
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def async_stream(self, file: BaseFile, lane=None) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of stream
+        """
+        name = self._name(file)
+        if name is not None and self._hit(name):
+            try:
+                fh = await aiofiles.open(os.path.join(self.directory, name), "rb")
+            except FileNotFoundError:
+                self._forget(name)
+            else:
+                try:
+                    if self._check(name, await fh.read(CACHE_HEADER_STRUCT.size), os.fstat(fh.fileno()).st_size, file):
+                        while True:
+                            chunk = await fh.read(self.chunk_size)
+                            if not chunk:
+                                break
+                            yield chunk
+                        return
+                finally:
+                    await fh.close()
+
+        if name is None or not self._should_admit(name):
+            async for chunk in file.async_generate_processed_file_data(lane):
+                yield chunk
+            return
+
+        temp_path = self._temp_path()
+        completed = False
+        try:
+            async with aiofiles.open(temp_path, "wb") as out:
+                await out.write(bytes(CACHE_HEADER_STRUCT.size))
+                async for chunk in file.async_generate_processed_file_data(lane):
+                    await out.write(chunk)
+                    yield chunk
+                await out.seek(0)
+                await out.write(CACHE_HEADER_STRUCT.pack(file.crc & 0xFFFFFFFF, file.original_size, file.compressed_size))
+            completed = True
+            self._commit(name, temp_path)
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,137 @@
+import struct
+import sys
+from array import array
+
+from zipFly import consts
+from zipFly.BaseFile import BaseFile
+
+
+# typed columns, in the order they're serialized
+COLUMNS = ("name_ends", "versions_needed", "flags", "zip64_local", "compression_methods", "mod_times", "mod_dates",
+           "crcs", "compressed_sizes", "uncompressed_sizes", "offsets", "disks")
+LENGTH_STRUCT = struct.Struct(b"<Q")
+
+
+class EntryTable:
+    """
+    Compact storage of everything the central directory needs about streamed files, so BaseFile objects
+    don't have to be kept around until the end of the archive.
+
+    Every entry takes 49 bytes + length of its name: names are glued into one bytearray,
+    and the rest is kept in typed arrays (columns), instead of ~1 KB for a BaseFile object with its __dict__.
+    """
+
+    def __init__(self):
+        self.names = bytearray()
+        self.name_ends = array("Q")  # end of every name in self.names
+        self.versions_needed = array("H")  # of the compression method, zip64 raises it to 45
+        self.flags = array("H")
+        self.zip64_local = array("B")  # local file header has zip64 extra field
+        self.compression_methods = array("H")
+        self.mod_times = array("H")
+        self.mod_dates = array("H")
+        self.crcs = array("I")
+        self.compressed_sizes = array("Q")
+        self.uncompressed_sizes = array("Q")
+        self.offsets = array("Q")
+        self.disks = array("H")  # disk (part of a split archive) with the local file header, offsets are relative to its start
+
+    def __len__(self) -> int:
+        return len(self.name_ends)
+
+    def add(self, file: BaseFile, disk: int = 0) -> None:
+        """
+        Records a file, after its data was streamed (so crc and sizes are final).
+        """
+        self.append(file.file_path_bytes, file.get_version_needed(zip64=False), file.flags, file.zip64, file.compression_method,
+                    file.get_mod_time(), file.get_mod_date(), file.crc & 0xFFFFFFFF, file.compressed_size, file.original_size,
+                    file.offset, disk)
+
+    def append(self, name: bytes, version_needed: int, flags: int, zip64_local: bool, compression_method: int, mod_time: int,
+               mod_date: int, crc: int, compressed_size: int, uncompressed_size: int, offset: int, disk: int) -> None:
+        """
+        Records an entry from raw values (like ones read from central directory of an existing archive).
+        """
+        self.names += name
+        self.name_ends.append(len(self.names))
+        self.versions_needed.append(version_needed)
+        self.flags.append(flags)
+        self.zip64_local.append(zip64_local)
+        self.compression_methods.append(compression_method)
+        self.mod_times.append(mod_time)
+        self.mod_dates.append(mod_date)
+        self.crcs.append(crc)
+        self.compressed_sizes.append(compressed_size)
+        self.uncompressed_sizes.append(uncompressed_size)
+        self.offsets.append(offset)
+        self.disks.append(disk)
+
+    def name(self, index: int) -> str:
+        """
+        Decoded name of an entry, utf-8 if its flag says so, cp437 otherwise.
+        """
+        name = bytes(self.names[self.name_start(index):self.name_ends[index]])
+        return name.decode("utf-8" if self.flags[index] & consts.UTF8_FLAG else "cp437")
+
+    def name_start(self, index: int) -> int:
+        return self.name_ends[index - 1] if index else 0
+
+    @classmethod
+    def from_files(cls, files) -> "EntryTable":
+        table = cls()
+        for file in files:
+            table.add(file)
+        return table
+
+    def head(self, count: int) -> "EntryTable":
+        """
+        Copy of the first `count` entries.
+        """
+        table = EntryTable()
+        table.names = self.names[:self.name_start(count)]
+        for column in COLUMNS:
+            setattr(table, column, getattr(self, column)[:count])
+        return table
+
+    def to_bytes(self) -> bytes:
+        """
+        Names and columns, each prefixed with its length. Columns are always little endian.
+        """
+        parts = [LENGTH_STRUCT.pack(len(self.names)), bytes(self.names)]
+        for column in COLUMNS:
+            values = getattr(self, column)
+            if sys.byteorder == "big":
+                values = array(values.typecode, values)
+                values.byteswap()
+            data = values.tobytes()
+            parts += [LENGTH_STRUCT.pack(len(data)), data]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EntryTable":
+        table = cls()
+        view = memoryview(data)
+        position = 0
+
+        def take() -> memoryview:
+            nonlocal position
+            (length,) = LENGTH_STRUCT.unpack_from(view, position)
+            position += LENGTH_STRUCT.size
+            if position + length > len(view):
+                raise ValueError("Entry table data is truncated.")
+            part = view[position:position + length]
+            position += length
+            return part
+
+        table.names = bytearray(take())
+        for column in COLUMNS:
+            values = getattr(table, column)
+            part = take()
+            if len(part) % values.itemsize:
+                raise ValueError("Entry table data is corrupted.")
+            values.frombytes(part)
+            if sys.byteorder == "big":
+                values.byteswap()
+        if any(len(getattr(table, column)) != len(table) for column in COLUMNS):
+            raise ValueError("Entry table data is corrupted.")
+        return table
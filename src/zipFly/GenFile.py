@@ -1,16 +1,19 @@
 import time
 from typing import Generator, AsyncGenerator, Union
+from zipFly import consts
 from zipFly.BaseFile import BaseFile
 
 
 class GenFile(BaseFile):
 
-    def __init__(self, name: str, generator: Union[Generator[bytes, None, None], AsyncGenerator[bytes, None]], compression_method: int = None, modification_time: float = None, size: int = None):
-        super().__init__(compression_method)
+    def __init__(self, name: str, generator: Union[Generator[bytes, None, None], AsyncGenerator[bytes, None]], compression_method: int = None, modification_time: float = None, size: int = None, compression_workers: int = None,
+                 compression_level: int = None):
+        super().__init__(compression_method, compression_workers, compression_level)
         self._name = name
         self.generator = generator
         self._size = size
-        self._modification_time = modification_time if modification_time else time.time()
+        self._modification_time = modification_time
+        self._created = time.time()  # modification time of files without one, unless ZipFly is deterministic
 
     def _generate_file_data(self) -> Generator[bytes, None, None]:
         if isinstance(self.generator, Generator):
@@ -37,7 +40,9 @@ class GenFile(BaseFile):
 
     @property
     def modification_time(self) -> float:
-        return self._modification_time
+        if self._modification_time:
+            return self._modification_time
+        return consts.DETERMINISTIC_MODIFICATION_TIME if self.deterministic else self._created
 
     def set_file_name(self, new_name: str) -> None:
         self._name = new_name
@@ -0,0 +1,124 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from zipFly.BaseFile import BaseFile
+from zipFly.EntryTable import EntryTable
+
+
+class ArchiveLayout:
+    """
+    Everything of an archive except file data: local file headers, data descriptors and end structures
+    glued into one bytes object, `bounds` says where each of them starts. Entries are kept for checkpoints and
+    to check that files still give the same crc and sizes.
+    """
+
+    def __init__(self, data: bytes, bounds: array, entries: EntryTable, size: int):
+        self.data = data
+        self.bounds = bounds  # header of file i starts at bounds[2 * i], its descriptor at bounds[2 * i + 1]
+        self.entries = entries
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Roughly how much memory it takes.
+        """
+        entries = self.entries
+        return len(self.data) + len(self.bounds) * self.bounds.itemsize + len(entries.names) + len(entries) * 49
+
+    def local_file_header(self, index: int) -> bytes:
+        return self.data[self.bounds[2 * index]:self.bounds[2 * index + 1]]
+
+    def data_descriptor(self, index: int) -> bytes:
+        return self.data[self.bounds[2 * index + 1]:self.bounds[2 * index + 2]]
+
+    def end_structures(self) -> bytes:
+        return self.data[self.bounds[-1]:]
+
+    def matches(self, index: int, file: BaseFile) -> bool:
+        entries = self.entries
+        return (file.crc & 0xFFFFFFFF == entries.crcs[index] and file.compressed_size == entries.compressed_sizes[index]
+                and file.original_size == entries.uncompressed_sizes[index])
+
+
+class LayoutBuilder:
+    """
+    Collects headers and descriptors while an archive is streamed for the first time.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._bounds = array("Q")
+
+    def add(self, header: bytes, descriptor: bytes) -> None:
+        self._bounds.append(len(self._data))
+        self._data += header
+        self._bounds.append(len(self._data))
+        self._data += descriptor
+
+    def finish(self, end_structures: bytes, entries: EntryTable, size: int) -> ArchiveLayout:
+        self._bounds.append(len(self._data))
+        self._data += end_structures
+        return ArchiveLayout(bytes(self._data), self._bounds, entries, size)
+
+
+class LayoutCache:
+    """
+    In memory LRU cache of archive layouts, keyed by a hash of the manifest (names and metadata keys of files),
+    holding layouts of at most `max_size` bytes in total.
+
+    When a ZipFly gets a manifest that was streamed before, it skips metadata lookups
+    and making headers, it only streams cached bytes around file data.
+    Files have to be identifiable (BaseFile.metadata_key(), so no GenFiles and no COMPRESSION_AUTO), otherwise nothing is cached.
+    """
+
+    def __init__(self, max_size: int = 256 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(files: List[BaseFile]) -> Optional[str]:
+        """
+        Hash of the manifest, or None if some file can't be identified.
+        """
+        digest = hashlib.sha1()
+        for file in files:
+            metadata_key = file.metadata_key()
+            if metadata_key is None:
+                return None
+            digest.update(repr((file.name, file.deterministic, metadata_key)).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[ArchiveLayout]:
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+            return layout
+
+    def set(self, key: str, layout: ArchiveLayout) -> None:
+        if layout.nbytes > self.max_size:
+            return
+        with self._lock:
+            old = self._layouts.pop(key, None)
+            if old is not None:
+                self.size -= old.nbytes
+            self._layouts[key] = layout
+            self.size += layout.nbytes
+            while self.size > self.max_size:
+                _, evicted = self._layouts.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            layout = self._layouts.pop(key, None)
+            if layout is not None:
+                self.size -= layout.nbytes
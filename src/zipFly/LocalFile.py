@@ -1,59 +1,249 @@
+import errno
+import fnmatch
+import mmap
 import os
-import time
-from typing import Generator, AsyncGenerator
+import stat
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, AsyncGenerator, Iterable
+
+from zipFly import consts
 from zipFly.BaseFile import BaseFile
 
 import aiofiles
 
 class LocalFile(BaseFile):
 
-    async def _async_generate_file_data(self) -> AsyncGenerator[bytes, None]:
+    # reads start with this size, and grow up to chunk_size, so small files and first bytes aren't slowed down by huge reads
+    MIN_CHUNK_SIZE = 64 * 1024
 
-        async with aiofiles.open(self._file_path, "rb") as fh:
-            while True:
-                part = await fh.read(self.chunk_size)
-                if not part:
-                    break
-                yield part
-
-    def __init__(self, file_path: str, name: str = None, compression_method: int = None):
-        if not os.path.isfile(file_path):
+    def __init__(self, file_path: str, name: str = None, compression_method: int = None, compression_workers: int = None,
+                 chunk_size: int = 1024 * 1024, use_mmap: bool = False, stat_result: os.stat_result = None, compression_level: int = None):
+        # stat once, size and modification time are read many times. It can be given if it's already known (from scandir)
+        self._stat = stat_result
+        if self._stat is None:
+            try:
+                self._stat = os.stat(file_path)
+            except OSError:
+                pass
+        if self._stat is None or not stat.S_ISREG(self._stat.st_mode):
             raise ValueError(f"{file_path} is not a correct file path.")
         self._file_path = file_path
-        self.chunk_size = 1048
+        self.chunk_size = chunk_size
+        # yield memoryviews of a mmap of the file instead of reading it (sync only).
+        # No copying, but the file must not be truncated while it's streamed.
+        self.use_mmap = use_mmap
         self._name = name if name else file_path
-        super().__init__(compression_method)
+        super().__init__(compression_method, compression_workers, compression_level)
+
+    @classmethod
+    def from_directory(cls, directory: str, prefix: str = "", include: Iterable[str] = None, exclude: Iterable[str] = None,
+                       follow_symlinks: bool = False, stat_workers: int = 0, **kwargs) -> Generator["LocalFile", None, None]:
+        """
+        Walks `directory` with os.scandir and yields a LocalFile for every file, named by its path relative to `directory`
+        (with `prefix` in front). Every file is stat-ed exactly once.
+
+        `include`/`exclude` are glob patterns matched against relative paths, excluded directories aren't walked at all.
+        With `follow_symlinks` every directory is walked only once, so symlinks pointing back up don't make it loop forever.
+        `stat_workers` > 0 runs stats in a thread pool, which helps a lot on network filesystems.
+        Other kwargs are passed to LocalFile.
+        """
+        include = list(include or [])
+        exclude = list(exclude or [])
+        executor = ThreadPoolExecutor(max_workers=stat_workers) if stat_workers else None
+
+        def stat_entry(entry: os.DirEntry):
+            try:
+                return entry.stat(follow_symlinks=follow_symlinks)
+            except OSError:
+                return None
+
+        try:
+            directories = [(directory, "")]
+            visited = set()  # (st_dev, st_ino) of directories, only needed when following symlinks
+            if follow_symlinks:
+                root = os.stat(directory)
+                visited.add((root.st_dev, root.st_ino))
+            while directories:
+                path, relative = directories.pop()
+                with os.scandir(path) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+
+                files = []
+                subdirectories = []
+                for entry in entries:
+                    entry_relative = relative + entry.name
+                    if any(fnmatch.fnmatchcase(entry_relative, pattern) for pattern in exclude):
+                        continue
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if follow_symlinks:
+                            try:
+                                directory_stat = entry.stat()
+                            except OSError:
+                                continue
+                            if (directory_stat.st_dev, directory_stat.st_ino) in visited:
+                                continue
+                            visited.add((directory_stat.st_dev, directory_stat.st_ino))
+                        subdirectories.append((entry.path, entry_relative + "/"))
+                    elif not include or any(fnmatch.fnmatchcase(entry_relative, pattern) for pattern in include):
+                        files.append((entry, entry_relative))
+
+                stats = executor.map(stat_entry, [entry for entry, _ in files]) if executor else map(stat_entry, [entry for entry, _ in files])
+                for (entry, entry_relative), stat_result in zip(files, stats):
+                    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                        continue
+                    yield cls(entry.path, name=prefix + entry_relative, stat_result=stat_result, **kwargs)
+
+                # walk in sorted order
+                directories.extend(reversed(subdirectories))
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def _read_sizes(self, start: int, end: int) -> Generator[int, None, None]:
+        """
+        Sizes of reads from `start` to `end`. They grow from MIN_CHUNK_SIZE to chunk_size, and never go past `end`.
+        """
+        read_size = min(self.MIN_CHUNK_SIZE, self.chunk_size)
+        while start < end:
+            size = min(read_size, end - start)
+            yield size
+            start += size
+            read_size = min(read_size * 2, self.chunk_size)
 
     def _generate_file_data(self) -> Generator[bytes, None, None]:
+        yield from self._generate_file_data_from(0)
+
+    async def _async_generate_file_data(self) -> AsyncGenerator[bytes, None]:
+        async for part in self._async_generate_file_data_from(0):
+            yield part
+
+    def _generate_file_data_from(self, start: int) -> Generator[bytes, None, None]:
         with open(self._file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if self.use_mmap and size > start:
+                # views keep the mmap alive, so it's closed when the last of them is gone
+                view = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+                for read_size in self._read_sizes(start, size):
+                    yield view[start:start + read_size]
+                    start += read_size
+                return
+
+            file.seek(start)
+            for read_size in self._read_sizes(start, size):
+                chunk = file.read(read_size)
+                if not chunk:
+                    break
+                yield chunk
+
+            # file could've grown since fstat
             while True:
                 chunk = file.read(self.chunk_size)
                 if not chunk:
                     break
                 yield chunk
 
+    async def _async_generate_file_data_from(self, start: int) -> AsyncGenerator[bytes, None]:
+        # every read is a separate thread hop in aiofiles, so reads are as big as possible
+        async with aiofiles.open(self._file_path, "rb") as fh:
+            size = os.path.getsize(self._file_path)
+            await fh.seek(start)
+            for read_size in self._read_sizes(start, size):
+                part = await fh.read(read_size)
+                if not part:
+                    break
+                yield part
+
+            while True:
+                part = await fh.read(self.chunk_size)
+                if not part:
+                    break
+                yield part
+
+    def _send_to_fd(self, out_fd: int) -> int:
+        """
+        Writes the file data to `out_fd` with os.sendfile, so it never goes through python.
+        Crc is computed from a mmap of the file. Works only with NO_COMPRESSION, returns number of bytes written.
+        """
+        # the sample read by COMPRESSION_AUTO is small, it's just sent again with the rest
+        self._drop_held_data()
+        with open(self._file_path, 'rb') as file:
+            in_fd = file.fileno()
+            size = os.fstat(in_fd).st_size
+            if not size:
+                return 0
+            if not hasattr(os, "sendfile"):
+                return self._copy_to_fd(file, out_fd)
+
+            with mmap.mmap(in_fd, 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                offset = 0
+                try:
+                    for read_size in self._read_sizes(0, size):
+                        if self.known_crc is None:
+                            self.crc = zlib.crc32(view[offset:offset + read_size], self.crc)
+                        end = offset + read_size
+                        while offset < end:
+                            try:
+                                sent = os.sendfile(out_fd, in_fd, offset, end - offset)
+                            except OSError as e:
+                                # sendfile doesn't support this kind of out_fd
+                                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP) or offset:
+                                    raise
+                                self.crc = 0
+                                return self._copy_to_fd(file, out_fd)
+                            if not sent:
+                                raise ValueError(f"{self._file_path} got truncated while streaming.")
+                            offset += sent
+                finally:
+                    view.release()
+
+            self.original_size += size
+            self.compressed_size += size
+            if self.known_crc is not None:
+                self.crc = self.known_crc
+            return size
+
+    def _copy_to_fd(self, file, out_fd: int) -> int:
+        """
+        Fallback of _send_to_fd, reads the file into one reused buffer.
+        """
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        file.seek(0)
+        written = 0
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            self.crc = zlib.crc32(view[:read], self.crc)
+            sent = 0
+            while sent < read:
+                sent += os.write(out_fd, view[sent:read])
+            written += read
+
+        self.original_size += written
+        self.compressed_size += written
+        return written
+
     @property
     def name(self) -> str:
         return self._name
 
     @property
     def size(self) -> int:
-        return os.path.getsize(self._file_path)
+        return self._stat.st_size
 
     @property
     def modification_time(self) -> float:
-        return os.path.getmtime(self._file_path)
-
-    def get_mod_time(self) -> int:
-        # Extract hours, minutes, and seconds from the modification time
-        t = time.localtime(self.modification_time)
-        return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)) & 0xFFFF
-
-    def get_mod_date(self) -> int:
-        # Extract year, month, and day from the modification time
-        t = time.localtime(self.modification_time)
-        year = t.tm_year - 1980  # ZIP format years start from 1980
-        return ((year << 9) | (t.tm_mon << 5) | t.tm_mday) & 0xFFFF
+        return self._stat.st_mtime
+
+    def metadata_key(self):
+        if self.compression_method == consts.COMPRESSION_AUTO:
+            return None
+        # device and inode identify the file without resolving its path, that's a few syscalls per file less
+        return (self._stat.st_dev, self._stat.st_ino, self._stat.st_size, self._stat.st_mtime_ns,
+                self.compression_method, self.get_compression_level(), bool(self.compression_workers))
 
     def set_file_name(self, new_name: str) -> None:
         self._name = new_name
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+
+class MetadataCache(ABC):
+    """
+    Remembers crc and compressed size of files between archives.
+    Keys come from BaseFile.metadata_key(), for LocalFile that's (device, inode, size, mtime_ns, compression method, level, parallel),
+    so a changed file simply gets a new key.
+    """
+
+    @abstractmethod
+    def get(self, key: tuple) -> Optional[Tuple[int, int]]:
+        """
+        Returns (crc, compressed_size) or None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: tuple, crc: int, compressed_size: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: tuple) -> None:
+        raise NotImplementedError
+
+
+class MemoryMetadataCache(MetadataCache):
+    """
+    In memory LRU cache holding at most `max_entries` files.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, crc: int, compressed_size: int) -> None:
+        with self._lock:
+            self._entries[key] = (crc, compressed_size)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: tuple) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteMetadataCache(MetadataCache):
+    """
+    LRU cache in a sqlite database, so it survives restarts and can be shared by processes. Holds at most `max_entries` files.
+    Recency and the number of entries are kept in the database and changed in the same transaction as the entries,
+    so processes writing at the same time agree on them.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "key TEXT PRIMARY KEY, crc INTEGER NOT NULL, compressed_size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)")
+            # number of entries, kept by triggers, COUNT(*) would scan the whole table on every write
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'metadata_count'").fetchone() is None:
+                connection.execute("CREATE TABLE metadata_count (entries INTEGER NOT NULL)")
+                connection.execute("INSERT INTO metadata_count SELECT COUNT(*) FROM metadata")
+                connection.execute("CREATE TRIGGER metadata_insert AFTER INSERT ON metadata BEGIN UPDATE metadata_count SET entries = entries + 1; END")
+                connection.execute("CREATE TRIGGER metadata_delete AFTER DELETE ON metadata BEGIN UPDATE metadata_count SET entries = entries - 1; END")
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Write transaction, other processes wait (up to the sqlite timeout) until it's committed.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    @staticmethod
+    def _tick(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM metadata").fetchone()[0]
+
+    def get(self, key: tuple) -> Optional[Tuple[int, int]]:
+        with self._transaction() as connection:
+            row = connection.execute("SELECT crc, compressed_size FROM metadata WHERE key = ?", (repr(key),)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE metadata SET last_used = ? WHERE key = ?", (self._tick(connection), repr(key)))
+            return row[0], row[1]
+
+    def set(self, key: tuple, crc: int, compressed_size: int) -> None:
+        with self._transaction() as connection:
+            last_used = self._tick(connection)
+            # not INSERT OR REPLACE, its delete doesn't fire the trigger
+            if not connection.execute("UPDATE metadata SET crc = ?, compressed_size = ?, last_used = ? WHERE key = ?",
+                                      (crc, compressed_size, last_used, repr(key))).rowcount:
+                connection.execute("INSERT INTO metadata VALUES (?, ?, ?, ?)", (repr(key), crc, compressed_size, last_used))
+            count = connection.execute("SELECT entries FROM metadata_count").fetchone()[0]
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM metadata WHERE key IN (SELECT key FROM metadata ORDER BY last_used LIMIT ?)", (count - self.max_entries,)
+                )
+
+    def delete(self, key: tuple) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM metadata WHERE key = ?", (repr(key),))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT entries FROM metadata_count").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,163 @@
+from time import perf_counter
+from typing import Generator, AsyncGenerator, Iterator, AsyncIterator
+
+
+class EntryStats:
+    """
+    Numbers about one streamed entry, measured only when ZipFly has an observer.
+    Times are in seconds, they tell where a slow download spends its time:
+        source_time - waiting for data from the file (disk, network, generator),
+        compress_time - in compression and crc (Compressor.process and tail),
+        consumer_time - blocked on whoever takes the archive chunks.
+    With workers/prefetch, source and compress times are measured in the background, so they can overlap with consumer time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.offset = 0
+        self.compression_method = None
+        self.bytes_in = 0  # file data
+        self.compressed_size = 0
+        self.bytes_out = 0  # whole entry in the archive, with local file header and data descriptor
+        self.source_time = 0.0
+        self.compress_time = 0.0
+        self.consumer_time = 0.0
+        self.elapsed = 0.0
+        self._started = None
+
+    def __repr__(self):
+        return (f"EntryStats({self.name!r}, in={self.bytes_in}, out={self.bytes_out}, ratio={self.ratio:.3f}, source={self.source_time:.3f}s, "
+                f"compress={self.compress_time:.3f}s, consumer={self.consumer_time:.3f}s, elapsed={self.elapsed:.3f}s)")
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_size / self.bytes_in if self.bytes_in else 1.0
+
+    def start(self, offset: int) -> None:
+        self.offset = offset
+        self._started = perf_counter()
+
+    def set_consumer_time_from_rest(self) -> None:
+        """
+        For sinks that write themselves: whatever wasn't reading or compressing since start() was writing.
+        """
+        self.consumer_time = perf_counter() - self._started - self.source_time - self.compress_time
+
+    def finish(self, file, end_offset: int) -> None:
+        self.compression_method = file.compression_method
+        self.bytes_in = file.original_size
+        self.compressed_size = file.compressed_size
+        self.bytes_out = end_offset - self.offset
+        self.elapsed = perf_counter() - self._started
+
+    def time_source(self, chunks: Iterator[bytes]) -> Generator[bytes, None, None]:
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    self.source_time += perf_counter() - started
+                yield chunk
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    async def async_time_source(self, chunks: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self.source_time += perf_counter() - started
+                yield chunk
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+
+    def time_compressor(self, compressor) -> None:
+        """
+        Swaps process and tail of a Compressor with timed versions.
+        """
+        process, tail = compressor.process, compressor.tail
+
+        def timed_process(chunk):
+            started = perf_counter()
+            try:
+                return process(chunk)
+            finally:
+                self.compress_time += perf_counter() - started
+
+        def timed_tail():
+            started = perf_counter()
+            try:
+                return tail()
+            finally:
+                self.compress_time += perf_counter() - started
+
+        compressor.process = timed_process
+        compressor.tail = timed_tail
+
+
+class ArchiveStats:
+    """
+    Totals of a whole streamed archive, given to Observer.archive_end.
+    """
+
+    def __init__(self):
+        self.entries = 0
+        self.bytes_in = 0
+        self.compressed_size = 0
+        self.bytes_out = 0  # size of the archive
+        self.source_time = 0.0
+        self.compress_time = 0.0
+        self.consumer_time = 0.0  # including central directory
+        self.elapsed = 0.0
+        self._started = perf_counter()
+
+    def __repr__(self):
+        return (f"ArchiveStats(entries={self.entries}, in={self.bytes_in}, out={self.bytes_out}, ratio={self.ratio:.3f}, source={self.source_time:.3f}s, "
+                f"compress={self.compress_time:.3f}s, consumer={self.consumer_time:.3f}s, elapsed={self.elapsed:.3f}s)")
+
+    @property
+    def ratio(self) -> float:
+        return self.compressed_size / self.bytes_in if self.bytes_in else 1.0
+
+    def add(self, stats: EntryStats) -> None:
+        self.entries += 1
+        self.bytes_in += stats.bytes_in
+        self.compressed_size += stats.compressed_size
+        self.source_time += stats.source_time
+        self.compress_time += stats.compress_time
+        self.consumer_time += stats.consumer_time
+
+    def finish(self, archive_size: int) -> None:
+        self.bytes_out = archive_size
+        self.elapsed = perf_counter() - self._started
+
+
+class Observer:
+    """
+    Gets events while an archive is streamed. Subclass it and override what you need, all methods do nothing by default.
+    They're called from the streaming thread/task, so keep them quick.
+    """
+
+    def entry_start(self, file) -> None:
+        """
+        Called before local file header of `file` is streamed, file.offset is already set.
+        """
+
+    def entry_end(self, file, stats: EntryStats) -> None:
+        """
+        Called after the whole entry (with data descriptor) was taken by the consumer.
+        """
+
+    def archive_end(self, stats: ArchiveStats) -> None:
+        """
+        Called after the last byte of the archive was taken by the consumer.
+        """
@@ -0,0 +1,117 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Iterable, Tuple, Iterator, Callable
+
+from zipFly.BaseFile import BaseFile
+from zipFly.CompressionPolicy import CompressionPolicy
+
+
+class _FileBuffer:
+    def __init__(self):
+        self.chunks = deque()
+        self.size = 0
+        self.resolved = False  # compression method is picked
+        self.done = False
+        self.error = None
+
+
+class ParallelCompressor:
+    """
+    Compresses the next `workers` files ahead of time in a thread pool, while files are still given out in order.
+    zlib releases the GIL, so compression (and crc) of several files really runs on several cores.
+
+    Compressed data waiting to be streamed is capped at `max_buffer_size` bytes. A file with an empty buffer
+    can always put one chunk, so the file that is currently streamed never waits for the ones after it.
+    """
+
+    def __init__(self, files: Iterable[BaseFile], workers: int, max_buffer_size: int, compression_policy: CompressionPolicy,
+                 process: Callable[[BaseFile], Iterator[bytes]] = None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        self.files = files
+        self.workers = workers
+        self.max_buffer_size = max_buffer_size
+        self.compression_policy = compression_policy
+        self.process = process or BaseFile.generate_processed_file_data  # gives processed data of a file
+
+        self._condition = threading.Condition()
+        self._buffered = 0
+        self._closed = False
+
+    def _compress(self, file: BaseFile, buffer: _FileBuffer) -> None:
+        generator = self.process(file)
+        try:
+            file.choose_compression_method(self.compression_policy)
+            with self._condition:
+                buffer.resolved = True
+                self._condition.notify_all()
+
+            for chunk in generator:
+                with self._condition:
+                    while not self._closed and buffer.size and self._buffered + len(chunk) > self.max_buffer_size:
+                        self._condition.wait()
+                    if self._closed:
+                        return
+                    buffer.chunks.append(chunk)
+                    buffer.size += len(chunk)
+                    self._buffered += len(chunk)
+                    self._condition.notify_all()
+        except BaseException as e:
+            buffer.error = e
+        finally:
+            generator.close()
+            with self._condition:
+                buffer.done = True
+                self._condition.notify_all()
+
+    def _drain(self, buffer: _FileBuffer) -> Generator[bytes, None, None]:
+        while True:
+            with self._condition:
+                while not buffer.chunks and not buffer.done:
+                    self._condition.wait()
+                if buffer.chunks:
+                    chunk = buffer.chunks.popleft()
+                    buffer.size -= len(chunk)
+                    self._buffered -= len(chunk)
+                    self._condition.notify_all()
+                elif buffer.error is not None:
+                    raise buffer.error
+                else:
+                    return
+            yield chunk
+
+    def stream(self) -> Generator[Tuple[BaseFile, Iterator[bytes]], None, None]:
+        """
+        Yields (file, compressed data) pairs in the order of `files`. Compressed data has to be
+        consumed fully before moving to the next file, after that file's crc and sizes are final.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        buffers = deque()
+        files = iter(self.files)
+        files_left = True
+        try:
+            while buffers or files_left:
+                # keep `workers` files in flight
+                while files_left and len(buffers) < self.workers:
+                    file = next(files, None)
+                    if file is None:
+                        files_left = False
+                        break
+                    buffer = _FileBuffer()
+                    executor.submit(self._compress, file, buffer)
+                    buffers.append((file, buffer))
+                if not buffers:
+                    break
+
+                file, buffer = buffers.popleft()
+                # local file header needs the compression method
+                with self._condition:
+                    while not buffer.resolved and not buffer.done:
+                        self._condition.wait()
+                yield file, self._drain(buffer)
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            executor.shutdown(wait=True)
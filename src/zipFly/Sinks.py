@@ -0,0 +1,187 @@
+import os
+import stat
+from typing import Any, BinaryIO, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+# max number of buffers in one writev call
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+def _write_all(fd: int, data: bytes) -> int:
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += os.write(fd, view[written:])
+    return written
+
+
+def _writev_all(fd: int, buffers: list) -> int:
+    """
+    Writes all buffers with as few os.writev calls as possible, handles partial writes.
+    """
+    if not hasattr(os, "writev"):
+        return _write_all(fd, b"".join(buffers))
+
+    views = [memoryview(buffer) for buffer in buffers]
+    total = sum(len(view) for view in views)
+    first = 0
+    while first < len(views):
+        written = os.writev(fd, views[first:first + IOV_MAX])
+        # drop fully written buffers, and cut the partially written one
+        while first < len(views) and written >= len(views[first]):
+            written -= len(views[first])
+            first += 1
+        if written:
+            views[first] = views[first][written:]
+    return total
+
+
+class FdSink:
+    """
+    Collects chunks and writes them to `fd` with one os.writev call per `batch_size` bytes, instead of a write per chunk.
+    If `fd` is a regular file (not opened for appending), already written parts can be patched with os.pwrite.
+    """
+
+    def __init__(self, fd: int, batch_size: int):
+        self.fd = fd
+        self.batch_size = batch_size
+        self.written = 0
+        self.flushes = 0  # tells if something written before was flushed already
+        self._pending = []
+        self._pending_size = 0
+        self.start = self._start_position()  # where the archive starts in the file, None if it can't be patched
+
+    def _start_position(self) -> Optional[int]:
+        if not hasattr(os, "pwrite"):
+            return None
+        try:
+            if not stat.S_ISREG(os.fstat(self.fd).st_mode):
+                return None
+            # with O_APPEND linux ignores pwrite's offset
+            if fcntl is not None and fcntl.fcntl(self.fd, fcntl.F_GETFL) & os.O_APPEND:
+                return None
+            return os.lseek(self.fd, 0, os.SEEK_CUR)
+        except OSError:
+            return None
+
+    @property
+    def can_patch(self) -> bool:
+        return self.start is not None
+
+    def write(self, chunk: bytes) -> int:
+        if chunk:
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+            if self._pending_size >= self.batch_size or len(self._pending) >= IOV_MAX:
+                self.flush()
+        return len(chunk)
+
+    def flush(self) -> None:
+        if self._pending:
+            self.written += _writev_all(self.fd, self._pending)
+            self.flushes += 1
+            self._pending = []
+            self._pending_size = 0
+
+    def patch(self, offset: int, data: bytes) -> None:
+        """
+        Overwrites bytes at `offset` from the start of the archive, they have to be flushed already.
+        """
+        os.pwrite(self.fd, data, self.start + offset)
+
+
+class FileSink:
+    """
+    FdSink for file objects without a file descriptor (BytesIO, wrapped streams...), batches are written with writelines.
+    """
+
+    def __init__(self, fileobj: BinaryIO, batch_size: int):
+        self.fileobj = fileobj
+        self.batch_size = batch_size
+        self.written = 0
+        self.flushes = 0  # tells if something written before was flushed already
+        self._pending = []
+        self._pending_size = 0
+        self.start = None
+        if getattr(fileobj, "seekable", lambda: False)() and "a" not in getattr(fileobj, "mode", ""):
+            self.start = fileobj.tell()
+
+    @property
+    def can_patch(self) -> bool:
+        return self.start is not None
+
+    def write(self, chunk: bytes) -> int:
+        if chunk:
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+            if self._pending_size >= self.batch_size:
+                self.flush()
+        return len(chunk)
+
+    def flush(self) -> None:
+        if self._pending:
+            self.fileobj.writelines(self._pending)
+            self.written += self._pending_size
+            self.flushes += 1
+            self._pending = []
+            self._pending_size = 0
+
+    def patch(self, offset: int, data: bytes) -> None:
+        end = self.fileobj.tell()
+        self.fileobj.seek(self.start + offset)
+        self.fileobj.write(data)
+        self.fileobj.seek(end)
+
+
+class AsyncSink:
+    """
+    Batches chunks for an asyncio StreamWriter (writelines + drain, so a slow client slows down the stream)
+    or an ASGI `send` callable (one http.response.body message per batch).
+    """
+
+    def __init__(self, sink: Any, batch_size: int):
+        self.batch_size = batch_size
+        self.written = 0
+        self._pending = []
+        self._pending_size = 0
+        if hasattr(sink, "write") and hasattr(sink, "drain"):
+            self._writer = sink
+            self._send = None
+        elif callable(sink):
+            self._writer = None
+            self._send: Callable = sink
+        else:
+            raise ValueError(f"{sink} is neither an asyncio StreamWriter nor an ASGI send callable.")
+
+    async def write(self, chunk: bytes) -> int:
+        if chunk:
+            self._pending.append(chunk)
+            self._pending_size += len(chunk)
+            if self._pending_size >= self.batch_size:
+                await self.flush()
+        return len(chunk)
+
+    async def flush(self, more: bool = True) -> None:
+        if not self._pending and more:
+            return
+        if self._writer is not None:
+            self._writer.writelines(self._pending)
+            await self._writer.drain()
+        else:
+            await self._send({"type": "http.response.body", "body": b"".join(self._pending), "more_body": more})
+        self.written += self._pending_size
+        self._pending = []
+        self._pending_size = 0
+
+    async def close(self) -> None:
+        """
+        Writes what's left. ASGI gets the last body message with more_body=False, a StreamWriter is left open.
+        """
+        await self.flush(more=False)
@@ -0,0 +1,289 @@
+import threading
+import zlib
+from array import array
+from typing import AsyncGenerator, Dict, Generator, List, Tuple
+
+from zipFly import consts
+from zipFly.BaseFile import BaseFile
+from zipFly.EntryTable import EntryTable
+
+# kinds of pieces a part is made of
+SIGNATURE, LOCAL_FILE_HEADER, FILE_DATA, DATA_DESCRIPTOR, END_SECTION = range(5)
+
+
+class SplitLayout:
+    """
+    Places a known layout archive (see ZipFly.split) on disks of at most `part_size` bytes, the way Info-ZIP does:
+    only file data can continue on the next disk, headers, data descriptors and end records are never cut.
+    Offsets in central directory are relative to the start of the disk their local file header is on.
+
+    Every disk is a list of pieces (kind, file index, skip, count), so parts can be streamed separately and at the same time.
+    CRCs that aren't known are computed when a part needs them. Central directory and end records (end section)
+    are made once, by the first part that needs them.
+    """
+
+    def __init__(self, archive, files: List[BaseFile], part_size: int, crcs: Dict[str, int]):
+        self._archive = archive
+        self.files = files
+        self.part_size = part_size
+
+        self._crcs = {}
+        for i, file in enumerate(files):
+            if file.known_crc is not None:
+                self._crcs[i] = file.known_crc
+            elif file.name in crcs:
+                self._crcs[i] = crcs[file.name]
+
+        self._lock = threading.Lock()
+        self._end_section = None
+
+        self._place(signature=True)
+        if len(self.pieces) == 1:
+            # fits in one part, that's just a normal archive
+            self._place(signature=False)
+        if len(self.pieces) >= 0xFFFF:
+            raise ValueError(f"Archive would have {len(self.pieces)} parts, parts have to be bigger.")
+
+    def _place(self, signature: bool) -> None:
+        archive = self._archive
+        part_size = self.part_size
+        disks: List[List[Tuple[int, int, int, int]]] = [[]]
+        position = 0
+
+        def place(kind: int, index: int, size: int) -> Tuple[int, int]:
+            # whole record, goes to the next disk if it doesn't fit
+            nonlocal position
+            if size > part_size:
+                raise ValueError(f"A record of {size} bytes doesn't fit in parts of {part_size} bytes.")
+            if position + size > part_size:
+                disks.append([])
+                position = 0
+            start = position
+            pieces = disks[-1]
+            if kind == END_SECTION and pieces and pieces[-1][0] == END_SECTION:
+                # continues the previous piece of end section
+                _, _, skip, count = pieces[-1]
+                pieces[-1] = (END_SECTION, 0, skip, count + size)
+            else:
+                pieces.append((kind, index, self._end_section_size if kind == END_SECTION else 0, size))
+            if kind == END_SECTION:
+                self._end_section_size += size
+            position += size
+            return len(disks) - 1, start
+
+        def place_data(index: int, size: int) -> None:
+            nonlocal position
+            skip = 0
+            while skip < size:
+                if position == part_size:
+                    disks.append([])
+                    position = 0
+                count = min(size - skip, part_size - position)
+                disks[-1].append((FILE_DATA, index, skip, count))
+                position += count
+                skip += count
+
+        self._end_section_size = 0
+        self.disks = array("H")
+        self.offsets = array("Q")
+
+        if signature:
+            place(SIGNATURE, 0, len(consts.SPLIT_ARCHIVE_SIGNATURE))
+
+        for i, file in enumerate(self.files):
+            # decided here, data descriptors can be made before local file headers
+            file.zip64 = archive._needs_local_zip64(file)
+            disk, offset = place(LOCAL_FILE_HEADER, i, archive._local_file_header_size(file))
+            self.disks.append(disk)
+            self.offsets.append(offset)
+            place_data(i, file.size)
+            descriptor_size = archive._data_descriptor_size(file)
+            if descriptor_size:
+                place(DATA_DESCRIPTOR, i, descriptor_size)
+
+        # central directory file headers, with zip64 extra field only if sizes or offset don't fit
+        self.cdir_disk, self.cdir_offset = len(disks) - 1, position
+        header_disk, headers_on_disk = 0, 0
+        for i, file in enumerate(self.files):
+            size = consts.CENTRAL_DIR_FILE_HEADER_STRUCT.size + len(file.file_path_bytes)
+            if file.size >= 0xFFFFFFFF or self.offsets[i] >= 0xFFFFFFFF:
+                size += consts.ZIP64_EXTRA_FIELD_STRUCT.size
+            disk, offset = place(END_SECTION, i, size)
+            if i == 0:
+                self.cdir_disk, self.cdir_offset = disk, offset
+            if disk != header_disk:
+                header_disk, headers_on_disk = disk, 0
+            headers_on_disk += 1
+        self.cdir_size = self._end_section_size
+
+        # same decision as ZipBase._needs_zip64_end
+        self.zip64_end = len(self.files) >= 0xFFFF or self.cdir_size >= 0xFFFFFFFF or self.cdir_offset >= 0xFFFFFFFF
+        end_size = consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.size
+        if self.zip64_end:
+            end_size += consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_STRUCT.size + consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT.size
+        end_disk, self.end_offset = place(END_SECTION, 0, end_size)
+        if not self.files:
+            self.cdir_disk, self.cdir_offset = end_disk, self.end_offset
+        # end records have to say how many central directory headers are on their disk
+        self.last_disk_entries = headers_on_disk if header_disk == end_disk else 0
+
+        self.pieces = disks
+
+    # things parts are made of
+
+    def local_file_header(self, index: int) -> bytes:
+        return self._archive._make_local_file_header(self.files[index])
+
+    def file_data(self, index: int, skip: int, count: int) -> Generator[bytes, None, None]:
+        file = self.files[index]
+        # a part with the whole file computes its crc on the way, only if it isn't known yet
+        whole = skip == 0 and count == file.size and index not in self._crcs
+        crc = 0
+        chunks = file._generate_file_data_from(skip)
+        try:
+            for chunk in chunks:
+                if len(chunk) >= count:
+                    chunk = chunk[:count]
+                count -= len(chunk)
+                if whole:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+                if not count:
+                    break
+        finally:
+            chunks.close()
+        if count:
+            raise ValueError(f"{file} is smaller than its size, it got truncated.")
+        if whole:
+            self._crcs[index] = crc
+
+    async def async_file_data(self, index: int, skip: int, count: int) -> AsyncGenerator[bytes, None]:
+        file = self.files[index]
+        whole = skip == 0 and count == file.size and index not in self._crcs
+        crc = 0
+        chunks = file._async_generate_file_data_from(skip)
+        try:
+            async for chunk in chunks:
+                if len(chunk) >= count:
+                    chunk = chunk[:count]
+                count -= len(chunk)
+                if whole:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+                if not count:
+                    break
+        finally:
+            await chunks.aclose()
+        if count:
+            raise ValueError(f"{file} is smaller than its size, it got truncated.")
+        if whole:
+            self._crcs[index] = crc
+
+    def crc(self, index: int) -> int:
+        if index not in self._crcs:
+            # reading the whole file computes it
+            for _ in self.file_data(index, 0, self.files[index].size):
+                pass
+        return self._crcs[index]
+
+    async def async_crc(self, index: int) -> int:
+        if index not in self._crcs:
+            async for _ in self.async_file_data(index, 0, self.files[index].size):
+                pass
+        return self._crcs[index]
+
+    def data_descriptor(self, index: int, crc: int) -> bytes:
+        file = self.files[index]
+        descriptor_struct = consts.ZIP64_DATA_DESCRIPTOR_STRUCT if file.zip64 else consts.DATA_DESCRIPTOR_STRUCT
+        return descriptor_struct.pack(consts.ZIP64_DATA_DESCRIPTOR_SIGNATURE, crc, file.size, file.size)
+
+    def end_section(self) -> bytes:
+        if self._end_section is None:
+            for i in range(len(self.files)):
+                self.crc(i)
+            self._make_end_section()
+        return self._end_section
+
+    async def async_end_section(self) -> bytes:
+        if self._end_section is None:
+            for i in range(len(self.files)):
+                await self.async_crc(i)
+            self._make_end_section()
+        return self._end_section
+
+    def _make_end_section(self) -> None:
+        """
+        Central directory and end records, made by the archive with its disk fields set to this layout.
+        """
+        with self._lock:
+            if self._end_section is not None:
+                return
+            archive = self._archive
+            entries = EntryTable()
+            for i, file in enumerate(self.files):
+                file.crc = self._crcs[i]
+                file.original_size = file.compressed_size = file.size
+                file.offset = self.offsets[i]
+                entries.add(file, self.disks[i])
+
+            archive._entries = entries
+            archive._cdir_size = self.cdir_size
+            archive._offset_to_start_of_central_dir = self.cdir_offset
+            archive._disk_count = len(self.pieces)
+            archive._cdir_disk = self.cdir_disk
+            archive._last_disk_entries = self.last_disk_entries
+            archive._set_offset(self.end_offset)  # zip64 end of cdir locator points there
+
+            section = [archive._make_cdir_file_headers(0, len(entries))]
+            if self.zip64_end:
+                section.append(archive._make_zip64_end_of_cdir_record())
+                section.append(archive._make_zip64_end_of_cdir_locator())
+            section.append(archive._make_end_of_cdir_record())
+            self._end_section = b"".join(section)
+
+
+class SplitPart:
+    """
+    One part (disk) of a split archive. Parts don't depend on each other, they can be streamed
+    in any order and at the same time (in threads or tasks), every part reads only the files it needs.
+    Only parts with data descriptors or central directory of files with unknown CRCs have to read those files whole.
+    """
+
+    def __init__(self, layout: SplitLayout, number: int, name: str):
+        self._layout = layout
+        self.number = number  # disk number, starts with 0
+        self.name = name
+        self._pieces = layout.pieces[number]
+        self.size = sum(count for _, _, _, count in self._pieces)
+
+    def __repr__(self):
+        return f"SplitPart({self.name!r}, size={self.size})"
+
+    def stream(self) -> Generator[bytes, None, None]:
+        layout = self._layout
+        for kind, index, skip, count in self._pieces:
+            if kind == SIGNATURE:
+                yield consts.SPLIT_ARCHIVE_SIGNATURE
+            elif kind == LOCAL_FILE_HEADER:
+                yield layout.local_file_header(index)
+            elif kind == FILE_DATA:
+                yield from layout.file_data(index, skip, count)
+            elif kind == DATA_DESCRIPTOR:
+                yield layout.data_descriptor(index, layout.crc(index))
+            else:
+                yield layout.end_section()[skip:skip + count]
+
+    async def async_stream(self) -> AsyncGenerator[bytes, None]:
+        layout = self._layout
+        for kind, index, skip, count in self._pieces:
+            if kind == SIGNATURE:
+                yield consts.SPLIT_ARCHIVE_SIGNATURE
+            elif kind == LOCAL_FILE_HEADER:
+                yield layout.local_file_header(index)
+            elif kind == FILE_DATA:
+                async for chunk in layout.async_file_data(index, skip, count):
+                    yield chunk
+            elif kind == DATA_DESCRIPTOR:
+                yield layout.data_descriptor(index, await layout.async_crc(index))
+            else:
+                yield (await layout.async_end_section())[skip:skip + count]
@@ -1,8 +1,17 @@
-from collections import defaultdict
-from typing import List
+import struct
+from collections import defaultdict, deque
+from typing import List, Tuple, Union, Iterable, AsyncIterable, Generator, AsyncGenerator
 
 from zipFly import consts
 from zipFly.BaseFile import BaseFile
+from zipFly.Codecs import get_codec
+from zipFly.CompressionPolicy import CompressionPolicy
+from zipFly.CompressionScheduler import CompressionScheduler
+from zipFly.ContentCache import ContentCache
+from zipFly.EntryTable import EntryTable
+from zipFly.LayoutCache import LayoutCache
+from zipFly.MetadataCache import MetadataCache
+from zipFly.Observer import Observer
 
 """
 Since the Official ZIP docs are terrible, here's a detailed structure of the zip this library builds. (pretty sure mine's just as bad lol)
@@ -61,130 +70,333 @@ I hope, that i made it a bit more clear to anyone reading, including future me.
 """
 
 
-def process_file_names(files):
-    name_counts = defaultdict(int)
-    for file in files:
-        # Split the name into base and extension
-        base, ext = file.name.rsplit('.', 1) if '.' in file.name else (file.name, '')
+class FileNameDeduplicator:
+    """
+    Renames duplicate names one file at a time, so files can be processed as they come.
+    """
 
-        # Increment the count for this base name
-        name_counts[base] += 1
+    def __init__(self, used_names: Iterable[str] = ()):
+        self.used_names = set(used_names)
+        self.name_counts = defaultdict(int)  # last number appended to a name
 
-        # Append the count to the base name if it's not the first occurrence
-        if name_counts[base] > 1:
-            new_base = f"{base} ({name_counts[base] - 1})"
-        else:
-            new_base = base
+    def process(self, file: BaseFile) -> BaseFile:
+        # Only names that were used already are changed, to the first free "name (n).ext",
+        # so a name never depends on files with other names (a.txt doesn't rename a.jpg)
+        name = file.name
+        if name in self.used_names:
+            # Split the name into base and extension, only in the last part of the path
+            dot = name.rfind('.')
+            base, ext = (name[:dot], name[dot:]) if dot > name.rfind('/') + 1 else (name, '')
+
+            while name in self.used_names:
+                self.name_counts[file.name] += 1
+                name = f"{base} ({self.name_counts[file.name]}){ext}"
+            file.set_file_name(name)
 
-        # Reassemble the filename
-        file.set_file_name(f"{new_base}.{ext}" if ext else new_base)
+        self.used_names.add(name)
+        return file
+
+
+def process_file_names(files):
+    deduplicator = FileNameDeduplicator()
+    for file in files:
+        deduplicator.process(file)
 
     return files
 
 
 class ZipBase:
 
-    def __init__(self, files: List[BaseFile]):
+    def __init__(self, files: Union[List[BaseFile], Iterable[BaseFile], AsyncIterable[BaseFile]], compression_policy: CompressionPolicy = None, metadata_cache: MetadataCache = None,
+                 content_cache: ContentCache = None, observer: Observer = None, layout_cache: LayoutCache = None, deterministic: bool = False,
+                 scheduler: CompressionScheduler = None, priority: int = consts.PRIORITY_NORMAL):
         self.__version_to_extract = 45
 
-        # process file names to make sure there are no duplicates
-        processed_files = process_file_names(files)
-        self.files = processed_files
+        # same files (names, sizes, mtimes, methods) always give the same bytes: UTC timestamps, a fixed one for files without it,
+        # and no headers filled from MetadataCache (they'd drop data descriptors once crcs get cached)
+        self.deterministic = deterministic
+        if deterministic and isinstance(files, (list, tuple)):
+            for file in files:
+                file.deterministic = True
+
+        # headers and end structures of manifests streamed before
+        self.layout_cache = layout_cache
+        self._layout_key = None
+        self._layout = None
+        self._layout_builder = None  # records the layout while a cacheable manifest is streamed
+        if layout_cache is not None and isinstance(files, (list, tuple)):
+            self._layout_key = layout_cache.key(files)
+            if self._layout_key is not None:
+                self._layout = layout_cache.get(self._layout_key)
+
+        if isinstance(files, (list, tuple)):
+            # process file names to make sure there are no duplicates, also on a layout hit:
+            # stream_to, split, ranges and etag() use file names, not the cached headers
+            processed_files = process_file_names(files)
+            self.files = processed_files
+            self._manifest = None
+        else:
+            # lazy manifest (generator, async generator...), files are processed and forgotten as they're streamed,
+            # only self._entries is kept
+            self.files = None
+            self._manifest = files
+        self._deduplicator = FileNameDeduplicator()
 
         self.__offset = 0  # Tracks the current offset within the ZIP archive
+        self._entries = EntryTable()  # compact info about streamed files, for central directory
         self._cdir_size = 0
         self._offset_to_start_of_central_dir = 0
-        self.__version_made_by = 0x0345  # UNIX and ZIP version 45
+        # disks of split archives (see Split.py), a normal archive is just one disk
+        self._disk_count = 1
+        self._cdir_disk = 0  # disk where central directory starts, _offset_to_start_of_central_dir is relative to it
+        self._last_disk_entries = None  # central directory headers on the last disk, None means all of them
+        # central directory of the archive this one is appended to (see ZipFly.append_to), it goes before headers of self._entries
+        self._existing_cdir = b""
+        self._existing_entries = 0
+
+        # checkpoint bookkeeping: (entries, offset) after every finished entry, confirmed once the consumer took that many bytes
+        self._streamed = 0  # bytes taken by the consumer of stream()/async_stream()
+        self._entry_boundaries = deque()
+        self._confirmed_boundary = (0, 0)
+        self._resumed_entries = 0  # files skipped by resume(), they're already in self._entries
+        self.__version_made_by = 0x033F  # UNIX and ZIP version 63 (lzma and zstd need it, version needed is set per entry)
+
+        # picks compression method for files with COMPRESSION_AUTO
+        self.compression_policy = compression_policy or CompressionPolicy()
+        self.cpu_time_saved = 0.0  # estimated seconds of deflate saved by storing COMPRESSION_AUTO files
+
+        # deflated data of hot files, kept from previous archives
+        self.content_cache = content_cache
+
+        # gets per entry and archive stats while streaming, nothing is measured without it
+        self.observer = observer
+
+        # compression and crc on workers shared with other archives, instead of the thread (or event loop) that streams
+        self.scheduler = scheduler
+        self._lane = scheduler.lane(priority) if scheduler is not None else None
+
+        # crc and compressed sizes remembered from previous archives
+        self.metadata_cache = metadata_cache
+        if metadata_cache is not None and self.files is not None and self._layout is None:
+            for file in self.files:
+                self._load_metadata(file)
+
+    @staticmethod
+    def _needs_local_zip64(file: BaseFile) -> bool:
+        """
+        Whether sizes of a file may not fit in 4 bytes, decided before its data is read.
+        Then its local file header gets zip64 extra field, and its data descriptor is zip64.
+        """
+        if file.known_compressed_size is not None:
+            return file.size >= 0xFFFFFFFF or file.known_compressed_size >= 0xFFFFFFFF
+        try:
+            size = file.size
+        except ValueError:  # unknown
+            return True
+        # compressed data of incompressible files can be a bit bigger than the original
+        return size >= (0xFFFFFFFF if file.compression_method == consts.NO_COMPRESSION else 0xF0000000)
+
+    def _local_file_header_size(self, file: BaseFile) -> int:
+        size = consts.LOCAL_FILE_HEADER_STRUCT.size + len(file.file_path_bytes)
+        return size + consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size if self._needs_local_zip64(file) else size
+
+    def _data_descriptor_size(self, file: BaseFile) -> int:
+        if not file.uses_data_descriptor:
+            return 0
+        return consts.ZIP64_DATA_DESCRIPTOR_STRUCT.size if self._needs_local_zip64(file) else consts.DATA_DESCRIPTOR_STRUCT.size
 
     def _make_local_file_header(self, file: BaseFile) -> bytes:
         """
-        Create local file header for a ZIP64 archive   (4.3.7)
+        Create local file header   (4.3.7)
+        Zip64 extra field is added only for files that may not fit in 4 GiB.
         """
 
+        # encode the name first, it may turn on the utf-8 flag
+        file_path_bytes = file.file_path_bytes
+        # some methods need their own flags (end of stream marker of lzma)
+        file.flags |= get_codec(file.compression_method).flags
+        file.zip64 = self._needs_local_zip64(file)
+
         fields = {
             "signature": consts.LOCAL_FILE_HEADER_SIGNATURE,
-            "version_to_extract": self.__version_to_extract,
+            "version_to_extract": file.get_version_needed(file.zip64),
             "flags": file.flags,
             "compression": file.compression_method,
             "mod_time": file.get_mod_time(),
             "mod_date": file.get_mod_date(),
-            "crc": 0xFFFFFFFF,  # Placeholder (will be updated in data descriptor)
-            "uncompressed_size": 0xFFFFFFFF,  # Placeholder (will be updated in data descriptor)
-            "compressed_size": 0xFFFFFFFF,  # Placeholder (will be updated in data descriptor)
-            "file_name_len": len(file.file_path_bytes),
-            "extra_field_len": 0  # 0 cuz no extra field is used with local file header
+            "crc": 0,  # Placeholder (will be updated in data descriptor)
+            "compressed_size": 0xFFFFFFFF if file.zip64 else 0,  # Placeholder (will be updated in data descriptor)
+            "uncompressed_size": 0xFFFFFFFF if file.zip64 else 0,  # Placeholder (will be updated in data descriptor)
+            "file_name_len": len(file_path_bytes),
+            "extra_field_len": consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size if file.zip64 else 0
         }
 
+        # crc and sizes are known up front, no need for data descriptor
+        if not file.uses_data_descriptor:
+            fields["crc"] = file.known_crc
+            if not file.zip64:
+                fields["uncompressed_size"] = file.size
+                fields["compressed_size"] = file.known_compressed_size
+
         # Pack the local file header structure
         header = consts.LOCAL_FILE_HEADER_TUPLE(**fields)
         header = consts.LOCAL_FILE_HEADER_STRUCT.pack(*header)
-        header += file.file_path_bytes
+        header += file_path_bytes
+
+        if file.zip64:
+            known = not file.uses_data_descriptor
+            extra = consts.ZIP64_LOCAL_EXTRA_FIELD_TUPLE(consts.ZIP64_EXTRA_FIELD_SIGNATURE, consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size - 4,
+                                                         file.size if known else 0, file.known_compressed_size if known else 0)
+            header += consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.pack(*extra)
 
         return header
 
-    def _make_data_descriptor(self, file: BaseFile) -> bytes:
+    def _make_seekable_local_file_header(self, file: BaseFile, zip64: bool) -> bytearray:
         """
-        Create data descriptor.  (4.3.9)
+        Local file header for seekable output, without data descriptor. Crc and sizes that aren't known yet are 0,
+        they're patched in after the data (see _make_local_file_header_patches). With `zip64` sizes go to a zip64 extra field.
         """
+        file.flags &= ~consts.DATA_DESCRIPTOR_FLAG
+        file_path_bytes = file.file_path_bytes
+        file.flags |= get_codec(file.compression_method).flags
+        file.zip64 = zip64
 
-        fields = {
-            "signature": consts.ZIP64_DATA_DESCRIPTOR_SIGNATURE,
-            "crc": file.crc & 0xffffffff,  # hack for making CRC unsigned long
-            "uncompressed_size": file.original_size,
-            "compressed_size": file.compressed_size,
-        }
+        crc = file.known_crc or 0
+        size = file.size if file.known_crc is not None else 0
+        compressed_size = file.known_compressed_size or 0
 
-        descriptor = consts.ZIP64_DATA_DESCRIPTOR_TUPLE(**fields)
-        descriptor = consts.ZIP64_DATA_DESCRIPTOR_STRUCT.pack(*descriptor)
-
-        return descriptor
-
-    def _make_cdir_file_header(self, file: BaseFile) -> bytes:
-        """
-        Create central directory file header for ZIP64 archive.  (4.3.12)
-        """
         fields = {
-            "signature": consts.CENTRAL_DIR_FILE_HEADER_SIGNATURE,
-            "version_made_by": self.__version_made_by,
-            "version_to_extract": self.__version_to_extract,
+            "signature": consts.LOCAL_FILE_HEADER_SIGNATURE,
+            "version_to_extract": file.get_version_needed(zip64),
             "flags": file.flags,
             "compression": file.compression_method,
             "mod_time": file.get_mod_time(),
             "mod_date": file.get_mod_date(),
-            "crc": file.crc,
-            "compressed_size": 0xFFFFFFFF,  # Placeholder (will be updated in zip64 extra field)
-            "uncompressed_size": 0xFFFFFFFF,  # Placeholder (will be updated in zip64 extra field)
-            "file_name_len": len(file.file_path_bytes),
-            "extra_field_len": 28,
-            "file_comment_len": 0,
-            "disk_start": 0,
-            "internal_file_attr": 0,
-            "external_file_attr": 0,
-            "offset": 0xFFFFFFFF  # Placeholder (will be updated in zip64 extra field)
+            "crc": crc,
+            "uncompressed_size": 0xFFFFFFFF if zip64 else size,
+            "compressed_size": 0xFFFFFFFF if zip64 else compressed_size,
+            "file_name_len": len(file_path_bytes),
+            "extra_field_len": consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size if zip64 else 0
         }
 
-        cdfh = consts.CENTRAL_DIR_FILE_HEADER_TUPLE(**fields)
-        cdfh = consts.CENTRAL_DIR_FILE_HEADER_STRUCT.pack(*cdfh)
-        cdfh += file.file_path_bytes
+        header = consts.LOCAL_FILE_HEADER_TUPLE(**fields)
+        header = bytearray(consts.LOCAL_FILE_HEADER_STRUCT.pack(*header))
+        header += file_path_bytes
+        if zip64:
+            extra = consts.ZIP64_LOCAL_EXTRA_FIELD_TUPLE(consts.ZIP64_EXTRA_FIELD_SIGNATURE, consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size - 4,
+                                                         size, compressed_size)
+            header += consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.pack(*extra)
+
+        return header
 
-        return cdfh
+    @staticmethod
+    def _make_local_file_header_patches(file: BaseFile, zip64: bool) -> List[Tuple[int, bytes]]:
+        """
+        (offset in local file header, bytes) with real crc and sizes of a streamed file, for _make_seekable_local_file_header.
+        """
+        crc = file.crc & 0xFFFFFFFF
+        if not zip64:
+            if file.compressed_size >= 0xFFFFFFFF or file.original_size >= 0xFFFFFFFF:
+                raise ValueError(f"{file} turned out bigger than 4 GiB, but its local file header has no zip64 extra field.")
+            return [(consts.LOCAL_FILE_HEADER_CRC_OFFSET, consts.LOCAL_FILE_HEADER_CRC_STRUCT.pack(crc, file.compressed_size, file.original_size))]
+
+        extra_offset = consts.LOCAL_FILE_HEADER_STRUCT.size + len(file.file_path_bytes)
+        return [
+            (consts.LOCAL_FILE_HEADER_CRC_OFFSET, struct.pack("<L", crc)),
+            (extra_offset + 4, struct.pack("<QQ", file.original_size, file.compressed_size)),
+        ]
 
-    def _make_zip64_extra_field(self, file: BaseFile) -> bytes:
+    def _make_data_descriptor(self, file: BaseFile) -> bytes:
         """
-        Create the ZIP64 extra field.  (4.5.3)
+        Create data descriptor.  (4.3.9)
+        It's zip64 (with 8 byte sizes) only if local file header has zip64 extra field.
         """
+
         fields = {
-            "signature": consts.ZIP64_EXTRA_FIELD_SIGNATURE,
-            "extra_field_size": 24,
-            "size": file.original_size,
+            "signature": consts.ZIP64_DATA_DESCRIPTOR_SIGNATURE,
+            "crc": file.crc & 0xffffffff,  # hack for making CRC unsigned long
             "compressed_size": file.compressed_size,
-            "offset": file.offset,
+            "uncompressed_size": file.original_size,
         }
 
-        extra = consts.ZIP64_EXTRA_FIELD_TUPLE(**fields)
-        extra = consts.ZIP64_EXTRA_FIELD_STRUCT.pack(*extra)
+        descriptor = consts.ZIP64_DATA_DESCRIPTOR_TUPLE(**fields)
+        if file.zip64:
+            return consts.ZIP64_DATA_DESCRIPTOR_STRUCT.pack(*descriptor)
+
+        if file.compressed_size >= 0xFFFFFFFF or file.original_size >= 0xFFFFFFFF:
+            raise ValueError(f"{file} turned out bigger than 4 GiB, but its local file header has no zip64 extra field.")
+        return consts.DATA_DESCRIPTOR_STRUCT.pack(*descriptor)
 
-        return extra
+    def _entry_needs_zip64(self, index: int) -> bool:
+        entries = self._entries
+        return entries.compressed_sizes[index] >= 0xFFFFFFFF or entries.uncompressed_sizes[index] >= 0xFFFFFFFF or entries.offsets[index] >= 0xFFFFFFFF
+
+    def _make_cdir_file_headers(self, start: int, stop: int) -> bytes:
+        """
+        Create central directory file headers (4.3.12) of entries start:stop of self._entries, packed
+        straight into one preallocated buffer instead of one by one, which matters with millions of files.
+        Entries with sizes and offset that fit in 4 bytes get classic headers. The rest get 0xFFFFFFFF placeholders
+        for all three and a zip64 extra field (4.5.3) with the real values, and version needed of at least 4.5.
+        """
+        entries = self._entries
+        header_struct = consts.CENTRAL_DIR_FILE_HEADER_STRUCT
+        extra_struct = consts.ZIP64_EXTRA_FIELD_STRUCT
+
+        zip64 = [self._entry_needs_zip64(i) for i in range(start, stop)]
+        names = memoryview(entries.names)
+        name_start = entries.name_start(start)
+        names_size = entries.name_ends[stop - 1] - name_start if stop > start else 0
+        buffer = bytearray((stop - start) * header_struct.size + sum(zip64) * extra_struct.size + names_size)
+
+        position = 0
+        for i in range(start, stop):
+            name_end = entries.name_ends[i]
+            name_len = name_end - name_start
+            entry_zip64 = zip64[i - start]
+
+            if entry_zip64:
+                version_needed = max(consts.ZIP64_VERSION, entries.versions_needed[i])
+                compressed_size = uncompressed_size = offset = 0xFFFFFFFF  # Placeholders (will be updated in zip64 extra field)
+            else:
+                version_needed = entries.versions_needed[i]
+                compressed_size, uncompressed_size, offset = entries.compressed_sizes[i], entries.uncompressed_sizes[i], entries.offsets[i]
+
+            header_struct.pack_into(
+                buffer, position,
+                consts.CENTRAL_DIR_FILE_HEADER_SIGNATURE, self.__version_made_by, version_needed,
+                entries.flags[i], entries.compression_methods[i], entries.mod_times[i], entries.mod_dates[i], entries.crcs[i],
+                compressed_size, uncompressed_size,
+                name_len, extra_struct.size if entry_zip64 else 0, 0, entries.disks[i], 0, 0,
+                offset
+            )
+            position += header_struct.size
+
+            buffer[position:position + name_len] = names[name_start:name_end]
+            position += name_len
+
+            if entry_zip64:
+                extra_struct.pack_into(
+                    buffer, position,
+                    consts.ZIP64_EXTRA_FIELD_SIGNATURE, extra_struct.size - 4,
+                    entries.uncompressed_sizes[i], entries.compressed_sizes[i], entries.offsets[i]
+                )
+                position += extra_struct.size
+            name_start = name_end
+
+        names.release()
+        return bytes(buffer)  # consumers (web frameworks) only take bytes
+
+    def _needs_zip64_end(self) -> bool:
+        """
+        Zip64 end of cdir record and locator are needed if counts, size or offset of cdir don't fit in end of cdir record.
+        """
+        return self._entry_count() >= 0xFFFF or self._cdir_size >= 0xFFFFFFFF or self._offset_to_start_of_central_dir >= 0xFFFFFFFF
+
+    def _entry_count(self) -> int:
+        return self._existing_entries + len(self._entries)
+
+    def _entries_on_last_disk(self) -> int:
+        return self._entry_count() if self._last_disk_entries is None else self._last_disk_entries
 
     def _make_zip64_end_of_cdir_record(self) -> bytes:
         """
@@ -195,10 +407,10 @@ class ZipBase:
             "size_of_zip64_end_of_cdir_record": 44,  # 44 bytes for the ZIP64 end of central directory record itself
             "version_made_by": self.__version_made_by,
             "version_to_extract": self.__version_to_extract,
-            "number_of_this_disk": 0,
-            "cd_start": 0,
-            "cd_entries_this_disk": len(self.files),
-            "cd_entries_total": len(self.files),
+            "number_of_this_disk": self._disk_count - 1,
+            "cd_start": self._cdir_disk,
+            "cd_entries_this_disk": self._entries_on_last_disk(),
+            "cd_entries_total": self._entry_count(),
             "cd_size": self._cdir_size,
             "cd_offset": self._offset_to_start_of_central_dir
         }
@@ -214,9 +426,9 @@ class ZipBase:
         """
         fields = {
             "signature": consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_SIGNATURE,
-            "disk_with_zip64_end": 0,
+            "disk_with_zip64_end": self._disk_count - 1,
             "zip64_end_offset": self.__offset,
-            "total_disks": 1
+            "total_disks": self._disk_count
         }
 
         locator = consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_TUPLE(**fields)
@@ -231,26 +443,88 @@ class ZipBase:
         """
         fields = {
             "signature": consts.END_OF_CENTRAL_DIR_RECORD_SIGNATURE,
-            "number_of_this_disk": 0,
-            "number_of_disk_with_start_central_dir": 0,
-            "total_entries_on_this_disk": len(self.files),
-            "total_entries_total": len(self.files),
-            "central_directory_size": 0xFFFFFFFF,
-            "offset_of_central_directory": 0xFFFFFFFF,
+            "number_of_this_disk": self._disk_count - 1,
+            "number_of_disk_with_start_central_dir": self._cdir_disk,
+            "total_entries_on_this_disk": min(self._entries_on_last_disk(), 0xFFFF),
+            "total_entries_total": min(self._entry_count(), 0xFFFF),
+            "central_directory_size": 0xFFFFFFFF,  # Placeholder (it's in zip64 end of cdir record)
+            "offset_of_central_directory": 0xFFFFFFFF,  # Placeholder (it's in zip64 end of cdir record)
             "comment_length": 0  # No comment
         }
 
+        if not self._needs_zip64_end():
+            fields["central_directory_size"] = self._cdir_size
+            fields["offset_of_central_directory"] = self._offset_to_start_of_central_dir
+
         eocd = consts.END_OF_CENTRAL_DIR_RECORD_TUPLE(**fields)
         eocd = consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.pack(*eocd)
 
         return eocd
 
+    def _require_files(self) -> List[BaseFile]:
+        if self.files is None:
+            raise ValueError("This needs all files up front, it can't be done with a lazy manifest.")
+        return self.files
+
+    def _prepare_lazy_file(self, file: BaseFile) -> BaseFile:
+        file.deterministic = self.deterministic
+        self._deduplicator.process(file)
+        if self.metadata_cache is not None:
+            self._load_metadata(file)
+        return file
+
+    def _iter_files(self) -> Generator[BaseFile, None, None]:
+        if self.files is not None:
+            yield from self.files
+            return
+        if not isinstance(self._manifest, Iterable):
+            raise ValueError("Async manifest can only be streamed with async_stream().")
+        for file in self._manifest:
+            yield self._prepare_lazy_file(file)
+
+    async def _async_iter_files(self) -> AsyncGenerator[BaseFile, None]:
+        if self.files is not None:
+            for file in self.files:
+                yield file
+        elif isinstance(self._manifest, AsyncIterable):
+            async for file in self._manifest:
+                yield self._prepare_lazy_file(file)
+        else:
+            for file in self._manifest:
+                yield self._prepare_lazy_file(file)
+
+    def _load_metadata(self, file: BaseFile) -> None:
+        if self.deterministic:
+            return
+        key = file.metadata_key()
+        if key is None:
+            return
+        cached = self.metadata_cache.get(key)
+        if cached is not None:
+            file.set_known_metadata(*cached)
+
+    def _save_metadata(self, file: BaseFile) -> None:
+        """
+        Remembers crc and compressed size of a streamed file, or checks them if they were known up front.
+        """
+        if self.metadata_cache is None:
+            return
+        key = file.metadata_key()
+        if key is None:
+            return
+
+        if file.known_crc is None:
+            self.metadata_cache.set(key, file.crc & 0xFFFFFFFF, file.compressed_size)
+        elif file.original_size != file.size or file.compressed_size != file.known_compressed_size:
+            # already sent headers are wrong, nothing to do but stop
+            self.metadata_cache.delete(key)
+            raise ValueError(f"{file} doesn't match its cached metadata, it probably changed without changing its mtime.")
+
     def _add_offset(self, value: int) -> None:
         self.__offset += value
 
     def _get_offset(self) -> int:
         return self.__offset
 
-
-
-
+    def _set_offset(self, value: int) -> None:
+        self.__offset = value
@@ -1,34 +1,239 @@
-from typing import Generator, AsyncGenerator
+import hashlib
+import io
+import os
+import socket
+import zlib
+from time import perf_counter
+from typing import Any, BinaryIO, Generator, AsyncGenerator, Dict, Iterable, AsyncIterable, Iterator, AsyncIterator, List, Optional, Tuple, Union
+
+from zipFly import BaseFile, consts
+from zipFly.AsyncPrefetcher import AsyncPrefetcher
+from zipFly.CentralDirectory import CentralDirectory
+from zipFly.Checkpoint import Checkpoint
+from zipFly.EntryTable import EntryTable
+from zipFly.LayoutCache import ArchiveLayout, LayoutBuilder
+from zipFly.LocalFile import LocalFile
+from zipFly.Observer import EntryStats, ArchiveStats
+from zipFly.ParallelCompressor import ParallelCompressor
+from zipFly.Sinks import FdSink, FileSink, AsyncSink
+from zipFly.Split import SplitLayout, SplitPart
+from zipFly.ZipBase import ZipBase, FileNameDeduplicator
+
+
+def _overlap(part_start: int, part_end: int, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns (skip, count) of the part [part_start, part_end) that lands in range [start, end), or None.
+    """
+    if part_end <= start or part_start >= end:
+        return None
+    skip = max(start - part_start, 0)
+    return skip, min(end, part_end) - part_start - skip
+
+
+def _slice_chunks(chunks: Iterable[bytes], skip: int, count: int) -> Generator[bytes, None, None]:
+    """
+    Yields `count` bytes after skipping `skip` bytes. Always drains `chunks` till the end.
+    """
+    position = 0
+    for chunk in chunks:
+        chunk_start = position
+        position += len(chunk)
+        piece = chunk[max(skip - chunk_start, 0):max(skip + count - chunk_start, 0)]
+        if piece:
+            yield piece
+
+
+async def _async_slice_chunks(chunks: AsyncIterable[bytes], skip: int, count: int) -> AsyncGenerator[bytes, None]:
+    position = 0
+    async for chunk in chunks:
+        chunk_start = position
+        position += len(chunk)
+        piece = chunk[max(skip - chunk_start, 0):max(skip + count - chunk_start, 0)]
+        if piece:
+            yield piece
+
+
+def _take_chunks(chunks: Generator[bytes, None, None], count: int) -> Generator[bytes, None, None]:
+    """
+    Yields first `count` bytes and stops reading.
+    """
+    try:
+        for chunk in chunks:
+            if len(chunk) >= count:
+                yield chunk[:count]
+                return
+            count -= len(chunk)
+            yield chunk
+    finally:
+        chunks.close()
+
+
+async def _async_take_chunks(chunks: AsyncGenerator[bytes, None], count: int) -> AsyncGenerator[bytes, None]:
+    try:
+        async for chunk in chunks:
+            if len(chunk) >= count:
+                yield chunk[:count]
+                return
+            count -= len(chunk)
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+def _drop_chunks(chunks: Iterable[bytes], count: int) -> Generator[bytes, None, None]:
+    """
+    Skips first `count` bytes, yields the rest.
+    """
+    for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk[count:] if count else chunk
+        count = 0
+
+
+async def _async_drop_chunks(chunks: AsyncIterable[bytes], count: int) -> AsyncGenerator[bytes, None]:
+    async for chunk in chunks:
+        if count >= len(chunk):
+            count -= len(chunk)
+            continue
+        yield chunk[count:] if count else chunk
+        count = 0
+
+
+def _rechunk(chunks: Iterable[bytes], chunk_size: int) -> Generator[bytes, None, None]:
+    """
+    Glues small chunks together and splits big ones, so that every chunk (except the last one) is exactly `chunk_size` bytes.
+    Big chunks are sliced with memoryview, so only the yielded slices are copied (into bytes, consumers can keep them).
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        view = memoryview(chunk)
+        if buffer:
+            needed = chunk_size - len(buffer)
+            buffer += view[:needed]
+            view = view[needed:]
+            if len(buffer) < chunk_size:
+                continue
+            yield bytes(buffer)
+            buffer = bytearray()
+
+        while len(view) >= chunk_size:
+            yield bytes(view[:chunk_size])
+            view = view[chunk_size:]
+        buffer += view
+
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _async_rechunk(chunks: AsyncIterable[bytes], chunk_size: int) -> AsyncGenerator[bytes, None]:
+    buffer = bytearray()
+    async for chunk in chunks:
+        view = memoryview(chunk)
+        if buffer:
+            needed = chunk_size - len(buffer)
+            buffer += view[:needed]
+            view = view[needed:]
+            if len(buffer) < chunk_size:
+                continue
+            yield bytes(buffer)
+            buffer = bytearray()
+
+        while len(view) >= chunk_size:
+            yield bytes(view[:chunk_size])
+            view = view[chunk_size:]
+        buffer += view
+
+    if buffer:
+        yield bytes(buffer)
 
-from zipFly import BaseFile
-from zipFly.ZipBase import ZipBase
 
 class ZipFly(ZipBase):
+    # number of central directory file headers packed into one chunk
+    CDIR_BATCH_SIZE = 16384
+    # smaller stored LocalFiles are read and batched with other writes in stream_to_fd, instead of a separate os.sendfile
+    SENDFILE_MIN_SIZE = 256 * 1024
+    # version of the archive layout, it's a part of etags, so they change when the same files would give different bytes
+    LAYOUT_VERSION = 1
+
+    @classmethod
+    def from_tree(cls, directory: str, prefix: str = "", include: Iterable[str] = None, exclude: Iterable[str] = None,
+                  stat_workers: int = 0, compression_method: int = None, **kwargs) -> "ZipFly":
+        """
+        Archive of all files in `directory`, see LocalFile.from_directory. Other kwargs are passed to ZipFly.
+        """
+        files = list(LocalFile.from_directory(directory, prefix=prefix, include=include, exclude=exclude,
+                                              stat_workers=stat_workers, compression_method=compression_method))
+        return cls(files, **kwargs)
+
+    def etag(self) -> str:
+        """
+        Strong ETag (with quotes) of the archive stream() gives, computed only from metadata of files:
+        names, sizes, modification times, compression methods and levels. Nothing is read or compressed.
+        Needs deterministic=True, otherwise the same files don't give the same bytes.
+        Like any metadata based validator, it relies on files changing their size or mtime when their content changes.
+        """
+        if not self.deterministic:
+            raise ValueError("etag() needs ZipFly(..., deterministic=True).")
+        files = self._require_files()
+
+        digest = hashlib.sha256()
+        digest.update(repr((self.LAYOUT_VERSION, zlib.ZLIB_RUNTIME_VERSION, len(files))).encode())
+        if any(file.compression_auto for file in files):
+            policy = self.compression_policy
+            digest.update(repr((sorted(policy.stored_extensions), policy.sample_size, policy.min_ratio, policy.level, policy.method)).encode())
+        for file in files:
+            try:
+                size = file.size
+            except ValueError:  # GenFile without size
+                size = None
+            # streaming replaces the method of AUTO files by the chosen one, hash what was asked for
+            if file.compression_auto:
+                method, level = consts.COMPRESSION_AUTO, file.compression_level
+            else:
+                method, level = file.compression_method, file.get_compression_level()
+            digest.update(repr((file.name, size, file.modification_time, method, level, bool(file.compression_workers))).encode())
+        return f'"{digest.hexdigest()[:40]}"'
+
+    def last_modified(self) -> float:
+        """
+        Latest modification time of files (epoch seconds), for Last-Modified header: email.utils.formatdate(t, usegmt=True).
+        """
+        return max((file.modification_time for file in self._require_files()), default=consts.DETERMINISTIC_MODIFICATION_TIME)
 
     def calculate_archive_size(self) -> int:
-        LOCAL_FILE_HEADER_SIZE = 30
-        DATA_DESCRIPTOR_SIZE = 24
-        CENTRAL_DIR_HEADER_SIZE = 46
-        ZIP64_EXTRA_FIELD_SIZE = 28
-        ZIP64_END_OF_CDIR_RECORD_SIZE = 56
-        ZIP64_END_OF_CDIR_LOCATOR_SIZE = 20
-        END_OF_CDIR_RECORD_CD_RECORD_SIZE = 22
+        """
+        Exact size of the archive stream() gives. Compressed files need known compressed size (from MetadataCache),
+        otherwise their original size is used.
+        Follows the same zip64 decisions as streaming: zip64 structures are counted only where values don't fit.
+        """
+        CENTRAL_DIR_HEADER_SIZE = consts.CENTRAL_DIR_FILE_HEADER_STRUCT.size
+        ZIP64_EXTRA_FIELD_SIZE = consts.ZIP64_EXTRA_FIELD_STRUCT.size
+        ZIP64_END_OF_CDIR_RECORD_SIZE = consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_STRUCT.size
+        ZIP64_END_OF_CDIR_LOCATOR_SIZE = consts.ZIP64_END_OF_CENTRAL_DIR_LOCATOR_STRUCT.size
+        END_OF_CDIR_RECORD_CD_RECORD_SIZE = consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.size
 
+        files = self._require_files()
         total_size = 0
+        cdir_size = 0
 
-        for file in self.files:
-            local_file_header_size = LOCAL_FILE_HEADER_SIZE + len(file.file_path_bytes)
-
-            total_size += local_file_header_size
-            total_size += file.size
-            total_size += DATA_DESCRIPTOR_SIZE
+        for file in files:
+            file_offset = total_size
+            compressed_size = file.known_compressed_size if file.known_compressed_size is not None else file.size
 
-            central_directory_header_size = CENTRAL_DIR_HEADER_SIZE + len(file.file_path_bytes) + ZIP64_EXTRA_FIELD_SIZE
+            total_size += self._local_file_header_size(file)
+            total_size += compressed_size
+            total_size += self._data_descriptor_size(file)
 
-            total_size += central_directory_header_size
+            cdir_size += CENTRAL_DIR_HEADER_SIZE + len(file.file_path_bytes)
+            if compressed_size >= 0xFFFFFFFF or file.size >= 0xFFFFFFFF or file_offset >= 0xFFFFFFFF:
+                cdir_size += ZIP64_EXTRA_FIELD_SIZE
 
-        total_size += ZIP64_END_OF_CDIR_RECORD_SIZE
-        total_size += ZIP64_END_OF_CDIR_LOCATOR_SIZE
+        if len(files) >= 0xFFFF or cdir_size >= 0xFFFFFFFF or total_size >= 0xFFFFFFFF:
+            total_size += ZIP64_END_OF_CDIR_RECORD_SIZE
+            total_size += ZIP64_END_OF_CDIR_LOCATOR_SIZE
+        total_size += cdir_size
         total_size += END_OF_CDIR_RECORD_CD_RECORD_SIZE
 
         return total_size
@@ -45,66 +250,743 @@ class ZipFly(ZipBase):
         # Save offset to start of central dir for zip64 end of cdir record
         self._offset_to_start_of_central_dir = self._get_offset()
 
-        # Stream central directory entries
-        for file in self.files:
-            chunk = self._make_cdir_file_header(file)
-            chunk += self._make_zip64_extra_field(file)
-            self._cdir_size = len(chunk)
+        # headers of entries that were in the archive before append_to()
+        if self._existing_cdir:
+            self._cdir_size += len(self._existing_cdir)
+            self._add_offset(len(self._existing_cdir))
+            yield self._existing_cdir
+
+        # Stream central directory entries, packed in batches
+        for start in range(0, len(self._entries), self.CDIR_BATCH_SIZE):
+            chunk = self._make_cdir_file_headers(start, min(start + self.CDIR_BATCH_SIZE, len(self._entries)))
+            self._cdir_size += len(chunk)
             self._add_offset(len(chunk))
 
             yield chunk
 
-        yield self._make_zip64_end_of_cdir_record()
+        if self._needs_zip64_end():
+            yield self._make_zip64_end_of_cdir_record()
 
-        yield self._make_zip64_end_of_cdir_locator()
+            yield self._make_zip64_end_of_cdir_locator()
 
         yield self._make_end_of_cdir_record()
 
-    async def _async_stream_single_file(self, file: BaseFile) -> AsyncGenerator[bytes, None]:
+    async def _async_stream_single_file(self, file: BaseFile, data: AsyncIterator[bytes] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of _stream_single_file
+        """
+        await file.async_choose_compression_method(self.compression_policy)
 
-        yield self._make_local_file_header(file)
+        header = self._make_local_file_header(file)
+        yield header
 
-        async for chunk in file.async_generate_processed_file_data():
+        async for chunk in data if data is not None else self._async_process_file(file):
             yield chunk
 
-        yield self._make_data_descriptor(file)
+        self._count_saved_compression(file)
+        self._save_metadata(file)
+        self._entries.add(file)
+        descriptor = self._make_data_descriptor(file) if file.uses_data_descriptor else b""
+        if self._layout_builder is not None:
+            self._layout_builder.add(header, descriptor)
+        if descriptor:
+            yield descriptor
 
-    async def async_stream(self) -> AsyncGenerator[bytes, None]:
-        # stream files
-        for file in self.files:
+    async def _async_stream_file_from_layout(self, file: BaseFile, data: Optional[AsyncIterator[bytes]], layout: ArchiveLayout, index: int) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of _stream_file_from_layout
+        """
+        yield layout.local_file_header(index)
 
-            file.offset = self._get_offset()
-            async for chunk in self._async_stream_single_file(file):
-                self._add_offset(len(chunk))
-                yield chunk
+        async for chunk in data if data is not None else self._async_process_file(file):
+            yield chunk
 
-        # stream zip structures
-        for chunk in self._make_end_structures():
+        self._check_layout(file, layout, index)
+        descriptor = layout.data_descriptor(index)
+        if descriptor:
+            yield descriptor
+
+    def _process_file(self, file: BaseFile) -> Generator[bytes, None, None]:
+        if self.content_cache is not None:
+            return self.content_cache.stream(file, self._lane)
+        return file.generate_processed_file_data(self._lane)
+
+    def _async_process_file(self, file: BaseFile) -> AsyncGenerator[bytes, None]:
+        if self.content_cache is not None:
+            return self.content_cache.async_stream(file, self._lane)
+        return file.async_generate_processed_file_data(self._lane)
+
+    def _count_saved_compression(self, file: BaseFile) -> None:
+        if file.compression_auto and file.compression_method == consts.NO_COMPRESSION:
+            self.cpu_time_saved += self.compression_policy.estimate_cpu_time(file.original_size)
+
+    async def async_stream(self, chunk_size: int = None, prefetch: int = 0, max_buffer_size: int = 64 * 1024 * 1024) -> AsyncGenerator[bytes, None]:
+        """
+        Streams the archive. With `chunk_size` the output is glued/split into chunks of exactly that size (except the last one).
+        With `prefetch` > 0 data of the next `prefetch` files is pulled while the current one is streamed,
+        holding at most `max_buffer_size` bytes that weren't streamed yet.
+        """
+        async for chunk in self._async_deliver(self._async_stream(prefetch, max_buffer_size), chunk_size):
+            yield chunk
+
+    async def _async_deliver(self, chunks: AsyncIterable[bytes], chunk_size: Optional[int], skip: int = 0) -> AsyncGenerator[bytes, None]:
+        if skip:
+            chunks = _async_drop_chunks(chunks, skip)
+        if chunk_size:
+            chunks = _async_rechunk(chunks, chunk_size)
+        async for chunk in chunks:
             yield chunk
+            self._streamed += len(chunk)
+            self._confirm_entry_boundaries()
+
+    async def _async_stream(self, prefetch: int, max_buffer_size: int) -> AsyncGenerator[bytes, None]:
+        files = self._async_iter_files()
+        if self._resumed_entries:
+            files = self._async_skip_resumed(files)
+        layout = self._start_layout()
+        if self.observer is not None:
+            archive_stats = ArchiveStats()
+            files = self._async_with_stats(files)
+
+        if prefetch:
+            files = AsyncPrefetcher(files, prefetch, max_buffer_size, self.compression_policy, self._async_process_file).stream()
+        else:
+            files = ((file, None) async for file in files)
 
-    def stream(self) -> Generator[bytes, None, None]:
         # stream files
-        for file in self.files:
-            print("offset")
-            print(self._get_offset())
-            file.offset = self._get_offset()
-            for chunk in self._stream_single_file(file):
-                self._add_offset(len(chunk))
-                yield chunk
+        index = self._resumed_entries
+        try:
+            async for file, data in files:
+                file.offset = self._get_offset()
+                if layout is not None:
+                    chunks = self._async_stream_file_from_layout(file, data, layout, index)
+                else:
+                    chunks = self._async_stream_single_file(file, data)
+                if self.observer is not None:
+                    chunks = self._async_observe_entry(file, chunks, archive_stats)
+                async for chunk in chunks:
+                    self._add_offset(len(chunk))
+                    yield chunk
+                index += 1
+                self._entry_boundaries.append((index, self._get_offset()))
+        finally:
+            # cancels prefetching tasks as soon as streaming fails or is abandoned
+            await files.aclose()
 
         # stream zip structures
-        for chunk in self._make_end_structures():
+        chunks = self._end_structures(layout)
+        if self.observer is not None:
+            chunks = self._observe_end(chunks, archive_stats)
+        for chunk in chunks:
+            yield chunk
+
+    def stream(self, workers: int = 0, max_buffer_size: int = 64 * 1024 * 1024, chunk_size: int = None) -> Generator[bytes, None, None]:
+        """
+        Streams the archive. With `workers` > 0 the next `workers` files are compressed ahead of time
+        in a thread pool, holding at most `max_buffer_size` bytes of compressed data that wasn't streamed yet.
+        With `chunk_size` the output is glued/split into chunks of exactly that size (except the last one),
+        so the consumer does a few big writes instead of thousands of tiny ones.
+        """
+        yield from self._deliver(self._stream(workers, max_buffer_size), chunk_size)
+
+    def _deliver(self, chunks: Iterable[bytes], chunk_size: Optional[int], skip: int = 0) -> Generator[bytes, None, None]:
+        """
+        Drops first `skip` bytes, rechunks, and counts what the consumer took (for checkpoints).
+        """
+        if skip:
+            chunks = _drop_chunks(chunks, skip)
+        if chunk_size:
+            chunks = _rechunk(chunks, chunk_size)
+        for chunk in chunks:
             yield chunk
+            self._streamed += len(chunk)
+            self._confirm_entry_boundaries()
+
+    def _stream(self, workers: int, max_buffer_size: int) -> Generator[bytes, None, None]:
+        files = self._iter_files()
+        if self._resumed_entries:
+            files = self._skip_resumed(files)
+        layout = self._start_layout()
+        if self.observer is not None:
+            archive_stats = ArchiveStats()
+            files = self._with_stats(files)
+
+        if workers:
+            files = ParallelCompressor(files, workers, max_buffer_size, self.compression_policy, self._process_file).stream()
+        else:
+            files = ((file, None) for file in files)
+
+        # stream files
+        index = self._resumed_entries
+        try:
+            for file, data in files:
+                file.offset = self._get_offset()
+                if layout is not None:
+                    chunks = self._stream_file_from_layout(file, data, layout, index)
+                else:
+                    chunks = self._stream_single_file(file, data)
+                if self.observer is not None:
+                    chunks = self._observe_entry(file, chunks, archive_stats)
+                for chunk in chunks:
+                    self._add_offset(len(chunk))
+                    yield chunk
+                index += 1
+                self._entry_boundaries.append((index, self._get_offset()))
+        finally:
+            # stops compression workers as soon as streaming fails or is abandoned, not once the generator is collected
+            files.close()
 
-    def _stream_single_file(self, file: BaseFile) -> Generator[bytes, None, None]:
+        # stream zip structures
+        chunks = self._end_structures(layout)
+        if self.observer is not None:
+            chunks = self._observe_end(chunks, archive_stats)
+        yield from chunks
+
+    def _stream_single_file(self, file: BaseFile, data: Iterator[bytes] = None) -> Generator[bytes, None, None]:
         """
         stream single zip file with header and descriptor at the end.
+        `data` is already processed file data, if not given, the file is processed here.
+        """
+        file.choose_compression_method(self.compression_policy)
+
+        header = self._make_local_file_header(file)
+        yield header
+
+        yield from data if data is not None else self._process_file(file)
+
+        self._count_saved_compression(file)
+        self._save_metadata(file)
+        self._entries.add(file)
+        descriptor = self._make_data_descriptor(file) if file.uses_data_descriptor else b""
+        if self._layout_builder is not None:
+            self._layout_builder.add(header, descriptor)
+        if descriptor:
+            yield descriptor
+
+    # layout cache
+
+    def _start_layout(self) -> Optional[ArchiveLayout]:
+        """
+        Returns the cached layout to stream from, or starts recording one if the manifest can be cached.
+        """
+        self._layout_builder = None
+        if self._resumed_entries or self._layout_key is None:
+            return None
+        if self._layout is None:
+            self._layout_builder = LayoutBuilder()
+            return None
+        self._entries = self._layout.entries
+        return self._layout
+
+    def _stream_file_from_layout(self, file: BaseFile, data: Optional[Iterator[bytes]], layout: ArchiveLayout, index: int) -> Generator[bytes, None, None]:
+        """
+        Streams file data between its cached local file header and data descriptor.
         """
-        yield self._make_local_file_header(file)
+        yield layout.local_file_header(index)
+
+        yield from data if data is not None else self._process_file(file)
+
+        self._check_layout(file, layout, index)
+        descriptor = layout.data_descriptor(index)
+        if descriptor:
+            yield descriptor
+
+    def _check_layout(self, file: BaseFile, layout: ArchiveLayout, index: int) -> None:
+        if not layout.matches(index, file):
+            # already sent headers are wrong, nothing to do but stop
+            self.layout_cache.delete(self._layout_key)
+            raise ValueError(f"{file} doesn't match the cached layout, it probably changed without changing its mtime.")
+
+    def _end_structures(self, layout: Optional[ArchiveLayout]) -> Iterator[bytes]:
+        if layout is not None:
+            self._offset_to_start_of_central_dir = self._get_offset()
+            return iter([layout.end_structures()])
+        chunks = self._make_end_structures()
+        if self._layout_builder is not None:
+            chunks = self._record_layout(chunks)
+        return chunks
+
+    def _record_layout(self, chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+        end_structures = []
+        for chunk in chunks:
+            end_structures.append(chunk)
+            yield chunk
+        # whole archive was streamed
+        self.layout_cache.set(self._layout_key, self._layout_builder.finish(b"".join(end_structures), self._entries, self._get_offset()))
+        self._layout_builder = None
+
+    # checkpoints
+
+    def checkpoint(self) -> Checkpoint:
+        """
+        Checkpoint after the last entry that the consumer of stream()/async_stream() took completely.
+        Call it after the chunks were really sent somewhere, the checkpoint's offset is never past them.
+        """
+        self._confirm_entry_boundaries()
+        count, offset = self._confirmed_boundary
+        return Checkpoint(self._entries.head(count), offset)
+
+    def _confirm_entry_boundaries(self) -> None:
+        # boundaries in rechunked data that wasn't given out yet stay pending
+        boundaries = self._entry_boundaries
+        while boundaries and boundaries[0][1] <= self._streamed:
+            self._confirmed_boundary = boundaries.popleft()
+
+    def resume(self, checkpoint: Checkpoint, start: int = None, workers: int = 0, max_buffer_size: int = 64 * 1024 * 1024,
+               chunk_size: int = None) -> Generator[bytes, None, None]:
+        """
+        Streams the rest of an archive from `checkpoint`, made by checkpoint() of a ZipFly with the same files.
+        Files before the checkpoint aren't read or compressed, only their names are checked.
+        The stream starts at byte checkpoint.offset of the archive, or at `start` if the client has more than that
+        (bytes between are generated again and dropped). Other args are like in stream().
+        """
+        skip = self._restore_checkpoint(checkpoint, start)
+        yield from self._deliver(self._stream(workers, max_buffer_size), chunk_size, skip)
+
+    async def async_resume(self, checkpoint: Checkpoint, start: int = None, chunk_size: int = None, prefetch: int = 0,
+                           max_buffer_size: int = 64 * 1024 * 1024) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of resume
+        """
+        skip = self._restore_checkpoint(checkpoint, start)
+        async for chunk in self._async_deliver(self._async_stream(prefetch, max_buffer_size), chunk_size, skip):
+            yield chunk
+
+    def _restore_checkpoint(self, checkpoint: Checkpoint, start: Optional[int]) -> int:
+        """
+        Puts central directory info and offset from the checkpoint in place, returns number of bytes to drop.
+        """
+        if self._get_offset() or len(self._entries):
+            raise ValueError("Only a ZipFly that wasn't streamed yet can be resumed.")
+        if start is None:
+            start = checkpoint.offset
+        if start < checkpoint.offset:
+            raise ValueError(f"Can't resume from byte {start}, the checkpoint is at byte {checkpoint.offset}.")
+
+        if self._layout is not None:
+            # the rest is streamed without the cached layout
+            self._layout = None
+
+        self._entries = checkpoint.entries.head(len(checkpoint.entries))
+        self._set_offset(checkpoint.offset)
+        self._resumed_entries = len(checkpoint.entries)
+        self._streamed = start
+        self._entry_boundaries.clear()
+        self._confirmed_boundary = (len(checkpoint.entries), checkpoint.offset)
+        return start - checkpoint.offset
+
+    def _check_resumed_file(self, index: int, file: BaseFile) -> None:
+        entries = self._entries
+        if entries.names[entries.name_start(index):entries.name_ends[index]] != file.file_path_bytes:
+            raise ValueError(f"{file} doesn't match entry {index} of the checkpoint, files have to be the same as when it was made.")
+
+    def _skip_resumed(self, files: Iterable[BaseFile]) -> Generator[BaseFile, None, None]:
+        skipped = 0
+        for file in files:
+            if skipped < self._resumed_entries:
+                self._check_resumed_file(skipped, file)
+                skipped += 1
+                continue
+            yield file
+        if skipped < self._resumed_entries:
+            raise ValueError(f"The checkpoint has {self._resumed_entries} entries, but there are only {skipped} files.")
+
+    async def _async_skip_resumed(self, files: AsyncIterable[BaseFile]) -> AsyncGenerator[BaseFile, None]:
+        skipped = 0
+        async for file in files:
+            if skipped < self._resumed_entries:
+                self._check_resumed_file(skipped, file)
+                skipped += 1
+                continue
+            yield file
+        if skipped < self._resumed_entries:
+            raise ValueError(f"The checkpoint has {self._resumed_entries} entries, but there are only {skipped} files.")
+
+    # observer support, none of this runs without an observer
+
+    @staticmethod
+    def _with_stats(files: Iterable[BaseFile]) -> Generator[BaseFile, None, None]:
+        # stats are attached before any data is read, with workers/prefetch that's before the entry starts
+        for file in files:
+            file.stats = EntryStats(file.name)
+            yield file
+
+    @staticmethod
+    async def _async_with_stats(files: AsyncIterable[BaseFile]) -> AsyncGenerator[BaseFile, None]:
+        async for file in files:
+            file.stats = EntryStats(file.name)
+            yield file
+
+    def _entry_started(self, file: BaseFile) -> None:
+        file.stats.start(file.offset)
+        self.observer.entry_start(file)
+
+    def _entry_ended(self, file: BaseFile, archive_stats: ArchiveStats) -> None:
+        file.stats.finish(file, self._get_offset())
+        archive_stats.add(file.stats)
+        self.observer.entry_end(file, file.stats)
+
+    def _observe_entry(self, file: BaseFile, chunks: Iterable[bytes], archive_stats: ArchiveStats) -> Generator[bytes, None, None]:
+        """
+        Passes chunks of an entry through, measuring how long the consumer takes each of them.
+        """
+        self._entry_started(file)
+        for chunk in chunks:
+            started = perf_counter()
+            yield chunk
+            file.stats.consumer_time += perf_counter() - started
+        self._entry_ended(file, archive_stats)
+
+    async def _async_observe_entry(self, file: BaseFile, chunks: AsyncIterable[bytes], archive_stats: ArchiveStats) -> AsyncGenerator[bytes, None]:
+        self._entry_started(file)
+        async for chunk in chunks:
+            started = perf_counter()
+            yield chunk
+            file.stats.consumer_time += perf_counter() - started
+        self._entry_ended(file, archive_stats)
+
+    def _observe_end(self, chunks: Iterable[bytes], archive_stats: ArchiveStats) -> Generator[bytes, None, None]:
+        archive_size = self._get_offset()
+        for chunk in chunks:
+            archive_size += len(chunk)
+            started = perf_counter()
+            yield chunk
+            archive_stats.consumer_time += perf_counter() - started
+        archive_stats.finish(archive_size)
+        self.observer.archive_end(archive_stats)
+
+    def stream_to_fd(self, fd: int, batch_size: int = 1024 * 1024, seekable: bool = True) -> int:
+        """
+        Writes the whole archive to file descriptor `fd` (file, pipe or blocking socket), returns number of bytes written.
+        Chunks are batched into one os.writev call per `batch_size` bytes. Data of bigger LocalFiles with NO_COMPRESSION
+        is sent with os.sendfile, so it never goes through python, only its crc is computed from a mmap of the file.
+
+        If `fd` is a regular file, seekable layout is used: local file headers are patched with crc and sizes after the data,
+        so there are no data descriptors, and zip64 structures are used only where values don't fit.
+        The archive is smaller than calculate_archive_size() then. With `seekable`=False the bytes are exactly the ones stream() gives:
+        crc and sizes are only in data descriptors, local file headers keep zeros there.
+        """
+        return self._write_to_sink(FdSink(fd, batch_size), fd, seekable)
+
+    def stream_to(self, fileobj: BinaryIO, batch_size: int = 1024 * 1024, seekable: bool = True) -> int:
+        """
+        Writes the whole archive to a binary file object, returns number of bytes written.
+        Real files (with fileno()) go through stream_to_fd, others get one writelines call per `batch_size` bytes.
+        Seekable file objects (like BytesIO) get the seekable layout too, see stream_to_fd.
+        """
+        try:
+            fd = fileobj.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fd = None
+        if fd is not None:
+            # anything buffered in fileobj goes first
+            fileobj.flush()
+            return self.stream_to_fd(fd, batch_size, seekable)
+
+        return self._write_to_sink(FileSink(fileobj, batch_size), None, seekable)
+
+    @classmethod
+    def append_to(cls, path: str, new_files: Union[List[BaseFile], Iterable[BaseFile]], batch_size: int = 1024 * 1024, **kwargs) -> int:
+        """
+        Appends files to an existing archive on disk, returns its new size. Other kwargs are passed to ZipFly.
+        Only central directory and end records of the archive are read: new entries are written over them
+        (the file is truncated there), followed by the old central directory, headers of new entries and new end records.
+        So the cost depends on the new files, not on the size of the archive.
+
+        New names that clash with names already in the archive are renamed like duplicates in one archive are.
+        If writing fails with an exception, the old central directory and end records are put back. Comment of the archive is dropped.
+        It isn't crash safe: if the process is killed or the machine goes down midway, the archive is left without
+        a central directory. When that matters, append to a copy and os.replace() it over the archive.
+        """
+        with open(path, "r+b") as fileobj:
+            directory = CentralDirectory.read(fileobj)
+            existing_names = [directory.entries.name(i) for i in range(len(directory.entries))]
+            if isinstance(new_files, (list, tuple)):
+                # renamed before ZipFly sees them, it only deduplicates them among themselves
+                deduplicator = FileNameDeduplicator(existing_names)
+                for file in new_files:
+                    deduplicator.process(file)
+
+            archive = cls(new_files, **kwargs)
+            archive._deduplicator = FileNameDeduplicator(existing_names)  # lazy manifests
+            archive._existing_cdir = directory.data
+            archive._existing_entries = len(directory.entries)
+            archive._set_offset(directory.offset)
+
+            fileobj.seek(directory.offset)
+            old_tail = fileobj.read()  # put back if writing fails
+            fd = fileobj.fileno()
+            os.lseek(fd, directory.offset, os.SEEK_SET)
+            try:
+                sink = FdSink(fd, batch_size)
+                if sink.can_patch:
+                    sink.start = 0  # offsets are from the start of the file, not from where new entries start
+                size = directory.offset + archive._write_to_sink(sink, fd, seekable=True)
+                fileobj.truncate(size)
+            except BaseException:
+                fileobj.seek(directory.offset)
+                fileobj.write(old_tail)
+                fileobj.truncate(directory.size)
+                raise
+        return size
+
+    def _can_sendfile(self, file: BaseFile) -> bool:
+        return isinstance(file, LocalFile) and file.compression_method == consts.NO_COMPRESSION and file.size >= self.SENDFILE_MIN_SIZE
+
+    def _write_to_sink(self, sink, fd: Optional[int], seekable: bool) -> int:
+        """
+        Writes the archive to a FdSink/FileSink. os.sendfile is used only with `fd`.
+        """
+        seekable = seekable and sink.can_patch
+
+        written = 0
+        files = self._iter_files()
+        if self.observer is not None:
+            archive_stats = ArchiveStats()
+            files = self._with_stats(files)
+
+        for file in files:
+            file.offset = self._get_offset()
+            if self.observer is not None:
+                self._entry_started(file)
+            if seekable:
+                size = self._write_seekable_file(sink, file, fd)
+            elif fd is not None and self._can_sendfile(file):
+                size = sink.write(self._make_local_file_header(file))
+                sink.flush()
+                size += file._send_to_fd(fd)
+                self._save_metadata(file)
+                self._entries.add(file)
+                if file.uses_data_descriptor:
+                    size += sink.write(self._make_data_descriptor(file))
+            else:
+                size = 0
+                for chunk in self._stream_single_file(file):
+                    size += sink.write(chunk)
+            self._add_offset(size)
+            written += size
+            if self.observer is not None:
+                # whatever wasn't reading or compressing was writing (os.sendfile counts as writing)
+                file.stats.set_consumer_time_from_rest()
+                self._entry_ended(file, archive_stats)
+
+        chunks = self._make_end_structures()
+        if self.observer is not None:
+            chunks = self._observe_end(chunks, archive_stats)
+        for chunk in chunks:
+            written += sink.write(chunk)
+        sink.flush()
+
+        return written
+
+    def _write_seekable_file(self, sink, file: BaseFile, fd: Optional[int]) -> int:
+        """
+        Writes a file without data descriptor, and patches its local file header with crc and sizes after the data.
+        """
+        file.choose_compression_method(self.compression_policy)
+        zip64 = self._needs_local_zip64(file)
+        header = self._make_seekable_local_file_header(file, zip64)
+        flushes = sink.flushes
+        size = sink.write(header)
+
+        if fd is not None and self._can_sendfile(file):
+            sink.flush()
+            size += file._send_to_fd(fd)
+        else:
+            for chunk in self._process_file(file):
+                size += sink.write(chunk)
+
+        self._count_saved_compression(file)
+        self._save_metadata(file)
+        self._entries.add(file)
+
+        if file.known_crc is None:
+            for offset, data in self._make_local_file_header_patches(file, zip64):
+                if sink.flushes == flushes:
+                    # header wasn't written yet, patch it in memory
+                    header[offset:offset + len(data)] = data
+                else:
+                    sink.patch(file.offset + offset, data)
+        return size
+
+    async def async_stream_to(self, sink: Any, batch_size: int = 256 * 1024, prefetch: int = 0, max_buffer_size: int = 64 * 1024 * 1024) -> int:
+        """
+        Writes the whole archive to an asyncio StreamWriter or an ASGI `send` callable, returns number of bytes written.
+        Chunks are batched per `batch_size` bytes, the writer is drained after every batch.
+        With ASGI, http.response.start has to be sent before, the last body message is sent here.
+        """
+        sink = AsyncSink(sink, batch_size)
+        async for chunk in self.async_stream(prefetch=prefetch, max_buffer_size=max_buffer_size):
+            await sink.write(chunk)
+        await sink.close()
+        return sink.written
+
+    def stream_to_socket(self, sock: socket.socket) -> int:
+        """
+        stream_to_fd() for a blocking socket.
+        """
+        if sock.gettimeout() is not None:
+            raise ValueError("stream_to_socket() needs a blocking socket (without timeout).")
+        return self.stream_to_fd(sock.fileno())
+
+    def _require_stored_files(self, feature: str) -> List[BaseFile]:
+        files = self._require_files()
+        for file in files:
+            if file.compression_method != consts.NO_COMPRESSION:
+                raise ValueError(f"{feature} requires NO_COMPRESSION, {file} uses compression method {file.compression_method}.")
+        return files
+
+    def split(self, part_size: int, name: str = "archive", crcs: Dict[str, int] = None) -> List[SplitPart]:
+        """
+        Splits the archive into parts of at most `part_size` bytes: name.z01, name.z02, ... and name.zip as the last one.
+        Every part is an independent stream (part.stream() or part.async_stream()), so parts can be made and uploaded
+        at the same time. Like range streaming, this needs the layout up front: all files have to use NO_COMPRESSION
+        and have a known size.
+
+        Data descriptors and central directory need CRCs, pass `crcs` (names -> CRCs) if they're known,
+        see stream_range. Otherwise a part that needs a CRC reads the whole file (the part with central directory reads all of them).
+        """
+        if part_size < consts.SPLIT_MIN_PART_SIZE:
+            raise ValueError(f"Parts have to be at least {consts.SPLIT_MIN_PART_SIZE} bytes.")
+        files = self._require_stored_files("Splitting")
+        layout = SplitLayout(self, files, part_size, crcs or {})
+
+        if name.lower().endswith(".zip"):
+            name = name[:-4]
+        count = len(layout.pieces)
+        return [SplitPart(layout, number, f"{name}.zip" if number == count - 1 else f"{name}.z{number + 1:02}") for number in range(count)]
+
+    def _prepare_range(self, start: int, end: Optional[int]) -> Tuple[int, int, int]:
+        """
+        Assigns offsets to all files without reading any data, and validates the range.
+        Returns start, exclusive end and offset to start of central dir.
+        """
+        self._require_stored_files("Range streaming")
+
+        archive_size = self.calculate_archive_size()
+        if end is None or end >= archive_size:
+            end = archive_size - 1
+        if start < 0 or start > end:
+            raise ValueError(f"Invalid range {start}-{end} for archive of size {archive_size}.")
+
+        offset = 0
+        for file in self.files:
+            file.offset = offset
+            file.zip64 = self._needs_local_zip64(file)
+            offset += self._local_file_header_size(file)
+            offset += file.size
+            offset += self._data_descriptor_size(file)
+
+        return start, end + 1, offset
+
+    def _file_parts(self, file: BaseFile) -> Tuple[int, int, int, int]:
+        """
+        Returns offsets of: local file header, file data, data descriptor, and the end of data descriptor.
+        """
+        data_start = file.offset + self._local_file_header_size(file)
+        descriptor_start = data_start + file.size
+        return file.offset, data_start, descriptor_start, descriptor_start + self._data_descriptor_size(file)
+
+    @staticmethod
+    def _use_known_crc(file: BaseFile, crcs: Dict[str, int]) -> bool:
+        if file.known_crc is not None:
+            file.crc = file.known_crc
+        elif file.name in crcs:
+            file.crc = crcs[file.name]
+        else:
+            return False
+        file.original_size = file.size
+        file.compressed_size = file.size
+        return True
+
+    def _make_range_end_structures(self, cdir_offset: int) -> bytes:
+        self._set_offset(cdir_offset)
+        self._cdir_size = 0
+        self._entries = EntryTable.from_files(self.files)
+        return b"".join(self._make_end_structures())
+
+    def stream_range(self, start: int, end: int = None, crcs: Dict[str, int] = None) -> Generator[bytes, None, None]:
+        """
+        Streams only bytes from `start` to `end` of the archive. Both are inclusive, just like in HTTP Range header.
+        It only works if the layout is known up front, so all files have to use NO_COMPRESSION and have a known size.
+
+        Data descriptors and central directory need CRCs. `crcs` maps names of files (in the archive) to CRCs
+        computed before, for example during a previous stream(). Files with a known CRC are read only in the requested range,
+        the others have to be read from the start to compute it (if their CRC lands in the range).
+        """
+        start, end, cdir_offset = self._prepare_range(start, end)
+        crcs = crcs or {}
+        cdir_needed = end > cdir_offset
+
+        for file in self.files:
+            header_start, data_start, descriptor_start, descriptor_end = self._file_parts(file)
+            if header_start >= end:
+                break
+
+            needs_crc = cdir_needed or _overlap(descriptor_start, descriptor_end, start, end) is not None
+            crc_known = needs_crc and self._use_known_crc(file, crcs)
+
+            header_range = _overlap(header_start, data_start, start, end)
+            if header_range:
+                skip, count = header_range
+                yield self._make_local_file_header(file)[skip:skip + count]
+
+            data_range = _overlap(data_start, descriptor_start, start, end)
+            if needs_crc and not crc_known:
+                # read the whole file to get the CRC, but only give out the requested part
+                skip, count = data_range or (0, 0)
+                file.crc = file.original_size = file.compressed_size = 0
+                yield from _slice_chunks(file.generate_processed_file_data(self._lane), skip, count)
+            elif data_range:
+                skip, count = data_range
+                yield from _take_chunks(file._generate_file_data_from(skip), count)
+
+            descriptor_range = _overlap(descriptor_start, descriptor_end, start, end)
+            if descriptor_range:
+                skip, count = descriptor_range
+                yield self._make_data_descriptor(file)[skip:skip + count]
+
+        if cdir_needed:
+            skip = max(start - cdir_offset, 0)
+            yield self._make_range_end_structures(cdir_offset)[skip:end - cdir_offset]
+
+    async def async_stream_range(self, start: int, end: int = None, crcs: Dict[str, int] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Async version of stream_range
+        """
+        start, end, cdir_offset = self._prepare_range(start, end)
+        crcs = crcs or {}
+        cdir_needed = end > cdir_offset
+
+        for file in self.files:
+            header_start, data_start, descriptor_start, descriptor_end = self._file_parts(file)
+            if header_start >= end:
+                break
 
-        yield from file.generate_processed_file_data()
+            needs_crc = cdir_needed or _overlap(descriptor_start, descriptor_end, start, end) is not None
+            crc_known = needs_crc and self._use_known_crc(file, crcs)
 
-        yield self._make_data_descriptor(file)
+            header_range = _overlap(header_start, data_start, start, end)
+            if header_range:
+                skip, count = header_range
+                yield self._make_local_file_header(file)[skip:skip + count]
 
+            data_range = _overlap(data_start, descriptor_start, start, end)
+            if needs_crc and not crc_known:
+                skip, count = data_range or (0, 0)
+                file.crc = file.original_size = file.compressed_size = 0
+                async for chunk in _async_slice_chunks(file.async_generate_processed_file_data(self._lane), skip, count):
+                    yield chunk
+            elif data_range:
+                skip, count = data_range
+                async for chunk in _async_take_chunks(file._async_generate_file_data_from(skip), count):
+                    yield chunk
 
+            descriptor_range = _overlap(descriptor_start, descriptor_end, start, end)
+            if descriptor_range:
+                skip, count = descriptor_range
+                yield self._make_data_descriptor(file)[skip:skip + count]
 
+        if cdir_needed:
+            skip = max(start - cdir_offset, 0)
+            yield self._make_range_end_structures(cdir_offset)[skip:end - cdir_offset]
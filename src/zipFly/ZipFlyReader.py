@@ -0,0 +1,243 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Iterable, List, Optional, Tuple
+
+from zipFly import consts
+from zipFly.CentralDirectory import CentralDirectory
+from zipFly.Codecs import get_codec
+from zipFly.EntryTable import EntryTable, LENGTH_STRUCT
+
+# magic, version, size and mtime of the archive, offset of its central directory, number of entries
+INDEX_HEADER_STRUCT = struct.Struct(b"<4sBQQQQ")
+INDEX_MAGIC = b"ZFIX"
+INDEX_VERSION = 1
+
+
+class ZipFlyReader:
+    """
+    Reads archives (ZipFly ones, or any other single disk zip) through a mmap, without a python object per entry.
+    Central directory is parsed once into an EntryTable, plus names sorted for binary search (the index).
+    With `index_path` the index is saved there, and loaded instead of parsing central directory the next time,
+    as long as size and mtime of the archive didn't change.
+
+    Entries are read lazily: byte_range() gives where compressed data of an entry is, stream() decompresses it
+    chunk by chunk (checking its crc), extract() writes many entries in a thread pool.
+    """
+
+    def __init__(self, path: str, index_path: str = None):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            stat = os.fstat(self._file.fileno())
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        self._stamp = (stat.st_size, stat.st_mtime_ns)
+
+        index = self._load_index(index_path) if index_path is not None else None
+        if index is None:
+            index = self._build_index()
+            if index_path is not None:
+                self._save_index(index_path, *index)
+        self._cdir_offset, self.entries, self._order = index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) is not None
+
+    def __repr__(self):
+        return f"ZipFlyReader({self.path!r}, entries={len(self.entries)})"
+
+    def names(self) -> Generator[str, None, None]:
+        """
+        Names of entries, in archive order.
+        """
+        for i in range(len(self.entries)):
+            yield self.entries.name(i)
+
+    # index
+
+    def _build_index(self) -> Tuple[int, EntryTable, array]:
+        directory = CentralDirectory.read(self._file)
+        entries = directory.entries
+        names, ends = entries.names, entries.name_ends
+        order = array("Q", sorted(range(len(entries)), key=lambda i: names[entries.name_start(i):ends[i]]))
+        return directory.offset, entries, order
+
+    def _save_index(self, index_path: str, cdir_offset: int, entries: EntryTable, order: array) -> None:
+        header = INDEX_HEADER_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, self._stamp[0], self._stamp[1], cdir_offset, len(entries))
+        if sys.byteorder == "big":
+            order = array(order.typecode, order)
+            order.byteswap()
+        order = order.tobytes()
+        # written next to it and renamed, so readers never see half of an index
+        temp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.writelines([header, LENGTH_STRUCT.pack(len(order)), order, entries.to_bytes()])
+        os.replace(temp_path, index_path)
+
+    def _load_index(self, index_path: str) -> Optional[Tuple[int, EntryTable, array]]:
+        """
+        Saved index, or None if there's none, or it's of another version of the archive.
+        """
+        try:
+            with open(index_path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < INDEX_HEADER_STRUCT.size:
+            return None
+        magic, version, size, mtime_ns, cdir_offset, count = INDEX_HEADER_STRUCT.unpack_from(data)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or (size, mtime_ns) != self._stamp:
+            return None
+
+        view = memoryview(data)[INDEX_HEADER_STRUCT.size:]
+        try:
+            (length,) = LENGTH_STRUCT.unpack_from(view)
+            order = array("Q")
+            order.frombytes(view[LENGTH_STRUCT.size:LENGTH_STRUCT.size + length])
+            entries = EntryTable.from_bytes(view[LENGTH_STRUCT.size + length:])
+        except (ValueError, struct.error):
+            return None
+        if sys.byteorder == "big":
+            order.byteswap()
+        if len(entries) != count or len(order) != count:
+            return None
+        return cdir_offset, entries, order
+
+    def _find(self, name: str) -> Optional[int]:
+        for encoding in ("utf-8", "cp437"):
+            try:
+                index = self._search(name.encode(encoding))
+            except UnicodeEncodeError:
+                continue
+            if index is not None:
+                return index
+        return None
+
+    def _search(self, name: bytes) -> Optional[int]:
+        """
+        Binary search in names sorted by the index. With duplicate names, the last entry wins (like in zipfile).
+        """
+        entries, order = self.entries, self._order
+        names, ends = entries.names, entries.name_ends
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            i = order[middle]
+            if name < names[entries.name_start(i):ends[i]]:
+                high = middle
+            else:
+                low = middle + 1
+        if low:
+            i = order[low - 1]
+            if names[entries.name_start(i):ends[i]] == name:
+                return i
+        return None
+
+    def _index_of(self, name: str) -> int:
+        index = self._find(name)
+        if index is None:
+            raise KeyError(f"There is no {name!r} in {self.path}.")
+        return index
+
+    # data
+
+    def _data_start(self, index: int) -> int:
+        offset = self.entries.offsets[index]
+        header_struct = consts.LOCAL_FILE_HEADER_STRUCT
+        if offset + header_struct.size > self._cdir_offset:
+            raise ValueError(f"Local file header of {self.entries.name(index)!r} is out of the archive.")
+        header = consts.LOCAL_FILE_HEADER_TUPLE(*header_struct.unpack_from(self._mmap, offset))
+        if header.signature != consts.LOCAL_FILE_HEADER_SIGNATURE:
+            raise ValueError(f"Local file header of {self.entries.name(index)!r} is corrupted.")
+        return offset + header_struct.size + header.file_name_len + header.extra_field_len
+
+    def byte_range(self, name: str) -> Tuple[int, int]:
+        """
+        (start, end) of compressed data of an entry in the archive file, for serving it as it is (or with os.sendfile).
+        """
+        return self._byte_range(self._index_of(name))
+
+    def _byte_range(self, index: int) -> Tuple[int, int]:
+        start = self._data_start(index)
+        end = start + self.entries.compressed_sizes[index]
+        if end > self._cdir_offset:
+            raise ValueError(f"Data of {self.entries.name(index)!r} is out of the archive.")
+        return start, end
+
+    def stream(self, name: str, chunk_size: int = 1024 * 1024, raw: bool = False) -> Generator[bytes, None, None]:
+        """
+        Data of an entry, decompressed chunk by chunk from the mmap. Its crc and size are checked at the end.
+        With `raw` compressed data is given as it is.
+        """
+        index = self._index_of(name)
+        entries = self.entries
+        if entries.flags[index] & 0x01:
+            raise ValueError(f"{name!r} is encrypted, that isn't supported.")
+        start, end = self._byte_range(index)
+        decompressor = None if raw else get_codec(entries.compression_methods[index]).decompressobj()
+
+        crc, size = 0, 0
+        for position in range(start, end, chunk_size):
+            chunk = self._mmap[position:min(position + chunk_size, end)]
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+            if chunk:
+                yield chunk
+
+        if decompressor is not None and (crc != entries.crcs[index] or size != entries.uncompressed_sizes[index]):
+            raise ValueError(f"{name!r} is corrupted, its crc or size doesn't match central directory.")
+
+    def read(self, name: str) -> bytes:
+        return b"".join(self.stream(name))
+
+    def extract(self, directory: str, names: Iterable[str] = None, workers: int = 4) -> List[str]:
+        """
+        Writes entries (all of them by default) under `directory`, in `workers` threads, returns their paths.
+        Decompression and writing release the GIL, so threads really work at the same time.
+        Names that would end up outside of `directory` (absolute ones, with ..) raise ValueError before anything is written.
+        """
+        names = list(self.names() if names is None else names)
+        root = os.path.abspath(directory)
+        paths = []
+        for name in names:
+            path = os.path.abspath(os.path.join(root, *name.split("/")))
+            if os.path.isabs(name) or (path != root and not path.startswith(root + os.sep)):
+                raise ValueError(f"{name!r} would be extracted outside of {directory}.")
+            paths.append(path)
+
+        def extract_one(name: str, path: str) -> str:
+            if name.endswith("/"):
+                os.makedirs(path, exist_ok=True)
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                for chunk in self.stream(name):
+                    file.write(chunk)
+            return path
+
+        if workers <= 1:
+            return [extract_one(name, path) for name, path in zip(names, paths)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(extract_one, names, paths))
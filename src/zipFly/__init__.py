@@ -2,4 +2,15 @@ from zipFly.ZipFly import ZipFly
 from zipFly.LocalFile import LocalFile
 from zipFly.GenFile import GenFile
 from zipFly.BaseFile import BaseFile
+from zipFly.CompressionPolicy import CompressionPolicy
+from zipFly.CompressionScheduler import CompressionScheduler
+from zipFly.ContentCache import ContentCache
+from zipFly.MetadataCache import MetadataCache, MemoryMetadataCache, SqliteMetadataCache
+from zipFly.LayoutCache import LayoutCache
+from zipFly.Observer import Observer, EntryStats, ArchiveStats
+from zipFly.Codecs import Codec, register_codec, get_codec
+from zipFly.Checkpoint import Checkpoint
+from zipFly.Split import SplitPart
+from zipFly.CentralDirectory import CentralDirectory
+from zipFly.ZipFlyReader import ZipFlyReader
 from zipFly import consts
@@ -4,12 +4,28 @@ import struct
 # ZIP CONSTANTS
 ZIP64_VERSION = 45
 UTF8_FLAG = 0x800  # utf-8 filename encoding flag
+DATA_DESCRIPTOR_FLAG = 0x08  # crc and sizes are in data descriptor after file data, not in local file header
+
+# 1980-01-01 00:00 UTC, the earliest DOS date. Files without a modification time get it in deterministic mode
+DETERMINISTIC_MODIFICATION_TIME = 315532800
 
 # ZIP COMPRESSION METHODS
 NO_COMPRESSION = 0
 COMPRESSION_DEFLATE = 8
-# COMPRESSION_BZIP2 = 12
-# COMPRESSION_LZMA = 14
+COMPRESSION_BZIP2 = 12
+COMPRESSION_LZMA = 14
+COMPRESSION_ZSTD = 93  # needs zstandard package
+COMPRESSION_AUTO = -1  # not a real zip method, picked per file by CompressionPolicy before its local header is made
+
+# PRIORITY CLASSES OF CompressionScheduler
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# SPLIT ARCHIVES
+SPLIT_ARCHIVE_SIGNATURE = b'\x50\x4b\x07\x08'  # first 4 bytes of the first part  (8.5.3)
+SPLIT_MIN_PART_SIZE = 64 * 1024  # same minimum as Info-ZIP
 
 # LOCAL FILE HEADER
 LOCAL_FILE_HEADER_SIGNATURE = b'\x50\x4b\x03\x04'
@@ -17,11 +33,19 @@ LOCAL_FILE_HEADER_STRUCT = struct.Struct(b"<4sHHHHHLLLHH")
 LOCAL_FILE_HEADER_TUPLE = namedtuple("fileheader",
                                      ("signature", "version_to_extract", "flags",
                                       "compression", "mod_time", "mod_date",
-                                      "crc", "uncompressed_size", "compressed_size",
+                                      "crc", "compressed_size", "uncompressed_size",
                                       "file_name_len", "extra_field_len"))
+# crc, compressed size and uncompressed size are at this offset of local file header, they can be patched there in seekable sinks
+LOCAL_FILE_HEADER_CRC_OFFSET = 14
+LOCAL_FILE_HEADER_CRC_STRUCT = struct.Struct(b"<LLL")
+
+# ZIP64 EXTRA FIELD OF LOCAL FILE HEADER (only sizes, used in seekable output when sizes don't fit in local file header)
+ZIP64_LOCAL_EXTRA_FIELD_STRUCT = struct.Struct(b"<2sHQQ")
+ZIP64_LOCAL_EXTRA_FIELD_TUPLE = namedtuple("localextra", ("signature", "extra_field_size", "size", "compressed_size"))
 
 
-# FILE DESCRIPTOR
+# FILE DESCRIPTOR (classic one when sizes fit in 4 bytes)
+DATA_DESCRIPTOR_STRUCT = struct.Struct(b"<4sLLL")
 ZIP64_DATA_DESCRIPTOR_SIGNATURE = b'\x50\x4b\x07\x08'
 ZIP64_DATA_DESCRIPTOR_STRUCT = struct.Struct(b"<4sLQQ")
 ZIP64_DATA_DESCRIPTOR_TUPLE = namedtuple("filecrc", ("signature", "crc", "compressed_size", "uncompressed_size"))
@@ -0,0 +1,76 @@
+import os
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, consts
+
+
+def make_files(names, method=consts.COMPRESSION_DEFLATE):
+    return [GenFile(name=name, generator=(chunk for chunk in [name.encode() * 2000]), modification_time=1700000000, compression_method=method)
+            for name in names]
+
+
+def read_all(path):
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        return {info.filename: archive.read(info) for info in archive.infolist()}
+
+
+def test_append_to_zipfly_archive(tmp_path):
+    path = tmp_path / "archive.zip"
+    path.write_bytes(b"".join(ZipFly(make_files(["f0.txt", "f1.txt"])).stream()))
+    before = path.read_bytes()
+    with zipfile.ZipFile(path) as archive:
+        cdir_offset = archive.start_dir
+
+    size = ZipFly.append_to(str(path), make_files(["f0.txt", "f2.txt"], consts.NO_COMPRESSION))
+    after = path.read_bytes()
+    assert size == len(after)
+    assert after[:cdir_offset] == before[:cdir_offset]
+    assert read_all(path) == {
+        "f0.txt": b"f0.txt" * 2000,
+        "f1.txt": b"f1.txt" * 2000,
+        "f0 (1).txt": b"f0.txt" * 2000,
+        "f2.txt": b"f2.txt" * 2000,
+    }
+
+    # appending again keeps what was appended before
+    ZipFly.append_to(str(path), make_files(["f3.txt"]))
+    assert list(read_all(path)) == ["f0.txt", "f1.txt", "f0 (1).txt", "f2.txt", "f3.txt"]
+
+
+def test_append_to_zipfile_archive(tmp_path):
+    path = tmp_path / "archive.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.txt", b"a" * 10000)
+        archive.writestr("dir/b.txt", b"b" * 10)
+        archive.comment = b"comment"
+
+    ZipFly.append_to(str(path), make_files(["c.txt", "a.txt"]))
+    assert read_all(path) == {"a.txt": b"a" * 10000, "dir/b.txt": b"b" * 10, "c.txt": b"c.txt" * 2000, "a (1).txt": b"a.txt" * 2000}
+
+
+def test_append_rolls_back_on_error(tmp_path):
+    path = tmp_path / "archive.zip"
+    path.write_bytes(b"".join(ZipFly(make_files(["f0.txt"])).stream()))
+    before = path.read_bytes()
+
+    def failing():
+        yield b"some data" * 1000
+        raise OSError("source is gone")
+
+    files = make_files(["f1.txt"]) + [GenFile(name="broken.txt", generator=failing(), compression_method=consts.NO_COMPRESSION)]
+    with pytest.raises(OSError):
+        ZipFly.append_to(str(path), files, batch_size=1024)
+    assert path.read_bytes() == before
+    assert os.path.getsize(path) == len(before)
+    assert read_all(path) == {"f0.txt": b"f0.txt" * 2000}
+
+
+def test_append_to_not_an_archive(tmp_path):
+    path = tmp_path / "archive.zip"
+    path.write_bytes(b"not a zip archive")
+    with pytest.raises(ValueError):
+        ZipFly.append_to(str(path), make_files(["f0.txt"]))
+    assert path.read_bytes() == b"not a zip archive"
@@ -0,0 +1,68 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, Checkpoint, consts
+
+
+def chunks(i):
+    return [f"file {i} ".encode() * 3000] * 4
+
+
+async def async_chunks(i):
+    for chunk in chunks(i):
+        yield chunk
+
+
+def make_files(asynchronous=False):
+    return [GenFile(name=f"{i}.txt", generator=async_chunks(i) if asynchronous else (chunk for chunk in chunks(i)), modification_time=1700000000,
+                    compression_method=consts.COMPRESSION_DEFLATE if i % 2 else consts.NO_COMPRESSION)
+            for i in range(6)]
+
+
+def interrupted_stream(taken_chunks):
+    zip_fly = ZipFly(make_files())
+    received = bytearray()
+    for chunk in zip_fly.stream(chunk_size=1000):
+        received += chunk
+        if len(received) >= taken_chunks * 1000:
+            break
+    return zip_fly.checkpoint(), bytes(received)
+
+
+@pytest.mark.parametrize("taken_chunks", [1, 20, 60])
+def test_resume_gives_the_same_bytes(taken_chunks):
+    full = b"".join(ZipFly(make_files()).stream())
+    checkpoint, received = interrupted_stream(taken_chunks)
+    assert checkpoint.offset <= len(received)
+
+    checkpoint = Checkpoint.from_token(checkpoint.to_token())
+    resumed = received + b"".join(ZipFly(make_files()).resume(checkpoint, start=len(received)))
+    assert resumed == full
+    assert zipfile.ZipFile(io.BytesIO(resumed)).testzip() is None
+
+    # from the checkpoint itself
+    resumed = received[:checkpoint.offset] + b"".join(ZipFly(make_files()).resume(Checkpoint.from_bytes(checkpoint.to_bytes())))
+    assert resumed == full
+
+
+def test_async_resume():
+    full = b"".join(ZipFly(make_files()).stream())
+    checkpoint, received = interrupted_stream(30)
+
+    async def resume():
+        return b"".join([chunk async for chunk in ZipFly(make_files(asynchronous=True)).async_resume(checkpoint, start=len(received))])
+
+    assert received + asyncio.run(resume()) == full
+
+
+def test_bad_checkpoints():
+    with pytest.raises(ValueError):
+        Checkpoint.from_token("not a checkpoint")
+    checkpoint, _ = interrupted_stream(30)
+    with pytest.raises(ValueError):
+        Checkpoint.from_bytes(checkpoint.to_bytes()[:-5])
+    with pytest.raises(ValueError):
+        ZipFly(make_files()).resume(checkpoint, start=checkpoint.offset - 1).__next__()
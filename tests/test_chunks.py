@@ -0,0 +1,95 @@
+import asyncio
+import io
+import os
+import zipfile
+import zlib
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, GenFile, consts
+
+
+def write_files(tmp_path):
+    contents = {"big.bin": os.urandom(ZipFly.SENDFILE_MIN_SIZE + 1000), "text.txt": b"some text\n" * 50000, "empty.txt": b""}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    return contents
+
+
+def make_files(tmp_path, contents, asynchronous=False):
+    async def async_chunks():
+        for _ in range(20):
+            yield b"generated " * 1000
+
+    files = [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=method)
+             for name in contents for method in (consts.NO_COMPRESSION, consts.COMPRESSION_DEFLATE)]
+    generator = async_chunks() if asynchronous else (chunk for chunk in [b"generated " * 1000] * 20)
+    return files + [GenFile(name="gen.txt", generator=generator, modification_time=1700000000, compression_method=consts.COMPRESSION_DEFLATE)]
+
+
+def test_stream_yields_bytes(tmp_path):
+    contents = write_files(tmp_path)
+    zip_fly = ZipFly(make_files(tmp_path, contents))
+    zip_fly.CDIR_BATCH_SIZE = 2  # central directory in several batches
+    chunks = list(zip_fly.stream())
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    assert zipfile.ZipFile(io.BytesIO(b"".join(chunks))).testzip() is None
+
+
+def test_async_stream_yields_bytes(tmp_path):
+    contents = write_files(tmp_path)
+
+    async def stream():
+        zip_fly = ZipFly(make_files(tmp_path, contents, asynchronous=True))
+        zip_fly.CDIR_BATCH_SIZE = 2
+        return [chunk async for chunk in zip_fly.async_stream()]
+
+    chunks = asyncio.run(stream())
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    assert zipfile.ZipFile(io.BytesIO(b"".join(chunks))).testzip() is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 29, 64, 1000, 65536, 10 ** 7])
+def test_rechunked_stream_is_the_same_archive(tmp_path, chunk_size):
+    # chunk sizes smaller than headers and descriptors, between them, and bigger than the whole archive
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+    chunks = list(ZipFly(make_files(tmp_path, contents)).stream(chunk_size=chunk_size))
+
+    assert b"".join(chunks) == full
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= chunk_size  # the last one is short unless the size divides the archive
+    assert len(chunks) == -(-len(full) // chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000, 65536])
+def test_async_rechunked_stream_is_the_same_archive(tmp_path, chunk_size):
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+
+    async def stream():
+        return [chunk async for chunk in ZipFly(make_files(tmp_path, contents, asynchronous=True)).async_stream(chunk_size=chunk_size)]
+
+    chunks = asyncio.run(stream())
+    assert b"".join(chunks) == full
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+
+
+def test_deflate_stream_is_finished_once():
+    source = [f"line {i} of a text file\n".encode() * 50 for i in range(200)]
+    data = b"".join(ZipFly([GenFile(name="a.txt", generator=(chunk for chunk in source), compression_method=consts.COMPRESSION_DEFLATE,
+                                    compression_level=5)]).stream(chunk_size=4096))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.read("a.txt") == b"".join(source)
+
+    # the same deflate stream as one compressobj fed chunk by chunk and flushed once at the end
+    compressor = zlib.compressobj(5, zlib.DEFLATED, -15)
+    expected = b"".join(compressor.compress(chunk) for chunk in source) + compressor.flush()
+    info = archive.getinfo("a.txt")
+    header = consts.LOCAL_FILE_HEADER_TUPLE(*consts.LOCAL_FILE_HEADER_STRUCT.unpack_from(data, info.header_offset))
+    start = info.header_offset + consts.LOCAL_FILE_HEADER_STRUCT.size + header.file_name_len + header.extra_field_len
+    assert data[start:start + info.compress_size] == expected
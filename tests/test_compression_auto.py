@@ -0,0 +1,22 @@
+import os
+import zipfile
+
+from zipFly import ZipFly, LocalFile, consts
+
+
+def test_auto_stored_file_through_sendfile(tmp_path):
+    data = os.urandom(ZipFly.SENDFILE_MIN_SIZE * 2)  # incompressible, so the sample says store it
+    (tmp_path / "random.dat").write_bytes(data)
+    (tmp_path / "text.dat").write_bytes(b"compress me " * 20000)
+    files = [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.COMPRESSION_AUTO) for name in ("random.dat", "text.dat")]
+
+    path = tmp_path / "out.zip"
+    with open(path, "wb") as out:
+        ZipFly(files).stream_to(out)
+
+    assert all(file._held_data is None for file in files)
+    archive = zipfile.ZipFile(path)
+    assert archive.testzip() is None
+    assert archive.getinfo("random.dat").compress_type == consts.NO_COMPRESSION
+    assert archive.getinfo("text.dat").compress_type == consts.COMPRESSION_DEFLATE
+    assert archive.read("random.dat") == data
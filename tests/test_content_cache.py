@@ -0,0 +1,124 @@
+import asyncio
+import io
+import os
+import zipfile
+
+from zipFly import ZipFly, LocalFile, ContentCache, consts
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return os.stat(path).st_mtime_ns
+
+
+def replace_keeping_metadata(path, data, mtime_ns):
+    """
+    Same size and mtime, so the metadata key stays the same: only a cache hit still gives the old content.
+    """
+    path.write_bytes(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def stream(tmp_path, cache, names):
+    files = [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.COMPRESSION_DEFLATE) for name in names]
+    chunks = list(ZipFly(files, content_cache=cache).stream())
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    return b"".join(chunks)
+
+
+def cache_files(directory):
+    return sorted(entry.stat().st_size for entry in os.scandir(directory))
+
+
+def test_admitted_after_n_streams_and_served_from_cache(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ContentCache(str(directory), admit_after=2)
+    original = b"original text\n" * 10000
+    mtime_ns = write_file(tmp_path / "a.txt", original)
+
+    first = stream(tmp_path, cache, ["a.txt"])
+    assert cache_files(directory) == []
+    second = stream(tmp_path, cache, ["a.txt"])
+    assert second == first
+    assert len(cache_files(directory)) == 1
+
+    replace_keeping_metadata(tmp_path / "a.txt", b"x" * len(original), mtime_ns)
+    third = stream(tmp_path, cache, ["a.txt"])
+    assert third == first
+    archive = zipfile.ZipFile(io.BytesIO(third))
+    assert archive.testzip() is None and archive.read("a.txt") == original
+
+    # a new instance picks up the files already in the directory
+    assert stream(tmp_path, ContentCache(str(directory), admit_after=2), ["a.txt"]) == first
+
+
+def test_async_stream_from_cache(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ContentCache(str(directory), admit_after=1)
+    original = b"original text\n" * 10000
+    mtime_ns = write_file(tmp_path / "a.txt", original)
+    first = stream(tmp_path, cache, ["a.txt"])
+    replace_keeping_metadata(tmp_path / "a.txt", b"x" * len(original), mtime_ns)
+
+    async def async_stream():
+        files = [LocalFile(file_path=str(tmp_path / "a.txt"), name="a.txt", compression_method=consts.COMPRESSION_DEFLATE)]
+        return [chunk async for chunk in ZipFly(files, content_cache=cache).async_stream()]
+
+    chunks = asyncio.run(async_stream())
+    assert {type(chunk) for chunk in chunks} == {bytes}
+    assert b"".join(chunks) == first
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    directory = tmp_path / "cache"
+    sizes = {"a.bin": 30000, "b.bin": 40000, "c.bin": 50000}
+    for name, size in sizes.items():
+        write_file(tmp_path / name, os.urandom(size))
+    cache = ContentCache(str(directory), max_size=100000, admit_after=1)
+
+    stream(tmp_path, cache, ["a.bin", "b.bin"])
+    entries = cache_files(directory)
+    assert len(entries) == 2
+    stream(tmp_path, cache, ["a.bin"])  # a is used more recently than b now
+    stream(tmp_path, cache, ["c.bin"])
+
+    left = cache_files(directory)
+    assert len(left) == 2 and sum(left) <= 100000
+    assert entries[0] in left and entries[1] not in left  # a stays, b is evicted
+
+    # bigger than the whole cache, never stored
+    write_file(tmp_path / "d.bin", os.urandom(200000))
+    stream(tmp_path, cache, ["d.bin"])
+    assert cache_files(directory) == left
+
+
+def test_broken_and_missing_cache_files(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ContentCache(str(directory), admit_after=1)
+    write_file(tmp_path / "a.txt", b"some text\n" * 10000)
+    first = stream(tmp_path, cache, ["a.txt"])
+    (path,) = [entry.path for entry in os.scandir(directory)]
+
+    # cut short, like after a crash: dropped, compressed again and admitted again
+    size = os.path.getsize(path)
+    with open(path, "r+b") as fh:
+        fh.truncate(size - 10)
+    assert stream(tmp_path, cache, ["a.txt"]) == first
+    assert os.path.getsize(path) == size
+    with open(path, "r+b") as fh:
+        fh.truncate(5)
+    assert stream(tmp_path, cache, ["a.txt"]) == first
+    assert os.path.getsize(path) == size
+
+    os.remove(path)
+    assert stream(tmp_path, cache, ["a.txt"]) == first
+    assert zipfile.ZipFile(io.BytesIO(first)).testzip() is None
+
+
+def test_stored_files_are_not_cached(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ContentCache(str(directory), admit_after=1)
+    write_file(tmp_path / "a.txt", b"some text\n" * 10000)
+    files = [LocalFile(file_path=str(tmp_path / "a.txt"), name="a.txt", compression_method=consts.NO_COMPRESSION)]
+    b"".join(ZipFly(files, content_cache=cache).stream())
+    assert cache_files(directory) == []
@@ -0,0 +1,30 @@
+from zipFly import ZipFly, GenFile, consts
+
+
+def make_files(size=100):
+    return [GenFile(name="a.txt", generator=(chunk for chunk in [b"x" * size]), size=size, modification_time=1700000000),
+            GenFile(name="b.txt", generator=(chunk for chunk in [b"y" * size]), size=size)]
+
+
+def test_same_files_same_bytes_and_etag():
+    first, second = ZipFly(make_files(), deterministic=True), ZipFly(make_files(), deterministic=True)
+    assert first.etag() == second.etag()
+    assert b"".join(first.stream()) == b"".join(second.stream())
+    assert first.last_modified() == 1700000000
+
+
+def test_etag_changes_with_files():
+    assert ZipFly(make_files(), deterministic=True).etag() != ZipFly(make_files(101), deterministic=True).etag()
+
+
+def test_etag_of_auto_files_is_the_same_after_streaming():
+    def auto_files():
+        return [GenFile(name="a.txt", generator=(chunk for chunk in [b"x" * 10000]), size=10000, compression_method=consts.COMPRESSION_AUTO),
+                GenFile(name="b.jpg", generator=(chunk for chunk in [b"y" * 10000]), size=10000, compression_method=consts.COMPRESSION_AUTO)]
+
+    zip_fly = ZipFly(auto_files(), deterministic=True)
+    before = zip_fly.etag()
+    data = b"".join(zip_fly.stream())
+    assert {file.compression_method for file in zip_fly.files} == {consts.NO_COMPRESSION, consts.COMPRESSION_DEFLATE}
+    assert zip_fly.etag() == before == ZipFly(auto_files(), deterministic=True).etag()
+    assert b"".join(ZipFly(auto_files(), deterministic=True).stream()) == data
@@ -0,0 +1,68 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, LocalFile
+
+TREE = {
+    "a.txt": b"a",
+    "b.log": b"b",
+    "docs/readme.md": b"readme",
+    "docs/notes.txt": b"notes",
+    "build/out.o": b"object",
+    "build/deep/x.txt": b"x",
+    "src/main.py": b"main",
+}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    for name, data in TREE.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return root
+
+
+def names(directory, **kwargs):
+    return [file.name for file in LocalFile.from_directory(str(directory), **kwargs)]
+
+
+def test_all_files_sorted(tree):
+    # files of a directory come before its subdirectories
+    assert names(tree) == ["a.txt", "b.log", "build/out.o", "build/deep/x.txt", "docs/notes.txt", "docs/readme.md", "src/main.py"]
+    assert names(tree, stat_workers=4) == names(tree)
+
+
+def test_include_exclude_and_prefix(tree):
+    assert names(tree, include=["*.txt"]) == ["a.txt", "build/deep/x.txt", "docs/notes.txt"]
+    assert names(tree, exclude=["build"]) == ["a.txt", "b.log", "docs/notes.txt", "docs/readme.md", "src/main.py"]
+    assert names(tree, include=["*.txt", "*.md"], exclude=["docs/n*"]) == ["a.txt", "build/deep/x.txt", "docs/readme.md"]
+    assert names(tree, prefix="archive/", include=["src/*"]) == ["archive/src/main.py"]
+
+
+def test_from_tree_round_trip(tree):
+    data = b"".join(ZipFly.from_tree(str(tree), prefix="p/", exclude=["*.log"]).stream())
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert {info.filename: archive.read(info) for info in archive.infolist()} == {f"p/{name}": data for name, data in TREE.items() if name != "b.log"}
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_symlinks(tree):
+    os.symlink(str(tree / "docs"), str(tree / "link"))
+    os.symlink(str(tree), str(tree / "docs" / "loop"))  # a cycle back to the root
+    os.symlink(str(tree / "a.txt"), str(tree / "src" / "a_link.txt"))
+
+    # not followed: links to directories are skipped, links to files too (they aren't regular files without following)
+    assert names(tree) == names(tree, exclude=["link"])
+    assert "src/a_link.txt" not in names(tree)
+
+    followed = names(tree, follow_symlinks=True)
+    assert len(followed) == len(set(followed))
+    assert "src/a_link.txt" in followed
+    # docs is walked once, through whichever path comes first
+    assert sum(name.endswith("readme.md") for name in followed) == 1
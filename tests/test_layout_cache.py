@@ -0,0 +1,38 @@
+import io
+import zipfile
+
+from zipFly import ZipFly, LocalFile, LayoutCache
+
+
+def make_files(path):
+    return [LocalFile(file_path=str(path), name="same.txt") for _ in range(5)]
+
+
+def test_duplicate_names_on_hit_and_miss(tmp_path):
+    path = tmp_path / "same.txt"
+    path.write_bytes(b"same content " * 1000)
+    layouts = LayoutCache()
+
+    miss = ZipFly(make_files(path), layout_cache=layouts, deterministic=True)
+    miss_etag = miss.etag()
+    miss_bytes = b"".join(miss.stream())
+    assert layouts.size > 0
+
+    hit = ZipFly(make_files(path), layout_cache=layouts, deterministic=True)
+    assert hit._layout is not None
+    assert hit.etag() == miss_etag
+    assert b"".join(hit.stream()) == miss_bytes
+
+    names = ["same.txt", "same (1).txt", "same (2).txt", "same (3).txt", "same (4).txt"]
+    archive = zipfile.ZipFile(io.BytesIO(miss_bytes))
+    assert archive.namelist() == names
+    assert archive.testzip() is None
+
+    # paths that build headers from file names
+    hit = ZipFly(make_files(path), layout_cache=layouts, deterministic=True)
+    output = io.BytesIO()
+    hit.stream_to(output)
+    assert zipfile.ZipFile(output).namelist() == names
+
+    hit = ZipFly(make_files(path), layout_cache=layouts, deterministic=True)
+    assert hit.calculate_archive_size() == len(miss_bytes)
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, consts
+
+NAMES = ["a.txt", "dir/b.txt", "a.txt", "a.txt"]
+
+
+def make_file(i, name, asynchronous=False):
+    chunks = [f"{i} {name} ".encode() * 1000] * 3
+
+    async def async_chunks():
+        for chunk in chunks:
+            yield chunk
+
+    return GenFile(name=name, generator=async_chunks() if asynchronous else (chunk for chunk in chunks), modification_time=1700000000,
+                   compression_method=consts.COMPRESSION_DEFLATE if i % 2 else consts.NO_COMPRESSION)
+
+
+def manifest():
+    for i, name in enumerate(NAMES):
+        yield make_file(i, name)
+
+
+async def async_manifest():
+    for i, name in enumerate(NAMES):
+        yield make_file(i, name, asynchronous=True)
+
+
+@pytest.fixture
+def expected():
+    return b"".join(ZipFly([make_file(i, name) for i, name in enumerate(NAMES)]).stream())
+
+
+def test_generator_manifest(expected):
+    assert b"".join(ZipFly(manifest()).stream()) == expected
+    archive = zipfile.ZipFile(io.BytesIO(expected))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["a.txt", "dir/b.txt", "a (1).txt", "a (2).txt"]
+
+
+def test_async_generator_manifest(expected):
+    async def stream(files):
+        return b"".join([chunk async for chunk in ZipFly(files).async_stream()])
+
+    assert asyncio.run(stream(async_manifest())) == expected
+    # a sync manifest works with async_stream() too
+    assert asyncio.run(stream(make_file(i, name, asynchronous=True) for i, name in enumerate(NAMES))) == expected
+
+
+def test_async_manifest_needs_async_stream():
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(async_manifest()).stream())
+
+
+@pytest.mark.parametrize("make_manifest", [manifest, async_manifest])
+def test_whole_archive_features_need_a_list(make_manifest):
+    with pytest.raises(ValueError):
+        ZipFly(make_manifest()).calculate_archive_size()
+    with pytest.raises(ValueError):
+        ZipFly(make_manifest(), deterministic=True).etag()
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(make_manifest()).stream_range(0, 10))
@@ -0,0 +1,131 @@
+import io
+import multiprocessing
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, MemoryMetadataCache, SqliteMetadataCache, consts
+
+
+def write_files(tmp_path):
+    contents = {"a.txt": b"some text\n" * 10000, "b.bin": os.urandom(5000), "c.txt": b""}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    return contents
+
+
+def make_files(tmp_path, contents):
+    return [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.COMPRESSION_DEFLATE) for name in contents]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make_cache(max_entries=1000):
+        if request.param == "memory":
+            cache = MemoryMetadataCache(max_entries=max_entries)
+        else:
+            cache = SqliteMetadataCache(str(tmp_path / "cache.db"), max_entries=max_entries)
+        caches.append(cache)
+        return cache
+
+    yield make_cache
+    for cache in caches:
+        if isinstance(cache, SqliteMetadataCache):
+            cache.close()
+
+
+def test_hit_gives_exact_size_and_no_data_descriptors(tmp_path, make_cache):
+    contents = write_files(tmp_path)
+    cache = make_cache()
+    first = b"".join(ZipFly(make_files(tmp_path, contents), metadata_cache=cache).stream())
+    assert len(cache) == len(contents)
+
+    zip_fly = ZipFly(make_files(tmp_path, contents), metadata_cache=cache)
+    size = zip_fly.calculate_archive_size()
+    second = b"".join(zip_fly.stream())
+    assert size == len(second) < len(first)
+
+    archive = zipfile.ZipFile(io.BytesIO(second))
+    assert archive.testzip() is None
+    assert {info.filename: archive.read(info) for info in archive.infolist()} == contents
+    for info in archive.infolist():
+        assert not info.flag_bits & consts.DATA_DESCRIPTOR_FLAG
+        header = consts.LOCAL_FILE_HEADER_TUPLE(*consts.LOCAL_FILE_HEADER_STRUCT.unpack_from(second, info.header_offset))
+        assert (header.crc, header.compressed_size, header.uncompressed_size) == (info.CRC, info.compress_size, info.file_size)
+
+
+def test_changed_file_misses(tmp_path, make_cache):
+    contents = write_files(tmp_path)
+    cache = make_cache()
+    b"".join(ZipFly(make_files(tmp_path, contents), metadata_cache=cache).stream())
+    (tmp_path / "a.txt").write_bytes(b"changed")
+    contents["a.txt"] = b"changed"
+    data = b"".join(ZipFly(make_files(tmp_path, contents), metadata_cache=cache).stream())
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.read("a.txt") == b"changed"
+    assert archive.getinfo("a.txt").flag_bits & consts.DATA_DESCRIPTOR_FLAG
+
+
+def test_least_recently_used_is_evicted(make_cache):
+    cache = make_cache(max_entries=3)
+    for i in range(3):
+        cache.set(("key", i), i, i * 10)
+    assert cache.get(("key", 0)) == (0, 0)
+    cache.set(("key", 1), 100, 1000)  # replacing doesn't add an entry
+    cache.set(("key", 3), 3, 30)
+    assert len(cache) == 3
+    assert cache.get(("key", 2)) is None
+    assert cache.get(("key", 0)) == (0, 0) and cache.get(("key", 1)) == (100, 1000) and cache.get(("key", 3)) == (3, 30)
+    cache.delete(("key", 3))
+    cache.delete(("key", 3))
+    assert len(cache) == 2
+
+
+def test_sqlite_cache_shared_by_connections(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SqliteMetadataCache(path, max_entries=3), SqliteMetadataCache(path, max_entries=3)
+    try:
+        first.set(("key", 0), 0, 0)
+        second.set(("key", 1), 1, 1)
+        first.set(("key", 2), 2, 2)
+        assert second.get(("key", 0)) == (0, 0)  # recency seen by the other connection
+        first.set(("key", 3), 3, 3)
+        assert len(first) == len(second) == 3
+        assert first.get(("key", 1)) is None
+        assert second.get(("key", 2)) == (2, 2)
+    finally:
+        first.close()
+        second.close()
+
+
+def _fill(path, worker, count, max_entries):
+    cache = SqliteMetadataCache(path, max_entries=max_entries)
+    try:
+        for i in range(count):
+            cache.set(("key", worker, i), i, i)
+    finally:
+        cache.close()
+
+
+def test_sqlite_cache_shared_by_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SqliteMetadataCache(path).close()
+    processes = [multiprocessing.Process(target=_fill, args=(path, worker, 200, 500)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = SqliteMetadataCache(path, max_entries=500)
+    try:
+        assert len(cache) == 500
+    finally:
+        cache.close()
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0] == 500
+    connection.close()
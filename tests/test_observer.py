@@ -0,0 +1,35 @@
+import io
+
+from zipFly import ZipFly, GenFile, Observer, consts
+
+
+class Recorder(Observer):
+    def __init__(self):
+        self.entries = []
+        self.archive = None
+
+    def entry_end(self, file, stats):
+        self.entries.append(stats)
+
+    def archive_end(self, stats):
+        self.archive = stats
+
+
+def make_files():
+    return [GenFile(name=f"{i}.txt", generator=(chunk for chunk in [b"data " * 1000] * 5), compression_method=consts.COMPRESSION_DEFLATE)
+            for i in range(3)]
+
+
+def test_stats_from_stream_and_stream_to():
+    streamed = Recorder()
+    data = b"".join(ZipFly(make_files(), observer=streamed).stream())
+    written = Recorder()
+    ZipFly(make_files(), observer=written).stream_to(io.BytesIO(), seekable=False)
+
+    for recorder in (streamed, written):
+        assert [stats.name for stats in recorder.entries] == ["0.txt", "1.txt", "2.txt"]
+        for stats in recorder.entries:
+            assert stats.bytes_in == 25000 and stats.consumer_time >= 0
+            assert stats.source_time + stats.compress_time + stats.consumer_time <= stats.elapsed + 1e-3
+        assert recorder.archive.entries == 3
+        assert recorder.archive.bytes_out == len(data)
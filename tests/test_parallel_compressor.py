@@ -0,0 +1,79 @@
+import io
+import threading
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, CompressionPolicy, consts
+from zipFly.ParallelCompressor import ParallelCompressor
+
+CHUNK_SIZE = 10000
+
+
+def make_files(count=8):
+    # sizes go up and down, so files finish out of order
+    return [GenFile(name=f"{i}.txt", generator=(chunk for chunk in [f"file {i} ".encode() * 1250] * (1 + (i * 7) % 5)),
+                    modification_time=1700000000,
+                    compression_method=consts.COMPRESSION_DEFLATE if i % 3 else consts.NO_COMPRESSION)
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4, 16])
+def test_same_bytes_as_without_workers(workers):
+    expected = b"".join(ZipFly(make_files()).stream())
+    assert b"".join(ZipFly(make_files()).stream(workers=None)) == expected
+    data = b"".join(ZipFly(make_files()).stream(workers=workers, max_buffer_size=3 * CHUNK_SIZE))
+    assert data == expected
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.namelist() == [f"{i}.txt" for i in range(8)]
+
+
+def stored_files(count, chunks):
+    def generator(i):
+        for _ in range(chunks):
+            yield bytes([i]) * CHUNK_SIZE
+
+    return [GenFile(name=f"{i}.bin", generator=generator(i), compression_method=consts.NO_COMPRESSION) for i in range(count)]
+
+
+def test_files_in_order_and_buffer_capped():
+    workers, max_buffer_size = 3, 4 * CHUNK_SIZE
+    compressor = ParallelCompressor(stored_files(6, 10), workers, max_buffer_size, CompressionPolicy())
+    names, most_buffered = [], 0
+    for file, data in compressor.stream():
+        names.append(file.name)
+        for chunk in data:
+            assert chunk == bytes([int(file.name[0])]) * CHUNK_SIZE
+            most_buffered = max(most_buffered, compressor._buffered)
+        assert file.original_size == 10 * CHUNK_SIZE
+    assert names == [f"{i}.bin" for i in range(6)]
+    # every file with an empty buffer may put one chunk over the cap
+    assert max_buffer_size <= most_buffered + CHUNK_SIZE
+    assert most_buffered <= max_buffer_size + workers * CHUNK_SIZE
+
+
+def test_error_of_a_source_is_raised():
+    def failing():
+        yield b"data" * 1000
+        raise OSError("source is gone")
+
+    files = make_files(4) + [GenFile(name="broken.txt", generator=failing(), compression_method=consts.COMPRESSION_DEFLATE)] + make_files(4)
+    threads = threading.active_count()
+    with pytest.raises(OSError, match="source is gone"):
+        b"".join(ZipFly(files).stream(workers=3))
+    assert threading.active_count() == threads
+
+
+def test_abandoned_stream_stops_workers():
+    threads = threading.active_count()
+    stream = ZipFly(stored_files(6, 100)).stream(workers=3, max_buffer_size=CHUNK_SIZE)
+    next(stream)
+    next(stream)
+    stream.close()
+    assert threading.active_count() == threads
+
+
+def test_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        ParallelCompressor([], 0, CHUNK_SIZE, CompressionPolicy())
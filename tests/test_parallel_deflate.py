@@ -0,0 +1,37 @@
+import io
+import os
+import threading
+import zipfile
+import zlib
+
+from zipFly import ZipFly, GenFile, consts
+from zipFly.Compressor import Compressor, crc32_combine
+
+
+def test_crc32_combine_matches_zlib():
+    for first_size, second_size in [(0, 0), (1, 1), (1000, 0), (4096, 77), (100, Compressor.parallel_block_size)]:
+        first, second = os.urandom(first_size), os.urandom(second_size)
+        assert crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)) == zlib.crc32(first + second)
+
+
+def test_parallel_deflate_round_trip():
+    data = os.urandom(1000) * 5000 + os.urandom(12345)  # a few full blocks and a short last one
+    file = GenFile(name="big.bin", generator=(data[i:i + 100000] for i in range(0, len(data), 100000)),
+                   compression_method=consts.COMPRESSION_DEFLATE, compression_workers=4)
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(ZipFly([file]).stream())))
+    assert archive.testzip() is None
+    assert archive.read("big.bin") == data
+
+
+def test_abandoned_parallel_deflate_stops_its_threads():
+    before = set(threading.enumerate())
+    block = os.urandom(1000) * (Compressor.parallel_block_size // 1000)
+    # many more blocks than are compressed at once, so the first ones are given out long before the tail
+    file = GenFile(name="big.bin", generator=(block for _ in range(100)), compression_method=consts.COMPRESSION_DEFLATE, compression_workers=4)
+    stream = ZipFly([file]).stream()
+    next(stream)
+    next(stream)  # the first compressed blocks
+    workers = set(threading.enumerate()) - before
+    assert workers
+    stream.close()
+    assert not any(thread.is_alive() for thread in workers)
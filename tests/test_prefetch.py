@@ -0,0 +1,117 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, CompressionPolicy, consts
+from zipFly.AsyncPrefetcher import AsyncPrefetcher
+
+CHUNK_SIZE = 10000
+
+
+class Sources:
+    """
+    Async sources that take longer for earlier files, so later files are fetched first. Counts sources open at once.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.most_open = 0
+
+    async def chunks(self, i, count):
+        self.open += 1
+        self.most_open = max(self.most_open, self.open)
+        try:
+            for _ in range(count):
+                await asyncio.sleep(0.001 * (8 - i))
+                yield bytes([i]) * CHUNK_SIZE
+        finally:
+            self.open -= 1
+
+    def files(self, count=8, chunks=10, method=consts.NO_COMPRESSION):
+        return [GenFile(name=f"{i}.bin", generator=self.chunks(i, chunks), modification_time=1700000000, compression_method=method)
+                for i in range(count)]
+
+
+async def async_list(files):
+    for file in files:
+        yield file
+
+
+@pytest.mark.parametrize("prefetch", [1, 3, 16])
+def test_same_bytes_as_without_prefetch(prefetch):
+    async def stream(prefetch):
+        files = Sources().files(method=consts.COMPRESSION_DEFLATE)
+        return b"".join([chunk async for chunk in ZipFly(files).async_stream(prefetch=prefetch, max_buffer_size=3 * CHUNK_SIZE)])
+
+    expected = asyncio.run(stream(0))
+    assert asyncio.run(stream(prefetch)) == expected
+    archive = zipfile.ZipFile(io.BytesIO(expected))
+    assert archive.testzip() is None
+    assert archive.namelist() == [f"{i}.bin" for i in range(8)]
+
+
+def test_files_in_order_and_buffer_capped():
+    lookahead, max_buffer_size = 2, 4 * CHUNK_SIZE
+    sources = Sources()
+
+    async def run():
+        prefetcher = AsyncPrefetcher(async_list(sources.files()), lookahead, max_buffer_size, CompressionPolicy())
+        names, most_buffered = [], 0
+        async for file, data in prefetcher.stream():
+            names.append(file.name)
+            async for chunk in data:
+                assert chunk == bytes([int(file.name[0])]) * CHUNK_SIZE
+                most_buffered = max(most_buffered, prefetcher._buffered)
+        return names, most_buffered
+
+    names, most_buffered = asyncio.run(run())
+    assert names == [f"{i}.bin" for i in range(8)]
+    assert max_buffer_size <= most_buffered + CHUNK_SIZE
+    # every file with an empty buffer may put one chunk over the cap
+    assert most_buffered <= max_buffer_size + (lookahead + 1) * CHUNK_SIZE
+    assert sources.most_open == lookahead + 1
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_errors_of_sources_are_raised():
+    async def failing(error):
+        yield b"data" * 1000
+        raise error
+
+    async def stream(error):
+        files = Sources().files(4) + [GenFile(name="broken.txt", generator=failing(error))] + Sources().files(4)
+        return b"".join([chunk async for chunk in ZipFly(files).async_stream(prefetch=3)])
+
+    with pytest.raises(OSError):
+        asyncio.run(stream(OSError("source is gone")))
+    # not only Exception subclasses, the archive would be cut short otherwise
+    with pytest.raises(Stop):
+        asyncio.run(stream(Stop()))
+
+
+def test_cancelled_stream_cancels_prefetching():
+    sources = Sources()
+
+    async def run():
+        received = []
+
+        async def consume():
+            async for chunk in ZipFly(sources.files(chunks=100)).async_stream(prefetch=3):
+                received.append(chunk)
+
+        task = asyncio.ensure_future(consume())
+        while len(received) < 5:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        return [other for other in asyncio.all_tasks() if other is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+    assert sources.open == 0
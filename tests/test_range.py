@@ -0,0 +1,130 @@
+import asyncio
+import io
+import os
+import random
+import zipfile
+import zlib
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, GenFile, consts
+from zipFly.CentralDirectory import CentralDirectory
+
+GENERATED = {"gen/zażółć.txt": [b"generated " * 300] * 7, "gen/日本語.txt": [os.urandom(5000), os.urandom(3)]}
+
+
+def write_files(tmp_path):
+    contents = {"a.bin": os.urandom(20000), "empty.txt": b"", "ünïcödé.bin": os.urandom(777)}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    return contents
+
+
+def make_files(tmp_path, contents, asynchronous=False):
+    def generator(chunks):
+        if asynchronous:
+            async def async_chunks():
+                for chunk in chunks:
+                    yield chunk
+            return async_chunks()
+        return (chunk for chunk in chunks)
+
+    files = [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.NO_COMPRESSION) for name in contents]
+    files += [GenFile(name=name, generator=generator(chunks), size=sum(map(len, chunks)), modification_time=1700000000,
+                      compression_method=consts.NO_COMPRESSION) for name, chunks in GENERATED.items()]
+    return files
+
+
+def all_crcs(contents):
+    crcs = {name: zlib.crc32(data) for name, data in contents.items()}
+    crcs.update({name: zlib.crc32(b"".join(chunks)) for name, chunks in GENERATED.items()})
+    return crcs
+
+
+def random_ranges(size, count=40):
+    rng = random.Random(size)
+    ranges = [(0, None), (0, size - 1), (size - 1, None), (0, 0), (size - 22, size + 100)]
+    for _ in range(count):
+        start = rng.randrange(size)
+        ranges.append((start, min(size - 1, start + rng.choice([0, 1, 29, 30, 100, 5000, size]))))
+    return ranges
+
+
+@pytest.mark.parametrize("with_crcs", [False, True])
+def test_ranges_match_the_archive(tmp_path, with_crcs):
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+    assert zipfile.ZipFile(io.BytesIO(full)).testzip() is None
+    crcs = all_crcs(contents) if with_crcs else None
+
+    for start, end in random_ranges(len(full)):
+        data = b"".join(ZipFly(make_files(tmp_path, contents)).stream_range(start, end, crcs=crcs))
+        assert data == full[start:None if end is None else end + 1], (start, end)
+
+
+def test_async_ranges_match_the_archive(tmp_path):
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+
+    async def stream_range(start, end, crcs):
+        zip_fly = ZipFly(make_files(tmp_path, contents, asynchronous=True))
+        return b"".join([chunk async for chunk in zip_fly.async_stream_range(start, end, crcs=crcs)])
+
+    for crcs in (None, all_crcs(contents)):
+        for start, end in random_ranges(len(full), count=15):
+            assert asyncio.run(stream_range(start, end, crcs)) == full[start:None if end is None else end + 1], (start, end)
+
+
+def test_empty_archive():
+    full = b"".join(ZipFly([]).stream())
+    assert b"".join(ZipFly([]).stream_range(0)) == full
+    assert b"".join(ZipFly([]).stream_range(5, 10)) == full[5:11]
+
+
+def test_invalid_ranges(tmp_path):
+    contents = write_files(tmp_path)
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(make_files(tmp_path, contents)).stream_range(-1))
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(make_files(tmp_path, contents)).stream_range(10, 5))
+    deflated = [GenFile(name="a.txt", generator=(chunk for chunk in [b"a"]), size=1, compression_method=consts.COMPRESSION_DEFLATE)]
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(deflated).stream_range(0))
+
+
+def test_zip64_offsets():
+    # the first file only pretends to be 5 GiB, its data and CRC are never needed for ranges after it
+    big_size = 5 * 1024 ** 3
+
+    def make_big_files():
+        def never():
+            raise AssertionError("data of the big file was read")
+            yield b""
+
+        return [GenFile(name="big.bin", generator=never(), size=big_size, compression_method=consts.NO_COMPRESSION),
+                GenFile(name="small.txt", generator=(chunk for chunk in [b"small"]), size=5, compression_method=consts.NO_COMPRESSION)]
+
+    crcs = {"big.bin": 1234}
+    zip_fly = ZipFly(make_big_files())
+    size = zip_fly.calculate_archive_size()
+    small_offset = consts.LOCAL_FILE_HEADER_STRUCT.size + len(b"big.bin") + consts.ZIP64_LOCAL_EXTRA_FIELD_STRUCT.size \
+        + big_size + consts.ZIP64_DATA_DESCRIPTOR_STRUCT.size
+    tail = b"".join(ZipFly(make_big_files()).stream_range(small_offset, crcs=crcs))
+    assert len(tail) == size - small_offset
+    assert tail.startswith(consts.LOCAL_FILE_HEADER_SIGNATURE)
+
+    # parts of the tail are the same bytes
+    for start, end in random_ranges(len(tail), count=20):
+        end = len(tail) - 1 if end is None else min(end, len(tail) - 1)
+        assert b"".join(ZipFly(make_big_files()).stream_range(small_offset + start, small_offset + end, crcs=crcs)) == tail[start:end + 1]
+
+    # offsets past 4 GiB in central directory and zip64 end records
+    eocd = consts.END_OF_CENTRAL_DIR_RECORD_TUPLE(*consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.unpack_from(tail, len(tail) - consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.size))
+    assert eocd.offset_of_central_directory == 0xFFFFFFFF
+    assert consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_SIGNATURE in tail
+    cdir_start = tail.index(consts.CENTRAL_DIR_FILE_HEADER_SIGNATURE)
+    entries = CentralDirectory.parse(tail[cdir_start:tail.index(consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_SIGNATURE)])
+    assert [entries.name(i) for i in range(2)] == ["big.bin", "small.txt"]
+    assert list(entries.offsets) == [0, small_offset]
+    assert list(entries.crcs) == [1234, zlib.crc32(b"small")]
+    assert list(entries.uncompressed_sizes) == [big_size, 5]
@@ -0,0 +1,116 @@
+import os
+import time
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, ZipFlyReader, consts
+
+METHODS = {
+    "stored.bin": consts.NO_COMPRESSION,
+    "deflate.txt": consts.COMPRESSION_DEFLATE,
+    "bzip2.txt": consts.COMPRESSION_BZIP2,
+    "lzma.txt": consts.COMPRESSION_LZMA,
+}
+
+
+def write_archive(path):
+    contents = {name: (name.encode() * 50000 if method else os.urandom(300000)) for name, method in METHODS.items()}
+    contents["dir/nested.txt"] = b"nested"
+    contents["empty.txt"] = b""
+    files = [GenFile(name=name, generator=(chunk for chunk in [data]), compression_method=METHODS.get(name, consts.COMPRESSION_DEFLATE))
+             for name, data in contents.items()]
+    path.write_bytes(b"".join(ZipFly(files).stream()))
+    return contents
+
+
+def test_reader_matches_zipfile(tmp_path):
+    path = tmp_path / "archive.zip"
+    contents = write_archive(path)
+    archive_bytes = path.read_bytes()
+    with ZipFlyReader(str(path)) as reader, zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert list(reader.names()) == archive.namelist()
+        assert len(reader) == len(contents)
+        assert "lzma.txt" in reader and "missing.txt" not in reader
+        for info in archive.infolist():
+            assert reader.read(info.filename) == archive.read(info) == contents[info.filename]
+            assert b"".join(reader.stream(info.filename, chunk_size=1000)) == contents[info.filename]
+            start, end = reader.byte_range(info.filename)
+            assert end - start == info.compress_size
+            assert b"".join(reader.stream(info.filename, raw=True)) == archive_bytes[start:end]
+        with pytest.raises(KeyError):
+            reader.read("missing.txt")
+
+
+def test_reader_of_zipfile_archive(tmp_path):
+    path = tmp_path / "archive.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(100):
+            archive.writestr(f"{i:03}.txt", f"file {i}".encode() * 100)
+    with ZipFlyReader(str(path)) as reader:
+        assert len(reader) == 100
+        assert reader.read("042.txt") == b"file 42" * 100
+
+
+def test_corrupted_entry_is_detected(tmp_path):
+    path = tmp_path / "archive.zip"
+    write_archive(path)
+    with ZipFlyReader(str(path)) as reader:
+        start, end = reader.byte_range("stored.bin")
+    data = bytearray(path.read_bytes())
+    data[start] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with ZipFlyReader(str(path)) as reader:
+        with pytest.raises(ValueError):
+            reader.read("stored.bin")
+
+
+def test_index_is_saved_and_loaded(tmp_path):
+    path, index_path = tmp_path / "archive.zip", tmp_path / "archive.zfix"
+    contents = write_archive(path)
+    with ZipFlyReader(str(path), index_path=str(index_path)) as reader:
+        names = list(reader.names())
+    assert index_path.exists()
+    saved = index_path.read_bytes()
+
+    with ZipFlyReader(str(path), index_path=str(index_path)) as reader:
+        assert list(reader.names()) == names
+        assert reader.read("deflate.txt") == contents["deflate.txt"]
+    assert index_path.read_bytes() == saved
+
+    # another archive at the same path, the index is rebuilt
+    time.sleep(0.01)
+    path.write_bytes(b"".join(ZipFly([GenFile(name="other.txt", generator=(chunk for chunk in [b"other"]))]).stream()))
+    with ZipFlyReader(str(path), index_path=str(index_path)) as reader:
+        assert list(reader.names()) == ["other.txt"]
+        assert reader.read("other.txt") == b"other"
+    assert index_path.read_bytes() != saved
+
+    # broken index files are ignored
+    index_path.write_bytes(b"ZFIX broken")
+    with ZipFlyReader(str(path), index_path=str(index_path)) as reader:
+        assert reader.read("other.txt") == b"other"
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_extract(tmp_path, workers):
+    path = tmp_path / "archive.zip"
+    contents = write_archive(path)
+    target = tmp_path / "out"
+    with ZipFlyReader(str(path)) as reader:
+        paths = reader.extract(str(target), workers=workers)
+    assert len(paths) == len(contents)
+    for name, data in contents.items():
+        assert (target / name).read_bytes() == data
+
+
+@pytest.mark.parametrize("name", ["../evil.txt", "/etc/evil.txt", "dir/../../evil.txt"])
+def test_extract_rejects_traversal(tmp_path, name):
+    path = tmp_path / "archive.zip"
+    path.write_bytes(b"".join(ZipFly([GenFile(name=name, generator=(chunk for chunk in [b"evil"]))]).stream()))
+    target = tmp_path / "out"
+    with ZipFlyReader(str(path)) as reader:
+        with pytest.raises(ValueError):
+            reader.extract(str(target))
+    assert not (tmp_path / "evil.txt").exists() and not target.exists()
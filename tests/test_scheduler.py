@@ -0,0 +1,96 @@
+import asyncio
+import io
+import threading
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, GenFile, CompressionScheduler, consts
+
+METHODS = [consts.COMPRESSION_DEFLATE, consts.COMPRESSION_BZIP2, consts.COMPRESSION_LZMA, consts.NO_COMPRESSION]
+
+
+def chunks(i):
+    return [f"file {i} chunk {j} ".encode() * 2000 for j in range(8)]
+
+
+async def async_chunks(i):
+    for chunk in chunks(i):
+        yield chunk
+
+
+def make_files(asynchronous=False):
+    return [GenFile(name=f"{i}.txt", generator=async_chunks(i) if asynchronous else (chunk for chunk in chunks(i)),
+                    modification_time=1700000000, compression_method=METHODS[i % len(METHODS)])
+            for i in range(8)]
+
+
+@pytest.fixture
+def expected():
+    data = b"".join(ZipFly(make_files()).stream())
+    assert zipfile.ZipFile(io.BytesIO(data)).testzip() is None
+    return data
+
+
+def test_same_bytes_with_scheduler(expected):
+    with CompressionScheduler(workers=2, depth=2) as scheduler:
+        assert b"".join(ZipFly(make_files(), scheduler=scheduler).stream()) == expected
+        assert b"".join(ZipFly(make_files(), scheduler=scheduler, priority=consts.PRIORITY_LOW).stream(workers=2)) == expected
+        assert scheduler.buffered == 0
+
+
+def test_concurrent_archives(expected):
+    results = []
+    with CompressionScheduler(workers=3, max_buffer_size=100000) as scheduler:
+        def stream(priority):
+            results.append(b"".join(ZipFly(make_files(), scheduler=scheduler, priority=priority).stream()))
+
+        threads = [threading.Thread(target=stream, args=(consts.PRIORITIES[i % len(consts.PRIORITIES)],)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert scheduler.buffered == 0
+    assert results == [expected] * 6
+
+
+def test_async_with_scheduler(expected):
+    async def stream(scheduler):
+        return b"".join([chunk async for chunk in ZipFly(make_files(asynchronous=True), scheduler=scheduler).async_stream()])
+
+    async def main(scheduler):
+        return await asyncio.gather(*[stream(scheduler) for _ in range(3)])
+
+    with CompressionScheduler(workers=2) as scheduler:
+        assert asyncio.run(main(scheduler)) == [expected] * 3
+        assert scheduler.buffered == 0
+
+
+def test_abandoned_and_failed_streams_release_buffer():
+    with CompressionScheduler(workers=2) as scheduler:
+        stream = ZipFly(make_files(), scheduler=scheduler).stream()
+        next(stream)
+        next(stream)
+        stream.close()
+
+        def failing():
+            yield b"data" * 10000
+            raise OSError("source is gone")
+
+        files = make_files() + [GenFile(name="broken.txt", generator=failing(), compression_method=consts.COMPRESSION_DEFLATE)]
+        with pytest.raises(OSError):
+            b"".join(ZipFly(files, scheduler=scheduler).stream())
+
+    # close() waits for running jobs, their bytes are released by then
+    assert scheduler.buffered == 0
+
+
+def test_scheduler_arguments():
+    with pytest.raises(ValueError):
+        CompressionScheduler(depth=0)
+    scheduler = CompressionScheduler(workers=1)
+    with pytest.raises(ValueError):
+        scheduler.lane(priority=42)
+    scheduler.close()
+    with pytest.raises(ValueError):
+        b"".join(ZipFly(make_files(), scheduler=scheduler).stream())
@@ -0,0 +1,78 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, GenFile, consts
+
+
+def write_files(tmp_path):
+    contents = {
+        "big.bin": os.urandom(ZipFly.SENDFILE_MIN_SIZE + 1000),
+        "small.bin": os.urandom(100),
+        "text.txt": b"some text\n" * 5000,
+        "empty.txt": b"",
+    }
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    contents["gen.txt"] = b"generated " * 1000
+    return contents
+
+
+def make_files(tmp_path):
+    return [
+        LocalFile(file_path=str(tmp_path / "big.bin"), name="big.bin"),
+        LocalFile(file_path=str(tmp_path / "small.bin"), name="small.bin"),
+        LocalFile(file_path=str(tmp_path / "text.txt"), name="text.txt", compression_method=consts.COMPRESSION_DEFLATE),
+        LocalFile(file_path=str(tmp_path / "empty.txt"), name="empty.txt", compression_method=consts.COMPRESSION_DEFLATE),
+        GenFile(name="gen.txt", generator=(chunk for chunk in [b"generated "] * 1000), compression_method=consts.COMPRESSION_DEFLATE),
+    ]
+
+
+def local_crc_and_sizes(data, offset):
+    """
+    crc and sizes from a local file header, sizes from its zip64 extra field when they are 0xFFFFFFFF there.
+    """
+    header = consts.LOCAL_FILE_HEADER_TUPLE(*consts.LOCAL_FILE_HEADER_STRUCT.unpack_from(data, offset))
+    crc, compressed_size, size = header.crc, header.compressed_size, header.uncompressed_size
+    if size == 0xFFFFFFFF:
+        extra = offset + consts.LOCAL_FILE_HEADER_STRUCT.size + header.file_name_len
+        assert data[extra:extra + 2] == b"\x01\x00"
+        size = int.from_bytes(data[extra + 4:extra + 12], "little")
+        compressed_size = int.from_bytes(data[extra + 12:extra + 20], "little")
+    return crc, compressed_size, size
+
+
+@pytest.mark.parametrize("to_fd", [True, False])
+def test_seekable_layout_round_trip(tmp_path, to_fd):
+    contents = write_files(tmp_path)
+    streamed = b"".join(ZipFly(make_files(tmp_path)).stream())
+
+    if to_fd:
+        path = tmp_path / "out.zip"
+        with open(path, "wb") as out:
+            written = ZipFly(make_files(tmp_path)).stream_to(out, batch_size=4096)
+        data = path.read_bytes()
+    else:
+        out = io.BytesIO()
+        written = ZipFly(make_files(tmp_path)).stream_to(out, batch_size=4096)
+        data = out.getvalue()
+
+    assert written == len(data)
+    assert len(data) < len(streamed)  # no data descriptors
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert {info.filename: archive.read(info) for info in archive.infolist()} == contents
+    for info in archive.infolist():
+        assert not info.flag_bits & consts.DATA_DESCRIPTOR_FLAG
+        assert local_crc_and_sizes(data, info.header_offset) == (info.CRC, info.compress_size, info.file_size)
+
+
+def test_seekable_layout_after_existing_data(tmp_path):
+    write_files(tmp_path)
+    out = io.BytesIO()
+    out.write(b"prefix")
+    ZipFly(make_files(tmp_path)).stream_to(out)
+    archive = zipfile.ZipFile(io.BytesIO(out.getvalue()[len(b"prefix"):]))
+    assert archive.testzip() is None
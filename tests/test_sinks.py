@@ -0,0 +1,42 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, GenFile, consts
+
+
+def write_files(tmp_path):
+    (tmp_path / "big.bin").write_bytes(os.urandom(ZipFly.SENDFILE_MIN_SIZE + 1000))  # goes through os.sendfile
+    (tmp_path / "text.txt").write_bytes(b"some text\n" * 5000)
+
+
+def make_files(tmp_path):
+    big, text = tmp_path / "big.bin", tmp_path / "text.txt"
+    return [
+        LocalFile(file_path=str(big), name="big.bin"),
+        LocalFile(file_path=str(text), name="text.txt", compression_method=consts.COMPRESSION_DEFLATE),
+        GenFile(name="gen.txt", generator=(chunk for chunk in [b"generated"] * 10), compression_method=consts.COMPRESSION_DEFLATE,
+                modification_time=1700000000),
+    ]
+
+
+@pytest.mark.parametrize("to_fd", [True, False])
+def test_not_seekable_output_is_the_same_as_stream(tmp_path, to_fd):
+    write_files(tmp_path)
+    expected = b"".join(ZipFly(make_files(tmp_path)).stream())
+
+    if to_fd:
+        path = tmp_path / "out.zip"
+        with open(path, "wb") as out:
+            written = ZipFly(make_files(tmp_path)).stream_to(out, seekable=False)
+        data = path.read_bytes()
+    else:
+        out = io.BytesIO()
+        written = ZipFly(make_files(tmp_path)).stream_to(out, seekable=False)
+        data = out.getvalue()
+
+    assert written == len(data)
+    assert data == expected
+    assert zipfile.ZipFile(io.BytesIO(data)).testzip() is None
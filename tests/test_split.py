@@ -0,0 +1,93 @@
+import asyncio
+import io
+import os
+import zipfile
+import zlib
+
+import pytest
+
+from zipFly import ZipFly, LocalFile, consts
+from zipFly.CentralDirectory import CentralDirectory
+
+PART_SIZE = 64 * 1024
+
+
+def write_files(tmp_path):
+    contents = {f"{i}.bin": os.urandom(size) for i, size in enumerate([30000, 100000, 0, 5, 200000, 64 * 1024, 1000])}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    return contents
+
+
+def make_files(tmp_path, contents):
+    return [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.NO_COMPRESSION) for name in contents]
+
+
+def test_single_part_is_the_archive(tmp_path):
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+
+    parts = ZipFly(make_files(tmp_path, contents)).split(len(full) + PART_SIZE, name="single.zip")
+    assert [part.name for part in parts] == ["single.zip"]
+    data = b"".join(parts[0].stream())
+    assert data == full and parts[0].size == len(full)
+    assert zipfile.ZipFile(io.BytesIO(data)).testzip() is None
+
+
+def test_parts_follow_the_archive(tmp_path):
+    contents = write_files(tmp_path)
+    full = b"".join(ZipFly(make_files(tmp_path, contents)).stream())
+    full_directory = CentralDirectory.read(io.BytesIO(full))
+
+    parts = ZipFly(make_files(tmp_path, contents)).split(PART_SIZE)
+    assert len(parts) > 2
+    assert [part.name for part in parts] == [f"archive.z{i:02}" for i in range(1, len(parts))] + ["archive.zip"]
+    datas = [b"".join(part.stream()) for part in parts]
+    assert all(len(data) == part.size <= PART_SIZE for data, part in zip(datas, parts))
+    assert datas[0].startswith(consts.ZIP64_DATA_DESCRIPTOR_SIGNATURE)
+
+    async def async_parts():
+        return [b"".join([chunk async for chunk in part.async_stream()]) for part in parts]
+
+    assert asyncio.run(async_parts()) == datas
+
+    # without the split signature, parts joined together are the archive up to its central directory
+    joined = b"".join(datas)[4:]
+    assert joined[:full_directory.offset] == full[:full_directory.offset]
+
+    # offsets in the split central directory are relative to the disk of the entry
+    disk_starts = [0]
+    for data in datas:
+        disk_starts.append(disk_starts[-1] + len(data))
+    eocd = consts.END_OF_CENTRAL_DIR_RECORD_TUPLE(*consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.unpack_from(datas[-1], len(datas[-1]) - consts.END_OF_CENTRAL_DIR_RECORD_STRUCT.size))
+    assert eocd.number_of_this_disk == len(parts) - 1
+    cdir_start = disk_starts[eocd.number_of_disk_with_start_central_dir] + eocd.offset_of_central_directory
+    entries = CentralDirectory.parse(b"".join(datas)[cdir_start:cdir_start + eocd.central_directory_size])
+
+    expected = full_directory.entries
+    assert len(entries) == len(expected) == len(contents)
+    for i in range(len(entries)):
+        assert entries.name(i) == expected.name(i)
+        assert entries.crcs[i] == expected.crcs[i]
+        assert entries.compressed_sizes[i] == expected.compressed_sizes[i] == entries.uncompressed_sizes[i]
+        offset = disk_starts[entries.disks[i]] + entries.offsets[i] - 4
+        assert offset == expected.offsets[i]
+        # the local file header is whole on its disk
+        assert entries.offsets[i] + consts.LOCAL_FILE_HEADER_STRUCT.size + len(entries.name(i)) <= len(datas[entries.disks[i]])
+
+
+def test_known_crcs_give_the_same_parts(tmp_path):
+    contents = write_files(tmp_path)
+    parts = ZipFly(make_files(tmp_path, contents)).split(PART_SIZE)
+    crcs = {name: zlib.crc32(data) for name, data in contents.items()}
+    with_crcs = ZipFly(make_files(tmp_path, contents)).split(PART_SIZE, crcs=crcs)
+    assert [b"".join(part.stream()) for part in with_crcs] == [b"".join(part.stream()) for part in parts]
+
+
+def test_split_needs_stored_files(tmp_path):
+    contents = write_files(tmp_path)
+    files = [LocalFile(file_path=str(tmp_path / name), name=name, compression_method=consts.COMPRESSION_DEFLATE) for name in contents]
+    with pytest.raises(ValueError):
+        ZipFly(files).split(PART_SIZE)
+    with pytest.raises(ValueError):
+        ZipFly(make_files(tmp_path, contents)).split(consts.SPLIT_MIN_PART_SIZE - 1)
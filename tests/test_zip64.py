@@ -0,0 +1,35 @@
+import io
+import zipfile
+
+from zipFly import ZipFly, GenFile, consts
+from zipFly.CentralDirectory import CentralDirectory
+from zipFly.EntryTable import EntryTable
+
+
+def test_small_archive_has_no_zip64_structures():
+    data = b"".join(ZipFly([GenFile(name="a.txt", generator=(chunk for chunk in [b"hello"]))]).stream())
+    assert consts.ZIP64_END_OF_CENTRAL_DIR_RECORD_SIGNATURE not in data
+    assert consts.ZIP64_EXTRA_FIELD_SIGNATURE + b"\x18\x00" not in data
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.infolist()[0].extract_version < consts.ZIP64_VERSION
+
+
+def test_zip64_extra_field_only_where_values_dont_fit():
+    zip_fly = ZipFly([])
+    entries = EntryTable()
+    entries.append(b"small", 20, consts.DATA_DESCRIPTOR_FLAG, False, consts.COMPRESSION_DEFLATE, 0, 33, 1, 10, 20, 0, 0)
+    entries.append(b"far", 20, consts.DATA_DESCRIPTOR_FLAG, False, consts.COMPRESSION_DEFLATE, 0, 33, 2, 10, 20, 5 * 1024 ** 3, 0)
+    entries.append(b"big", 20, consts.DATA_DESCRIPTOR_FLAG, True, consts.NO_COMPRESSION, 0, 33, 3, 5 * 1024 ** 3, 5 * 1024 ** 3, 100, 0)
+    zip_fly._entries = entries
+    data = zip_fly._make_cdir_file_headers(0, len(entries))
+
+    header_struct = consts.CENTRAL_DIR_FILE_HEADER_STRUCT
+    assert len(data) == 3 * header_struct.size + len(b"smallfarbig") + 2 * consts.ZIP64_EXTRA_FIELD_STRUCT.size
+    first = consts.CENTRAL_DIR_FILE_HEADER_TUPLE(*header_struct.unpack_from(data))
+    assert first.extra_field_len == 0 and first.version_to_extract == 20
+
+    parsed = CentralDirectory.parse(data)
+    for column in ("crcs", "compressed_sizes", "uncompressed_sizes", "offsets"):
+        assert getattr(parsed, column) == getattr(entries, column)
+    assert list(parsed.versions_needed) == [20, consts.ZIP64_VERSION, consts.ZIP64_VERSION]